@@ -0,0 +1,82 @@
+"""
+Tool-slot fairness under mixed load.
+
+One conversation runs a wide plan (40 independent tool calls by default) while
+light conversations arrive one after another, each with a single-task plan,
+all through the real task scheduler with a shared tool scheduler of a few
+slots. The same load runs twice: first come, first served, then weighted fair
+queuing with a per-conversation cap. Prints each mode's queueing delay and plan
+latency for the light conversations and fails if fair queuing does not cut
+their p95 latency. Run with:
+python -m benchmarks.bench_fair_scheduling
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from langchain_core.tools import StructuredTool
+
+import src.executor as executor
+from src.fair_queue import FairToolScheduler, format_report
+
+
+def _tool(seconds: float) -> StructuredTool:
+    def lookup(query: str) -> str:
+        time.sleep(seconds)
+        return f"result for {query}"
+    return StructuredTool.from_function(lookup, name="lookup", description="Slow lookup.")
+
+
+def _plan(tool: StructuredTool, width: int) -> List[Dict]:
+    tasks = [{"idx": i, "tool": tool, "args": {"query": f"q{i}"}, "dependencies": []} for i in range(1, width + 1)]
+    return tasks + [{"idx": width + 1, "tool": "join", "args": {}, "dependencies": list(range(1, width + 1))}]
+
+
+def run_load(scheduler: FairToolScheduler, width: int, light: int, gap: float, seconds: float) -> List[float]:
+    """Latency of each light conversation's plan."""
+    executor.fair_scheduler = scheduler
+    tool = _tool(seconds)
+
+    def run(thread_id: str, plan: List[Dict], delay: float) -> float:
+        time.sleep(delay)
+        start = time.perf_counter()
+        executor.schedule_tasks({"tasks": plan}, {"configurable": {"thread_id": thread_id}})
+        return time.perf_counter() - start
+
+    # The scheduler prints every plan; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=light + 1) as pool:
+        heavy = pool.submit(run, "heavy", _plan(tool, width), 0.0)
+        latencies = list(pool.map(lambda i: run(f"light-{i}", _plan(tool, 1), 0.02 + i * gap), range(light)))
+        heavy.result()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FIFO and fair tool admission under mixed load.")
+    parser.add_argument("--width", type=int, default=40, help="Tasks in the heavy conversation's plan.")
+    parser.add_argument("--light", type=int, default=10, help="Light conversations with one task each.")
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--share", type=float, default=0.5, help="Largest share of slots one conversation may hold.")
+    parser.add_argument("--tool_seconds", type=float, default=0.05)
+    parser.add_argument("--gap", type=float, default=0.03, help="Seconds between light conversations.")
+    args = parser.parse_args()
+
+    p95 = {}
+    for name, fair in (("fifo", False), ("fair", True)):
+        scheduler = FairToolScheduler(args.slots, args.share, fair=fair)
+        latencies = sorted(run_load(scheduler, args.width, args.light, args.gap, args.tool_seconds))
+        p95[name] = latencies[round(0.95 * (len(latencies) - 1))]
+        print(f"\n== {name}: light plans p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95[name] * 1000:.0f} ms")
+        print(format_report(scheduler.report()))
+    if p95["fair"] >= p95["fifo"]:
+        print("\nFair queuing did not reduce the light conversations' p95 latency.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
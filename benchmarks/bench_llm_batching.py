@@ -0,0 +1,102 @@
+"""
+Throughput and latency of micro-batched router/joiner calls.
+
+Simulates many concurrent sessions each making structured LLM calls against an
+offline fake model whose latency is a fixed per-request cost plus a small
+per-item cost, behind a provider limit on concurrent requests. Compares sending
+every call on its own with BatchedStructuredOutput at several batch windows.
+Run with: python -m benchmarks.bench_llm_batching
+"""
+import argparse
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+from langchain_core.messages import get_buffer_string
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+from src.batching import BatchedStructuredOutput
+
+REQUEST_SECONDS = 0.08
+ITEM_SECONDS = 0.004
+
+
+class Route(BaseModel):
+    """Stands in for the router's decision; importing the agent would build the whole graph."""
+    destination: str
+
+
+class FakeStructuredLLM:
+    """Answers any structured-output request after a simulated provider latency."""
+    def __init__(self, concurrency: int):
+        self._slots = threading.Semaphore(concurrency)
+        self.requests = 0
+
+    def with_structured_output(self, schema):
+        def answer(prompt: Any):
+            text = prompt if isinstance(prompt, str) else get_buffer_string(prompt)
+            count = len(re.findall(r"### Request \d+$", text, re.M))
+            with self._slots:
+                self.requests += 1
+                time.sleep(REQUEST_SECONDS + ITEM_SECONDS * max(count, 1))
+            route = Route(destination="planner")
+            return schema(items=[route] * count) if "items" in schema.model_fields else route
+        return RunnableLambda(answer)
+
+
+def _run(sessions: int, calls: int, window_ms: float, max_size: int, concurrency: int) -> dict:
+    llm = FakeStructuredLLM(concurrency)
+    if window_ms > 0:
+        runnable = BatchedStructuredOutput(llm, Route, window_ms / 1000, max_size)
+    else:
+        runnable = llm.with_structured_output(Route)
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def session(i: int) -> None:
+        for j in range(calls):
+            start = time.perf_counter()
+            runnable.invoke(f"The user's query is: 'question {i}.{j}'")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "requests": llm.requests,
+        "mean_batch": len(latencies) / llm.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batching of structured LLM calls.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--calls", type=int, default=5, help="Calls per session.")
+    parser.add_argument("--windows_ms", type=float, nargs="+", default=[0, 2, 5, 10, 20])
+    parser.add_argument("--max_size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4, help="Provider limit on concurrent requests.")
+    args = parser.parse_args()
+
+    print(f"{'sessions':>8} {'window':>7} {'calls/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'requests':>8} {'batch':>6}")
+    for sessions in args.sessions:
+        for window in args.windows_ms:
+            result = _run(sessions, args.calls, window, args.max_size, args.concurrency)
+            label = "off" if window <= 0 else f"{window:g}ms"
+            print(
+                f"{sessions:>8} {label:>7} {result['throughput']:>8.1f} {result['p50']:>7.1f} "
+                f"{result['p95']:>7.1f} {result['requests']:>8} {result['mean_batch']:>6.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Offline check of per-node model tiering and fallback.
+
+Uses the "stub" model provider (src/stub_models.py), whose models answer after
+a simulated latency and fail at a configured rate, to run concurrent calls
+through tiered node models built from a model config file, as the agent does. Scenarios: a flaky
+first tier, a first tier slower than its timeout, and a rate-limited first tier
+with `skip_saturated`. Prints per-tier latency and success stats and fails if
+any call could not be answered by some tier. Run with:
+python -m benchmarks.bench_model_tiering
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+from src.models import ModelStats, create_node_model, format_model_stats, load_model_config
+import src.stub_models  # noqa: F401  Registers the "stub" provider
+
+SCENARIOS = {
+    "flaky": {
+        "router": {"tiers": [{"provider": "stub", "model": "large-flaky"}, {"provider": "stub", "model": "small"}]},
+    },
+    "slow": {
+        "router": {"tiers": [{"provider": "stub", "model": "large-slow", "timeout": 0.2}, {"provider": "stub", "model": "small"}]},
+    },
+    "saturated": {
+        "router": {
+            "tiers": [{"provider": "stub", "model": "large", "requests_per_second": 5}, {"provider": "stub", "model": "small"}],
+            "skip_saturated": True,
+        },
+    },
+}
+
+
+def run_scenario(name: str, calls: int, workers: int) -> Tuple[ModelStats, int, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "models.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(SCENARIOS[name], f)
+        model = create_node_model("router", load_model_config(path))
+    model.stats = stats = ModelStats()
+
+    def call(i: int) -> bool:
+        try:
+            # Half the calls stream, as the planner does
+            if i % 2:
+                return "".join(chunk.content for chunk in model.stream(f"question {i}")).endswith(f"question {i}")
+            return model.invoke(f"question {i}").content.endswith(f"question {i}")
+        except Exception:
+            return False
+
+    start = time.perf_counter()
+    # Each fallback is printed; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=workers) as pool:
+        answered = sum(pool.map(call, range(calls)))
+    return stats, calls - answered, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise model tier fallback with offline stub models.")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append", help="Run only these scenarios.")
+    args = parser.parse_args()
+
+    unanswered = 0
+    for name in args.scenario or SCENARIOS:
+        stats, failed, elapsed = run_scenario(name, args.calls, args.workers)
+        unanswered += failed
+        print(f"\n== {name}: {args.calls} calls in {elapsed:.1f}s, {failed} unanswered")
+        print(format_model_stats(stats.report()))
+    if unanswered:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Throughput of CPU-bound tools on the thread path vs the process pool.
+
+Runs a batch of pure-Python CPU tasks through the executor's tool dispatch with
+an increasing number of pool workers, then compares moving a large array
+argument through shared memory with pickling it. Run with:
+python -m benchmarks.bench_process_pool
+"""
+import asyncio
+import os
+import time
+
+import numpy as np
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, ConfigDict, Field
+
+from src import process_pool
+from src.executor import _invoke_tool
+from src.registry import ToolRegistry, ToolSpec
+
+TASKS = 32
+WORK = 300_000
+ARRAY_ELEMENTS = 4_000_000
+
+
+class _WorkInput(BaseModel):
+    n: int = Field(description="Amount of work.")
+
+
+class _ArrayInput(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    values: np.ndarray = Field(description="Values to reduce.")
+
+
+def _burn(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i % 7
+    return total
+
+
+def cpu_tool() -> StructuredTool:
+    return StructuredTool.from_function(func=_burn, name="burn", description="CPU work.", args_schema=_WorkInput)
+
+
+def array_tool() -> StructuredTool:
+    return StructuredTool.from_function(
+        func=lambda values: float(values.sum()), name="array_sum", description="Sums an array.", args_schema=_ArrayInput
+    )
+
+
+async def _run_batch(tool, args, count: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[_invoke_tool(tool, args) for _ in range(count)])
+    return time.perf_counter() - start
+
+
+def main():
+    registry = ToolRegistry()
+    registry.register(ToolSpec(name="burn", description="CPU work.", target=f"{__name__}:cpu_tool", execution="cpu"))
+    registry.register(ToolSpec(name="array_sum", description="Sums an array.", target=f"{__name__}:array_tool", execution="cpu"))
+    pooled = registry.get("burn")
+    threaded = cpu_tool()
+
+    elapsed = asyncio.run(_run_batch(threaded, {"n": WORK}, TASKS))
+    print(f"{'backend':>14} | {'workers':>7} | {'tasks/s':>8}")
+    print(f"{'threads':>14} | {'-':>7} | {TASKS / elapsed:>8.1f}")
+
+    cores = os.cpu_count() or 1
+    for workers in sorted({1, 2, 4, cores}):
+        if workers > cores:
+            continue
+        process_pool.shutdown_process_pool()
+        os.environ["PROCESS_POOL_WORKERS"] = str(workers)
+        process_pool.get_process_pool()  # Start and warm up outside the timed region
+        elapsed = asyncio.run(_run_batch(pooled, {"n": WORK}, TASKS))
+        print(f"{'process pool':>14} | {workers:>7} | {TASKS / elapsed:>8.1f}")
+
+    values = np.random.default_rng(0).random(ARRAY_ELEMENTS)
+    summed = registry.get("array_sum")
+    for label, threshold in (("shared memory", 1), ("pickled", 1 << 62)):
+        process_pool.SHARED_ARRAY_BYTES = threshold
+        elapsed = asyncio.run(_run_batch(summed, {"values": values}, 8))
+        print(f"{values.nbytes // (1 << 20)} MB array via {label}: {elapsed / 8 * 1000:.1f} ms per task")
+    process_pool.shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    main()
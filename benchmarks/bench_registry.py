@@ -0,0 +1,84 @@
+"""
+Startup and plan-parsing cost as the tool catalog grows.
+
+Compares the eager tool list (every tool built up front, linear name lookup per
+task) with the lazy ToolRegistry. Run with: python -m benchmarks.bench_registry
+"""
+import time
+from typing import List
+
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import BaseModel, Field
+
+from src.output_parser import LLMCompilerPlanParser
+from src.registry import ToolRegistry, ToolSpec
+
+SIZES = [10, 100, 500]
+PLAN_TASKS = 20
+REPEATS = 20
+
+
+class _QueryInput(BaseModel):
+    query: str = Field(description="The query.")
+
+
+def _build_tool(name: str) -> StructuredTool:
+    return StructuredTool.from_function(
+        func=lambda query: query, name=name, description=f"Benchmark tool {name}.", args_schema=_QueryInput
+    )
+
+
+def __getattr__(name: str):
+    # Module attributes 'tool_<i>' act as lazy factories for the registry targets
+    if name.startswith("tool_"):
+        return lambda: _build_tool(name)
+    raise AttributeError(name)
+
+
+def _plan(size: int) -> str:
+    # References the last tools in the catalog, the worst case for a linear lookup
+    lines = ["Thought: benchmark plan"]
+    for i in range(1, PLAN_TASKS + 1):
+        lines.append(f'{i}. tool_{size - 1 - (i % 5)}(query="item {i}")')
+    lines.append(f"{PLAN_TASKS + 1}. join()<END_OF_PLAN>")
+    return "\n".join(lines)
+
+
+def _linear_parse(tools: List[BaseTool], plan: str) -> None:
+    # The previous lookup: rebuild the name list and search it for every task
+    for line in plan.splitlines()[1:-1]:
+        name = line.split(". ", 1)[1].split("(", 1)[0]
+        tools[[tool.name for tool in tools].index(name)]
+
+
+def _timed(fn, repeats: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    print(f"{'tools':>6} | {'eager startup ms':>16} | {'lazy startup ms':>15} | {'linear lookup ms':>16} | {'registry parse ms':>17}")
+    for size in SIZES:
+        names = [f"tool_{i}" for i in range(size)]
+        eager_startup = _timed(lambda: [_build_tool(name) for name in names])
+        tools = [_build_tool(name) for name in names]
+
+        registry = ToolRegistry()
+
+        def register_all():
+            for name in names:
+                registry.register(ToolSpec(name=name, description=f"Benchmark tool {name}.", target=f"{__name__}:{name}"))
+        lazy_startup = _timed(register_all)
+
+        plan = _plan(size)
+        parser = LLMCompilerPlanParser(registry=registry)
+        parser.parse(plan)  # First use builds the few tools the plan references
+        linear = _timed(lambda: _linear_parse(tools, plan), REPEATS)
+        parse = _timed(lambda: parser.parse(plan), REPEATS)
+        print(f"{size:>6} | {eager_startup:>16.2f} | {lazy_startup:>15.2f} | {linear:>16.3f} | {parse:>17.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Evaluation of plan-shape feedback.
+
+Runs questions of several categories through the agent graph, all as one
+tenant. A warm-up set fills a plan-shape library from the plans that ran; then
+a held-out set runs once without examples (measured only) and once with the
+library's examples in the planner prompt. Prints the mean critical-path length
+(DAG depth) and end-to-end latency of both, per category, and fails if the
+examples do not reduce either. Searches are simulated with a fixed latency.
+
+--planner selects who writes the plans:
+  fake    (default) a planner that mostly chains independent searches and goes
+          parallel whenever it is shown a parallel example. It is built to
+          follow examples, so a drop only shows that plans are measured, kept
+          and shown to the planner, not that examples help a real model.
+  record  the agent's planner model and prompt (model config and API keys as
+          for the agent). Every plan is saved to --recordings, keyed by phase
+          (warm-up, without examples, with examples) and question.
+  replay  the plans saved by `record`, with no network. This is the real
+          comparison: the same model's plans for the same held-out questions
+          with and without examples.
+Run with:
+python -m benchmarks.eval_plan_shapes [--planner record|replay]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import StructuredTool
+
+from src.graph import Route, Routes, create_agent_graph, stream_graph
+from src.joiner import FinalResponse, JoinOutputs, create_joiner
+from src.memory import HistoryPolicy
+from src.plan_shapes import PlanShapeLibrary, format_report, summarize
+from src.planner import create_planner
+from src.registry import ToolRegistry
+
+# Question shapes; each {} is an entity that needs its own search
+QUESTIONS = [
+    "Which is larger, the population of {} or the population of {}?",
+    "What are the capitals of {}, {} and {}?",
+    "What is the total GDP of {} and {}?",
+    "Tell me who leads {} and who leads {}",
+]
+ENTITIES = [
+    "France", "Spain", "Italy", "Japan", "Brazil", "Canada", "Kenya", "Norway", "Chile", "Egypt",
+    "India", "Mexico", "Peru", "Ghana", "Vietnam", "Poland", "Greece", "Nepal", "Cuba", "Iceland",
+]
+TENANT = "eval"
+RECORDINGS = os.path.join(os.path.dirname(__file__), "plan_shapes_recordings.json")
+_EXAMPLE_LINE = re.compile(r"^\d+\. search\(", re.MULTILINE)
+
+
+class ShapeFollowingPlanner(BaseChatModel):
+    """
+    Searches each entity of the question. Without a parallel example in the
+    prompt the searches usually form a chain, each referring to the previous
+    result; with one they usually run side by side, by construction. Seeded by
+    the question.
+    """
+    parallel_rate: float = 0.2
+    parallel_rate_with_example: float = 0.85
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-shape-planner"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # Tool descriptions and examples arrive joined by a literal "\n", as the real prompt expects
+        system = next(str(m.content) for m in messages if isinstance(m, SystemMessage)).replace("\\n", "\n")
+        question = next(str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage))
+        entities = [e for e in ENTITIES if re.search(rf"\b{e}\b", question)]
+        rate = self.parallel_rate_with_example if _shows_parallel_example(system) else self.parallel_rate
+        parallel = random.Random(zlib.crc32(question.encode())).random() < rate
+        lines = ["Thought: search each entity, then answer."]
+        for i, entity in enumerate(entities, start=1):
+            after = "" if parallel or i == 1 else f" (after ${{{i - 1}}})"
+            lines.append(f'{i}. search(query="{entity}{after}")')
+        lines.append(f"{len(entities) + 1}. join()<END_OF_PLAN>")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="\n".join(lines)))])
+
+
+def _shows_parallel_example(system: str) -> bool:
+    """Whether the prompt has an example plan whose searches do not refer to each other."""
+    for block in system.split("Question: ")[1:]:
+        searches = [line for line in block.split("\n") if _EXAMPLE_LINE.match(line)]
+        if len(searches) > 1 and not any("$" in line for line in searches):
+            return True
+    return False
+
+
+class RecordedPlanner(BaseChatModel):
+    """
+    Replays saved plans by phase and question. With a `model`, plans missing
+    from `recordings` are written by it and saved there.
+    """
+    recordings: Dict[str, str]
+    phase: str = "warmup"
+    model: Optional[Any] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "recorded-planner"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        question = next(str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage))
+        key = f"{self.phase}\t{question}"
+        if key not in self.recordings:
+            if self.model is None:
+                raise KeyError(f"No recorded plan for '{question}' ({self.phase}); run with --planner record first.")
+            self.recordings[key] = str(self.model.invoke(messages).content)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.recordings[key]))])
+
+
+def _tiny_prompt() -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([
+        ("system", "Plan with these {num_tools} tools:\n{tool_descriptions}\n{replan}"),
+        MessagesPlaceholder(variable_name="messages"),
+    ])
+
+
+def build_graph(library: PlanShapeLibrary, search_seconds: float, llm: BaseChatModel, prompt: ChatPromptTemplate):
+    def search(query: str) -> str:
+        time.sleep(search_seconds)
+        return f"facts about {query}"
+
+    registry = ToolRegistry()
+    registry.register(StructuredTool.from_function(func=search, name="search", description="search(query: str) -> str"))
+    planner = create_planner(llm, registry, prompt, examples=library)
+    joiner = create_joiner(RunnableLambda(lambda state: JoinOutputs(thought="Done.", action=FinalResponse(response="ok"))))
+    router = RunnableLambda(lambda prompt: Route(destination=Routes.PLANNER))
+    responder = RunnableLambda(lambda messages: AIMessage(content="hi"))
+    return create_agent_graph(router, planner, joiner, responder, HistoryPolicy(), plan_shapes=library)
+
+
+def questions(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(count):
+        shape = QUESTIONS[i % len(QUESTIONS)]
+        out.append(shape.format(*rng.sample(ENTITIES, shape.count("{}"))))
+    return out
+
+
+def run(
+    library: PlanShapeLibrary, batch: List[str], search_seconds: float, llm: BaseChatModel, prompt: ChatPromptTemplate
+) -> List[float]:
+    """End-to-end latency of each question, each a new conversation of the same tenant."""
+    graph = build_graph(library, search_seconds, llm, prompt)
+    latencies = []
+    # The executor and parser print progress; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for question in batch:
+            start = time.perf_counter()
+            for _ in stream_graph(graph, question, {"configurable": {"tenant_id": TENANT}}):
+                pass
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _summary(library: PlanShapeLibrary, latencies: List[float]) -> Tuple[float, float, float]:
+    depths = [run["depth"] for run in library.runs]
+    ordered = sorted(latencies)
+    return statistics.fmean(depths), statistics.fmean(latencies), ordered[round(0.95 * (len(ordered) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how example plans in the planner prompt change plan shapes.")
+    parser.add_argument("--warmup", type=int, default=40, help="Questions used to fill the library.")
+    parser.add_argument("--questions", type=int, default=40, help="Held-out questions evaluated with and without examples.")
+    parser.add_argument("--search_seconds", type=float, default=0.05)
+    parser.add_argument("--planner", choices=("fake", "record", "replay"), default="fake")
+    parser.add_argument("--recordings", default=RECORDINGS, help="Plans saved by --planner record.")
+    args = parser.parse_args()
+
+    planner: Optional[RecordedPlanner] = None
+    if args.planner == "fake":
+        llm, prompt = ShapeFollowingPlanner(), _tiny_prompt()
+    elif args.planner == "replay":
+        with open(args.recordings) as f:
+            planner = RecordedPlanner(recordings=json.load(f))
+        llm, prompt = planner, _tiny_prompt()
+    else:
+        # Imported only here: the agent's prompt comes from the LangChain hub and the model needs credentials
+        from langchain import hub
+        from src.models import create_node_model
+
+        planner = RecordedPlanner(recordings={}, model=create_node_model("planner"))
+        llm, prompt = planner, hub.pull("wfh/llm-compiler")
+
+    def phase(name: str) -> None:
+        if planner is not None:
+            planner.phase = name
+
+    held_out = questions(args.questions, seed=2)
+    baseline = PlanShapeLibrary(examples=0)
+    phase("no examples")
+    baseline_latencies = run(baseline, held_out, args.search_seconds, llm, prompt)
+
+    library = PlanShapeLibrary(examples=2)
+    phase("warmup")
+    run(library, questions(args.warmup, seed=1), args.search_seconds, llm, prompt)
+    learned = library.kept()
+    library.runs.clear()
+    phase("with examples")
+    latencies = run(library, held_out, args.search_seconds, llm, prompt)
+    if args.planner == "record":
+        with open(args.recordings, "w") as f:
+            json.dump(planner.recordings, f, indent=1, sort_keys=True)
+        print(f"Saved {len(planner.recordings)} plans to {args.recordings}")
+
+    results: Dict[str, Tuple[float, float, float]] = {
+        "no examples": _summary(baseline, baseline_latencies),
+        "with examples": _summary(library, latencies),
+    }
+    print(f"Planner: {args.planner}. {len(held_out)} held-out questions after {args.warmup} warm-up questions; examples kept per category: {learned}")
+    print(f"{'':<14} {'depth':>6} {'mean ms':>8} {'p95 ms':>8}")
+    for name, (depth, mean, p95) in results.items():
+        print(f"{name:<14} {depth:>6.2f} {mean * 1000:>8.0f} {p95 * 1000:>8.0f}")
+    print("\nNo examples:\n" + format_report(summarize(baseline.runs)))
+    print("\nWith examples:\n" + format_report(library.report()))
+
+    (depth_before, mean_before, _), (depth_after, mean_after, _) = results.values()
+    if depth_after >= depth_before or mean_after >= mean_before:
+        print("\nExample plans did not shorten the critical path and latency.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Offline recall of the planner's tool-selection stage.
+
+Builds a catalog of the built-in tools plus realistic and filler distractors,
+then checks whether the tools each labelled query needs are among the ones
+injected into the planner prompt. Run with: python -m benchmarks.eval_tool_selection
+"""
+from src.registry import ToolRegistry, ToolSpec
+from src.tool_selection import ToolSelector
+from src.tools import builtin_tools
+
+TOP_KS = [3, 5, 8]
+PINNED = [(), ("search", "math")]
+FILLER_TOOLS = 300
+
+DISTRACTORS = {
+    "weather": "Gets the current weather and forecast for a city.",
+    "stock_quote": "Returns the latest share price for a stock ticker symbol.",
+    "translate": "Translates text between natural languages.",
+    "send_email": "Sends an email message to a recipient address.",
+    "create_calendar_event": "Creates an event on the user's calendar at a given date and time.",
+    "currency_convert": "Converts an amount of money between currencies using current exchange rates.",
+    "read_file": "Reads a file from the local filesystem and returns its contents.",
+    "sql_query": "Runs a read-only SQL query against the analytics database.",
+    "unit_convert": "Converts quantities between measurement units such as miles and kilometers.",
+    "wikipedia": "Looks up an encyclopedia article summary for a topic.",
+    "image_caption": "Describes the contents of an image given its URL.",
+    "timezone": "Returns the current local time in a given timezone or city.",
+}
+
+# (query, tools the plan needs)
+CASES = [
+    ("What is the population of France divided by the population of Spain?", {"search", "math"}),
+    ("Who won the latest Formula 1 race?", {"search"}),
+    ("Calculate 37593 * 67", {"math"}),
+    ("What is the square root of the GDP of Japan in trillions?", {"search", "math"}),
+    ("Join my Google Meet at https://meet.google.com/abc-defg-hij", {"join_gmeet"}),
+    ("What does our internal vacation policy document say about carry-over days?", {"local_search"}),
+    ("Summarize the internal onboarding documents for new engineers", {"local_search"}),
+    ("Search the web for the tallest building completed this year", {"search"}),
+    ("How many seconds are in 3.5 years? Compute it", {"math"}),
+    ("Find the current CEO of Microsoft and their age, then compute years until 70", {"search", "math"}),
+    ("Join the meeting link I was sent and turn off my camera", {"join_gmeet"}),
+    ("According to our internal project documents, what is the launch date of project Atlas?", {"local_search"}),
+]
+
+
+def build_catalog() -> ToolRegistry:
+    registry = ToolRegistry()
+    for tool in builtin_tools:
+        registry.register(tool)
+    if "local_search" not in registry:
+        registry.register(ToolSpec(
+            name="local_search",
+            description="Searches the internal document collection offline.",
+            target="src.tools:create_local_search_tool",
+        ))
+    for name, description in DISTRACTORS.items():
+        registry.register(ToolSpec(name=name, description=description, target=f"plugins:{name}"))
+    for i in range(FILLER_TOOLS):
+        registry.register(ToolSpec(
+            name=f"service_{i}",
+            description=f"Manages records, tickets and settings for internal service number {i}.",
+            target=f"plugins:service_{i}",
+        ))
+    return registry
+
+
+def main():
+    registry = build_catalog()
+    full_prompt = len(registry.render_descriptions())
+    print(f"Catalog: {len(registry)} tools, {full_prompt} characters of tool descriptions.")
+    print(f"{'pinned':>12} | {'top_k':>5} | {'recall':>6} | {'cases fully covered':>19} | {'prompt chars (mean)':>19}")
+    for pinned, top_k in ((pinned, top_k) for pinned in PINNED for top_k in TOP_KS):
+        selector = ToolSelector(registry, top_k=top_k, pinned=pinned)
+        hits = needed = covered = chars = 0
+        misses = []
+        for query, expected in CASES:
+            selected = set(selector.select(query))
+            found = expected & selected
+            hits += len(found)
+            needed += len(expected)
+            covered += found == expected
+            chars += len(registry.render_descriptions(selector.select(query)))
+            if found != expected:
+                misses.append((query, sorted(expected - found)))
+        label = ",".join(pinned) or "-"
+        print(f"{label:>12} | {top_k:>5} | {hits / needed:>6.2f} | {covered:>12}/{len(CASES):<6} | {chars / len(CASES):>19.0f}")
+        for query, missing in misses:
+            print(f"{'':>12}   missed {missing} for: {query}")
+
+
+if __name__ == "__main__":
+    main()
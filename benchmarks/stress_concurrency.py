@@ -0,0 +1,201 @@
+"""
+Concurrency stress test for the agent graph.
+
+Runs hundreds of multi-turn conversations in parallel through one compiled
+graph, with deterministic fake models in place of Gemini: the real history node,
+planner, plan parser, executor, joiner plumbing and checkpointer are exercised.
+Odd-numbered conversations replan once per turn. The run fails if any answer is
+wrong, if a conversation's stored history contains another conversation's
+messages or tool calls, if stored messages were edited in place, or if two runs
+produce different transcripts. Run with:
+python -m benchmarks.stress_concurrency --conversations 200 --turns 3
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import StructuredTool
+
+from src.graph import Route, Routes, create_agent_graph, stream_graph
+from src.joiner import FinalResponse, JoinOutputs, Replan, create_joiner
+from src.memory import HistoryPolicy, create_checkpointer
+from src.planner import create_planner
+from src.registry import ToolRegistry
+from src.tools import get_math_tool
+
+_QUESTION = re.compile(r"conv=(\d+) turn=(\d+) x=(\d+)")
+_NEXT_TASK = re.compile(r"Continue task numbering from (\d+)")
+
+
+def _operand(conversation: int, turn: int) -> int:
+    return (conversation * 7 + turn) % 13
+
+
+def expected_answer(conversation: int, turn: int) -> str:
+    return f"conv={conversation} turn={turn} answer={float(conversation * 1000 + turn + _operand(conversation, turn))}"
+
+
+# --- Fake models ---
+class FakePlannerModel(BaseChatModel):
+    """Writes an LLMCompiler plan for the question in the conversation's last human message."""
+    @property
+    def _llm_type(self) -> str:
+        return "fake-planner"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        question = next(m.content for m in reversed(messages) if isinstance(m, HumanMessage))
+        conversation, turn, x = _QUESTION.search(question).groups()
+        start = 1
+        for message in messages:
+            match = _NEXT_TASK.search(str(message.content))
+            if match:
+                start = int(match.group(1))
+        plan = (
+            f"Thought: look up the base value and add {x}\n"
+            f'{start}. lookup(key="{conversation}-{turn}")\n'
+            f'{start + 1}. math(problem="add {x}", inputs={{"a": ${start}}}, expression="a + {x}")\n'
+            f"{start + 2}. join()<END_OF_PLAN>"
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=plan))])
+
+
+class FakeResponseModel(BaseChatModel):
+    @property
+    def _llm_type(self) -> str:
+        return "fake-response"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"Hello! ({messages[-1].content})"))])
+
+
+class NoExtractionModel:
+    """Math extraction model for plans that always pass an expression; any call is a bug."""
+    def with_structured_output(self, schema):
+        def fail(_):
+            raise AssertionError("The math tool tried to extract an expression.")
+        return RunnableLambda(fail)
+
+
+def _route(prompt: str) -> Route:
+    return Route(destination=Routes.PLANNER if _QUESTION.search(prompt) else Routes.RESPONSE)
+
+
+def _join(state: Dict[str, List[BaseMessage]]) -> JoinOutputs:
+    messages = state["messages"]
+    question = next(m.content for m in messages if isinstance(m, HumanMessage))
+    conversation, turn, _ = _QUESTION.search(question).groups()
+    results = [m.content for m in messages if isinstance(m, ToolMessage) and m.name == "math"]
+    if int(conversation) % 2 and len(results) < 2:
+        return JoinOutputs(thought="Double-check the sum.", action=Replan(feedback="Recompute the sum once more."))
+    return JoinOutputs(thought="Done.", action=FinalResponse(response=f"conv={conversation} turn={turn} answer={results[-1]}"))
+
+
+def _lookup(key: str) -> float:
+    # Random delays shuffle the interleaving of concurrent conversations
+    time.sleep(random.uniform(0, 0.004))
+    conversation, turn = key.split("-")
+    return float(int(conversation) * 1000 + int(turn))
+
+
+def build_graph(db_path: str):
+    registry = ToolRegistry()
+    registry.register(StructuredTool.from_function(func=_lookup, name="lookup", description="lookup(key: str) -> float"))
+    registry.register(get_math_tool(NoExtractionModel()))
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Plan with these {num_tools} tools:\n{tool_descriptions}\n{replan}"),
+        MessagesPlaceholder(variable_name="messages"),
+    ])
+    planner = create_planner(FakePlannerModel(), registry, prompt)
+    joiner = create_joiner(RunnableLambda(_join))
+    policy = HistoryPolicy()
+    graph = create_agent_graph(RunnableLambda(_route), planner, joiner, FakeResponseModel(), policy, create_checkpointer(db_path))
+    return graph, policy
+
+
+# --- Run and verify ---
+def _conversation(graph, policy: HistoryPolicy, conversation: int, turns: int) -> Tuple[List[str], List[str]]:
+    thread_id = f"stress-{conversation}"
+    answers, errors = [], []
+    greeting = f"hello from {conversation}"
+    answers.append(_final(stream_graph(graph, greeting, thread_id=thread_id, history_policy=policy)))
+    if answers[-1] != f"Hello! ({greeting})":
+        errors.append(f"conversation {conversation}: greeting answered with {answers[-1]!r}")
+    for turn in range(1, turns + 1):
+        question = f"conv={conversation} turn={turn} x={_operand(conversation, turn)}"
+        answers.append(_final(stream_graph(graph, question, thread_id=thread_id, history_policy=policy)))
+        if answers[-1] != expected_answer(conversation, turn):
+            errors.append(f"conversation {conversation} turn {turn}: expected {expected_answer(conversation, turn)!r}, got {answers[-1]!r}")
+
+    state = graph.get_state({"configurable": {"thread_id": thread_id}}).values["messages"]
+    for message in state:
+        if isinstance(message, HumanMessage) and not re.search(rf"\b(conv=|from ){conversation}\b", message.content):
+            errors.append(f"conversation {conversation}: foreign question in history: {message.content!r}")
+        if isinstance(message, ToolMessage) and message.name == "lookup":
+            if not message.additional_kwargs.get("args", {}).get("key", "").startswith(f"{conversation}-"):
+                errors.append(f"conversation {conversation}: foreign tool call in history: {message.additional_kwargs}")
+        if isinstance(message, SystemMessage) and "Begin the Current Plan" in message.content:
+            errors.append(f"conversation {conversation}: stored message was modified by the replanner")
+        if isinstance(message, SystemMessage) and message.additional_kwargs.get("history_context"):
+            for observation in message.additional_kwargs["observations"]:
+                if observation["tool"] == "lookup" and not observation["args"]["key"].startswith(f"{conversation}-"):
+                    errors.append(f"conversation {conversation}: foreign observation in history: {observation}")
+    return answers, errors
+
+
+def _final(events) -> Optional[str]:
+    return next((event["text"] for event in events if event["type"] == "final"), None)
+
+
+def run(conversations: int, turns: int, workers: int) -> Tuple[Dict[int, List[str]], List[str], float]:
+    with tempfile.TemporaryDirectory() as directory:
+        graph, policy = build_graph(os.path.join(directory, "stress.sqlite"))
+        start = time.perf_counter()
+        # The executor and parser print progress; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda c: _conversation(graph, policy, c, turns), range(conversations)))
+        elapsed = time.perf_counter() - start
+    transcripts = {c: answers for c, (answers, _) in enumerate(results)}
+    errors = [error for _, conversation_errors in results for error in conversation_errors]
+    return transcripts, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many agent conversations concurrently and check isolation.")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=3, help="Planned turns per conversation, after a greeting turn.")
+    parser.add_argument("--workers", type=int, default=32, help="Conversations running at the same time.")
+    parser.add_argument("--runs", type=int, default=2, help="Repeat the whole run to check determinism.")
+    args = parser.parse_args()
+
+    baseline, failures = None, []
+    for i in range(args.runs):
+        transcripts, errors, elapsed = run(args.conversations, args.turns, args.workers)
+        turns = args.conversations * (args.turns + 1)
+        print(f"run {i + 1}: {turns} turns in {elapsed:.1f}s ({turns / elapsed:.0f} turns/s), {len(errors)} errors")
+        failures += errors
+        if baseline is not None and transcripts != baseline:
+            failures.append(f"run {i + 1} produced different answers than run 1")
+        baseline = baseline or transcripts
+
+    for failure in failures[:20]:
+        print(f"  FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("All conversations isolated and deterministic.")
+
+
+if __name__ == "__main__":
+    main()
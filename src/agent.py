@@ -1,140 +1,112 @@
-import itertools
-from typing import Annotated, List, Dict, Any, TypedDict
-from enum import Enum
-from langgraph.graph import END, StateGraph, START
-from langgraph.graph.message import add_messages
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
-from pydantic import BaseModel, Field
+from typing import Iterator, Dict, Any, Optional
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain import hub
 
-from src.tools import tools
-from src.planner import create_planner
-from src.executor import task_scheduler
-from src.joiner import joiner
-
-# --- State Definition ---
-class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], add_messages]
-
-# --- Router Logic ---
-class Routes(Enum):
-    """The possible routes the agent can take."""
-    PLANNER = "planner"
-    RESPONSE = "response"
-
-class Route(BaseModel):
-    """The decision on which route to take."""
-    destination: Routes = Field(
-        ...,
-        description="The destination route for the user's input. Route to 'planner' if tools are needed, otherwise route to 'response'."
-    )
+from src.answer_cache import create_answer_cache
+from src.batching import create_batched_structured_output
+from src.tools import tool_registry
+from src.planner import create_plan_repairer, create_planner
+from src.tool_selection import create_tool_selector
+from src.joiner import JoinOutputs, create_early_join, create_joiner
+from src.ledger import create_token_ledger, ledger_tag
+from src.models import create_node_model
+from src.plan_cache import create_plan_template_cache
+from src.plan_shapes import create_plan_shape_library
+from src.memory import HistoryPolicy, create_checkpointer
+from src.graph import AgentState, Route, Routes, create_agent_graph, stream_graph
 
 # --- LLM and Prompt Instantiation ---
-llm_for_router = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
-llm_for_planner = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2)
-llm_for_response = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+# Each node's models and fallbacks come from the model config (see src/models.py)
+llm_for_router = create_node_model("router")
+llm_for_planner = create_node_model("planner")
+llm_for_replanner = create_node_model("replanner")
+llm_for_joiner = create_node_model("joiner")
+llm_for_response = create_node_model("response")
 
 planner_prompt = hub.pull("wfh/llm-compiler")
-router_prompt_template = (
-    "You are an expert at routing a user question to a specialist. "
-    "Based on the user's query, you must decide whether to route them to a 'planner' that can use tools to answer complex questions, "
-    "or to a 'response' node for simple conversational replies (like greetings or thank-yous).\n"
-    "The user's query is: '{query}'"
-)
+# You can optionally add examples to the joiner prompt
+joiner_prompt = hub.pull("wfh/llm-compiler-joiner").partial(examples="")
 
 # --- Node Definitions ---
-planner = create_planner(llm_for_planner, tools, planner_prompt)
-
-def router_node(state: AgentState) -> Dict[str, str]:
-    """Determines the next step based on the user's query."""
-    query = state["messages"][-1].content
-    prompt = router_prompt_template.format(query=query)
-    
-    router_runnable = llm_for_router.with_structured_output(Route)
-    route_decision = router_runnable.invoke(prompt)
-    
-    if route_decision.destination == Routes.PLANNER:
-        return {"destination": "plan_and_schedule"}
-    else:
-        return {"destination": "response"}
-
-def response_node(state: AgentState) -> Dict[str, List[BaseMessage]]:
-    """Generates a simple conversational response."""
-    user_input = state["messages"][-1]
-    response = llm_for_response.invoke([user_input])
-    return {"messages": [response]}
-
-def plan_and_schedule_node(state: AgentState, config) -> Dict[str, List[BaseMessage]]:
-    """Plans and executes tasks."""
-    # The planner returns a generator, so we stream it
-    tasks_generator = planner.stream(state["messages"])
-    # The scheduler invokes the tasks from the generator
-    return {"messages": task_scheduler.invoke({"messages": state["messages"], "tasks": tasks_generator}, config)}
-
-# --- Graph Construction ---
-graph_builder = StateGraph(AgentState)
-
-# Add all nodes
-graph_builder.add_node("router", router_node)
-graph_builder.add_node("plan_and_schedule", plan_and_schedule_node)
-graph_builder.add_node("join", joiner)
-graph_builder.add_node("response", response_node)
-
-# Set the entry point
-graph_builder.set_entry_point("router")
-
-# Define conditional edges from the router
-graph_builder.add_conditional_edges(
-    "router",
-    lambda x: x["destination"],
-    {
-        "plan_and_schedule": "plan_and_schedule",
-        "response": "response",
-    },
+# Recurring question shapes are planned from learned templates instead of the planner model
+plan_templates = create_plan_template_cache()
+# The planner is shown the fastest, most parallel plans executed so far for similar questions
+plan_shapes = create_plan_shape_library()
+planner = create_planner(
+    llm_for_planner, tool_registry, planner_prompt, create_tool_selector(tool_registry), llm_for_replanner, plan_templates,
+    plan_shapes,
 )
+# Concurrent sessions' routing and joiner calls are merged into one request when LLM_BATCH_WINDOW_MS is set
+router_runnable = (
+    create_batched_structured_output(llm_for_router, Route) or llm_for_router.with_structured_output(Route)
+).with_config(tags=[ledger_tag("router")])
+# The 'method' argument is not supported by the Gemini implementation and has been removed.
+joiner = create_joiner(joiner_prompt | (
+    create_batched_structured_output(llm_for_joiner, JoinOutputs)
+    or llm_for_joiner.with_structured_output(JoinOutputs)
+).with_config(tags=[ledger_tag("joiner")]))
 
-# Define edges for the planner route
-graph_builder.add_edge("plan_and_schedule", "join")
-
-def should_continue(state: AgentState) -> str:
-    """Determines whether to loop or end after the joiner."""
-    messages = state["messages"]
-    if isinstance(messages[-1], AIMessage):
-        return END
-    return "plan_and_schedule"
-
-graph_builder.add_conditional_edges(
-    "join",
-    should_continue,
-    {"plan_and_schedule": "plan_and_schedule", END: END}
+# --- Graph Construction ---
+# Compiled with a checkpointer so conversations persist per thread
+history_policy = HistoryPolicy()
+checkpointer = create_checkpointer()
+# Plan lines that fail schema validation are rewritten by the planner model while the rest runs
+plan_repairer = create_plan_repairer(llm_for_planner, tool_registry)
+# With JOIN_EARLY_EXIT set, plans end once their answer is available, cancelling redundant tasks
+early_join = create_early_join(joiner)
+agent_chain = create_agent_graph(
+    router_runnable, planner, joiner, llm_for_response, history_policy, checkpointer, plan_templates, plan_repairer,
+    early_join, plan_shapes,
 )
-
-# The response node is always an end state
-graph_builder.add_edge("response", END)
-
-# Compile the graph
-agent_chain = graph_builder.compile()
-
-# --- Invocation Helper ---
-def invoke_agent(question: str, config: Dict[str, Any] = None) -> Any:
-    initial_state = {"messages": [HumanMessage(content=question)]}
-    full_output = None
-    for s in agent_chain.stream(initial_state, config=config):
-        full_output = s
-    
-    # Check the last node that was executed to extract the correct final response
-    last_executed_node = list(full_output.keys())[-1]
-    
-    if last_executed_node == 'join' and full_output['join'] and 'messages' in full_output['join']:
-        final_messages = full_output['join']['messages']
-        if final_messages and isinstance(final_messages[-1], AIMessage):
-            return final_messages[-1].content
-    
-    elif last_executed_node == 'response' and full_output['response'] and 'messages' in full_output['response']:
-        final_messages = full_output['response']['messages']
-        if final_messages and isinstance(final_messages[-1], AIMessage):
-            return final_messages[-1].content
-
-    return "Could not determine a final answer."
\ No newline at end of file
+# Every model call of every turn is recorded here (see `python -m src.ledger`)
+token_ledger = create_token_ledger()
+# Repeated one-shot questions are answered from here (see src/answer_cache.py)
+answer_cache = create_answer_cache()
+
+# --- Invocation Helpers ---
+def stream_agent(
+    question: str,
+    config: Dict[str, Any] = None,
+    thread_id: Optional[str] = None,
+    use_cache: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Runs one turn of a conversation and yields progress events as they happen:
+    the routing decision, each task starting and finishing, the final answer's
+    tokens as they are generated, and finally the complete answer.
+    Turns sharing a `thread_id` see each other's history; without one, the turn
+    starts a fresh conversation. Safe to call from many threads at once.
+
+    Only turns without a `thread_id` may be answered from the answer cache
+    (announced by a "cache" event), so REPL turns always run the graph; pass
+    use_cache=False to always run it for one-shot calls too.
+    """
+    def run():
+        return stream_graph(
+            agent_chain,
+            question,
+            config=config,
+            thread_id=thread_id,
+            history_policy=history_policy,
+            token_ledger=token_ledger,
+            registry=tool_registry,
+        )
+
+    # Follow-up turns depend on their conversation's history, so only fresh ones are cached
+    fresh = not (thread_id or (config or {}).get("configurable", {}).get("thread_id"))
+    if answer_cache is None or not use_cache or not fresh:
+        return run()
+    return answer_cache.stream(answer_cache.key(question, tool_registry), run)
+
+def invoke_agent(
+    question: str,
+    config: Dict[str, Any] = None,
+    thread_id: Optional[str] = None,
+    use_cache: bool = True,
+) -> Any:
+    """Runs one turn of a conversation and returns only the final answer."""
+    final = None
+    for event in stream_agent(question, config=config, thread_id=thread_id, use_cache=use_cache):
+        if event["type"] == "final":
+            final = event["text"]
+    return final
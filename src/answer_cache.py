@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from pydantic import BaseModel, Field
+
+from src.registry import ToolRegistry
+
+Events = Iterator[Dict[str, Any]]
+
+# Seconds an answer stays fresh, by the most volatile tool its plan used
+DEFAULT_TTLS: Dict[str, float] = {
+    "search": 300.0,
+    "local_search": 3600.0,
+    "math": 86400.0,
+}
+# Answers that used no tools at all (conversational replies)
+NO_TOOLS_TTL = 86400.0
+_UNKNOWN_TOOL_TTL = 600.0
+_FAILED_ANSWER = "Could not determine a final answer."
+# Words, numbers with their decimal and thousands separators, and arithmetic operators
+_QUESTION_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|\w+|[-+*/^%=<>]")
+
+
+def normalize_question(question: str) -> str:
+    """
+    The question part of a cache key: casefolded, with whitespace and
+    punctuation collapsed but every word, number and operator kept in order,
+    so "What is 10 divided by 2?" and "what is 10 divided by 2" share an entry
+    and "What is 2 divided by 10?" does not.
+    """
+    return " ".join(_QUESTION_TOKEN.findall(question.casefold()))
+
+
+class CachedAnswer(BaseModel):
+    answer: str
+    tools: List[str] = Field(default_factory=list, description="Tools the plan used.")
+    created: float
+    expires: float = Field(..., description="Until then the answer is served as is.")
+    stale_until: float = Field(..., description="Until then it is served while a refresh runs in the background.")
+
+
+# --- Backends ---
+class MemoryCacheBackend:
+    """LRU-bounded in-process store."""
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedAnswer]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CachedAnswer) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SqliteCacheBackend:
+    """Store shared by processes on one host, surviving restarts."""
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, entry TEXT NOT NULL, stale_until REAL NOT NULL)")
+
+    def get(self, key: str) -> Optional[CachedAnswer]:
+        with self.lock:
+            row = self.conn.execute("SELECT entry FROM answers WHERE key = ?", (key,)).fetchone()
+        return CachedAnswer.model_validate_json(row[0]) if row else None
+
+    def put(self, key: str, entry: CachedAnswer) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?)", (key, entry.model_dump_json(), entry.stale_until))
+            # Expired rows are dropped as new ones arrive
+            self.conn.execute("DELETE FROM answers WHERE stale_until < ?", (time.time(),))
+
+
+# --- Cache ---
+class AnswerCache:
+    """
+    Whole-answer cache in front of the agent graph, keyed on the normalized
+    question and the tool catalog. An answer's lifetime depends on the tools its
+    plan used; once expired it is still served for `stale_factor` times its TTL
+    while a background run refreshes it.
+
+    Only one-shot questions are cached: a turn of a conversation depends on its
+    history, and answering it from the cache would leave the turn out of the
+    stored history. stream_agent therefore bypasses the cache whenever a
+    thread_id is given, which includes every REPL turn; scheduled queries and
+    other calls without a thread use it.
+    """
+    def __init__(self, backend, ttls: Optional[Dict[str, float]] = None, stale_factor: float = 1.0, refresh_workers: int = 2):
+        self.backend = backend
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stale_factor = stale_factor
+        self._refresh_pool = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="answer-cache")
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+        self._catalog_version = -1
+        self._catalog_hash = ""
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "stored": 0, "refreshed": 0}
+
+    def key(self, question: str, registry: ToolRegistry) -> str:
+        # Adding, removing or redescribing a tool changes what plans are possible
+        if registry.version != self._catalog_version:
+            catalog = "\n".join(f"{name}:{registry.description(name)}" for name in sorted(registry.names()))
+            self._catalog_hash = hashlib.sha256(catalog.encode()).hexdigest()[:16]
+            self._catalog_version = registry.version
+        return f"{self._catalog_hash}:{normalize_question(question)}"
+
+    def ttl_for(self, tools: Iterable[str]) -> float:
+        tools = set(tools)
+        if not tools:
+            return NO_TOOLS_TTL
+        return min(self.ttls.get(tool, _UNKNOWN_TOOL_TTL) for tool in tools)
+
+    def stream(self, key: str, run: Callable[[], Events]) -> Events:
+        """
+        Yields the events of `run()`, or a cached answer when one is available.
+        Cached answers yield a {"type": "cache"} event before the final answer.
+        """
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is not None and now < entry.stale_until:
+            fresh = now < entry.expires
+            self._count("hits" if fresh else "stale")
+            if not fresh:
+                self._refresh(key, run)
+            yield {"type": "cache", "status": "fresh" if fresh else "stale", "age": now - entry.created}
+            yield {"type": "final", "text": entry.answer}
+            return
+        self._count("misses")
+        yield from self._run_and_store(key, run)
+
+    def _run_and_store(self, key: str, run: Callable[[], Events]) -> Events:
+        tools: Set[str] = set()
+        failed = False
+        for event in run():
+            if event["type"] == "task_start":
+                tools.add(event["tool"])
+            elif event["type"] == "task_end" and event["error"]:
+                failed = True
+            elif event["type"] == "final" and not failed and event["text"] != _FAILED_ANSWER:
+                now, ttl = time.time(), self.ttl_for(tools)
+                self.backend.put(key, CachedAnswer(
+                    answer=event["text"],
+                    tools=sorted(tools),
+                    created=now,
+                    expires=now + ttl,
+                    stale_until=now + ttl * (1 + self.stale_factor),
+                ))
+                self._count("stored")
+            yield event
+
+    def _count(self, stat: str) -> None:
+        # Turns and background refreshes update the counters from many threads
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _refresh(self, key: str, run: Callable[[], Events]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                for _ in self._run_and_store(key, run):
+                    pass
+                self._count("refreshed")
+            except Exception as e:
+                print(f"Answer cache refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(refresh)
+
+
+def create_answer_cache() -> Optional[AnswerCache]:
+    """
+    ANSWER_CACHE selects the backend: 'memory' (default), 'sqlite' (at
+    ANSWER_CACHE_DB) or 'off'. ANSWER_CACHE_TTLS overrides per-tool lifetimes as
+    JSON, e.g. '{"search": 60}'.
+    """
+    kind = os.getenv("ANSWER_CACHE", "memory")
+    if kind == "off":
+        return None
+    if kind == "sqlite":
+        backend = SqliteCacheBackend(os.getenv("ANSWER_CACHE_DB", "answer_cache.sqlite"))
+    else:
+        backend = MemoryCacheBackend(int(os.getenv("ANSWER_CACHE_SIZE", "1024")))
+    return AnswerCache(
+        backend,
+        ttls=json.loads(os.getenv("ANSWER_CACHE_TTLS", "{}")),
+        stale_factor=float(os.getenv("ANSWER_CACHE_STALE_FACTOR", "1.0")),
+    )
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Generic, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, convert_to_messages
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, LLMResult
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config, get_callback_manager_for_config
+from pydantic import BaseModel, Field, create_model
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted by concurrent callers for up to `window` seconds, or
+    until `max_size` items are waiting, and processes them with one call to
+    `batch_fn`, which must return one result per item in order. The caller that
+    opens a batch waits for the window and runs it; every caller gets its own
+    result (or the batch's exception) back.
+    """
+    def __init__(self, batch_fn: Callable[[List[T]], Sequence[R]], window: float = 0.01, max_size: int = 8):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_size = max_size
+        self._cond = threading.Condition()
+        self._batch: List[T] = []
+        self._futures: List[Future] = []
+        self.stats = {"items": 0, "batches": 0, "largest": 0}
+
+    def submit(self, item: T) -> R:
+        future: Future = Future()
+        with self._cond:
+            batch, futures = self._batch, self._futures
+            batch.append(item)
+            futures.append(future)
+            leader = len(batch) == 1
+            if len(batch) >= self.max_size:
+                # Full: later callers start a new batch while this one is sent
+                self._batch, self._futures = [], []
+                self._cond.notify_all()
+            if leader:
+                deadline = time.monotonic() + self.window
+                while self._batch is batch and (remaining := deadline - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+                if self._batch is batch:
+                    self._batch, self._futures = [], []
+        if leader:
+            self._run(batch, futures)
+        return future.result()
+
+    def _run(self, batch: List[T], futures: List[Future]) -> None:
+        with self._cond:
+            self.stats["items"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["largest"] = max(self.stats["largest"], len(batch))
+        try:
+            results = list(self.batch_fn(batch))
+            if len(results) != len(batch):
+                raise ValueError(f"Batch of {len(batch)} items returned {len(results)} results.")
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+
+_BATCH_PROMPT = """You are handling {count} independent requests at once. Each request starts with a "### Request N" message and runs until the next one.
+Answer each request exactly as you would if it were the only one, without letting the others influence it, and return one item per request, in order."""
+
+
+def _messages(prompt: Any) -> List[BaseMessage]:
+    if isinstance(prompt, PromptValue):
+        return prompt.to_messages()
+    if isinstance(prompt, str):
+        return [HumanMessage(content=prompt)]
+    return convert_to_messages(prompt)
+
+
+def _batch_messages(prompts: Sequence[Any]) -> List[BaseMessage]:
+    """
+    One conversation holding every request with its roles. Calls of one node
+    share their system prompt, which is sent once after the batch instructions;
+    other system messages stay in their request, marked as instructions.
+    """
+    requests = [_messages(prompt) for prompt in prompts]
+    shared = 0
+    while all(
+        len(r) > shared and isinstance(r[shared], SystemMessage) and r[shared].content == requests[0][shared].content
+        for r in requests
+    ):
+        shared += 1
+    system = [_BATCH_PROMPT.format(count=len(prompts)), *(str(m.content) for m in requests[0][:shared])]
+    messages: List[BaseMessage] = [SystemMessage(content="\n\n".join(system))]
+    for i, request in enumerate(requests):
+        messages.append(HumanMessage(content=f"### Request {i + 1}"))
+        for message in request[shared:]:
+            if isinstance(message, SystemMessage):
+                message = HumanMessage(content=f"Instructions for this request: {message.content}")
+            messages.append(message)
+    return messages
+
+
+def _report(prompt: Any, config: RunnableConfig, item: BaseModel) -> None:
+    """
+    Replays a caller's item of a merged request as a model call of its own on
+    the caller's callbacks, so the token ledger records it (with estimated
+    tokens) and a streamed answer reaches the caller's session.
+    """
+    manager = get_callback_manager_for_config(config)
+    if not manager.handlers:
+        return
+    run = manager.on_chat_model_start({"name": "BatchedStructuredOutput"}, [_messages(prompt)])[0]
+    text = item.model_dump_json()
+    message_id = f"run-{run.run_id}"
+    run.on_llm_new_token(text, chunk=ChatGenerationChunk(message=AIMessageChunk(content=text, id=message_id)))
+    run.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content=text, id=message_id))]]))
+
+
+class BatchedStructuredOutput(Runnable):
+    """
+    Drop-in replacement for `llm.with_structured_output(schema)` that merges the
+    calls made by concurrent sessions into one multi-item structured request.
+    A batch of one uses the plain single-item call, and a batched response with
+    the wrong number of items falls back to one call per request; both run
+    with the caller's config. Each item of a merged response is reported to its
+    caller's callbacks as that caller's own model call.
+    """
+    def __init__(self, llm: BaseChatModel, schema: Type[BaseModel], window: float = 0.01, max_size: int = 8):
+        self.single = llm.with_structured_output(schema)
+        batch_schema = create_model(
+            f"{schema.__name__}Batch",
+            __doc__=f"One {schema.__name__} per request, in request order.",
+            items=(List[schema], Field(..., description="One result per request, in order.")),
+        )
+        self.multi = llm.with_structured_output(batch_schema)
+        self.batcher: MicroBatcher[Tuple[Any, RunnableConfig], BaseModel] = MicroBatcher(self._run_batch, window, max_size)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseModel:
+        return self.batcher.submit((input, ensure_config(config)))
+
+    def _run_batch(self, requests: List[Tuple[Any, RunnableConfig]]) -> List[BaseModel]:
+        if len(requests) == 1:
+            prompt, config = requests[0]
+            return [self.single.invoke(prompt, config)]
+        response = self.multi.invoke(_batch_messages([prompt for prompt, _ in requests]))
+        if response is None or len(response.items) != len(requests):
+            return [self.single.invoke(prompt, config) for prompt, config in requests]
+        for (prompt, config), item in zip(requests, response.items):
+            _report(prompt, config, item)
+        return response.items
+
+
+def create_batched_structured_output(llm: BaseChatModel, schema: Type[BaseModel]) -> Optional[BatchedStructuredOutput]:
+    """
+    Returns a batching structured-output runnable when LLM_BATCH_WINDOW_MS is set,
+    otherwise None (every call is sent on its own).
+    """
+    window_ms = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+    if window_ms <= 0:
+        return None
+    return BatchedStructuredOutput(llm, schema, window_ms / 1000, int(os.getenv("LLM_BATCH_MAX_SIZE", "8")))
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.messages import BaseMessage, ToolMessage
+
+BLOB_KEY = "blob"
+_HANDLE_LENGTH = 24
+_HANDLE_PATTERN = re.compile(r"^\[blob:([0-9a-f]+) ")
+
+
+class BlobStore:
+    """
+    Content-addressed store for large tool outputs. Identical outputs are stored
+    once; blobs live in memory up to `memory_budget` bytes and the least recently
+    used ones spill to files in `spill_dir`. Each blob is reference-counted by the
+    conversations that produced it and removed when the last one releases it.
+    """
+    def __init__(self, memory_budget: int = 32 * 1024 * 1024, spill_dir: Optional[str] = None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir or os.path.join(tempfile.gettempdir(), "llm_compiler_blobs")
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled: Set[str] = set()
+        self._refs: Dict[str, int] = {}
+        self._owners: Dict[str, Set[str]] = {}
+
+    def put(self, content: str, owner: str) -> str:
+        """Stores `content` on behalf of `owner` and returns its handle."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:_HANDLE_LENGTH]
+        with self._lock:
+            owned = self._owners.setdefault(owner, set())
+            if digest not in owned:
+                owned.add(digest)
+                self._refs[digest] = self._refs.get(digest, 0) + 1
+            if digest not in self._memory and digest not in self._spilled:
+                self._memory[digest] = data
+                self._memory_bytes += len(data)
+                self._spill_over_budget()
+        return digest
+
+    def get(self, digest: str) -> Optional[str]:
+        """Returns the content for a handle, or None if it has been released."""
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                return data.decode("utf-8")
+            if digest not in self._spilled:
+                return None
+        with open(self._path(digest), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def release(self, owner: str) -> None:
+        """Drops every blob that only `owner` still references."""
+        with self._lock:
+            for digest in self._owners.pop(owner, set()):
+                self._refs[digest] -= 1
+                if self._refs[digest] > 0:
+                    continue
+                del self._refs[digest]
+                data = self._memory.pop(digest, None)
+                if data is not None:
+                    self._memory_bytes -= len(data)
+                if digest in self._spilled:
+                    self._spilled.discard(digest)
+                    try:
+                        os.remove(self._path(digest))
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "blobs": len(self._refs),
+                "memory_bytes": self._memory_bytes,
+                "spilled": len(self._spilled),
+                "owners": len(self._owners),
+            }
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.spill_dir, digest)
+
+    def _spill_over_budget(self) -> None:
+        # Called with self._lock held; keeps the newest blob in memory
+        while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+            digest, data = self._memory.popitem(last=False)
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(self._path(digest), "wb") as f:
+                f.write(data)
+            self._memory_bytes -= len(data)
+            self._spilled.add(digest)
+
+
+def create_blob_store() -> BlobStore:
+    """Builds the process-wide blob store from environment settings."""
+    return BlobStore(
+        memory_budget=int(os.getenv("BLOB_MEMORY_BYTES", str(32 * 1024 * 1024))),
+        spill_dir=os.getenv("BLOB_SPILL_DIR"),
+    )
+
+
+blob_store = create_blob_store()
+BLOB_THRESHOLD_CHARS = int(os.getenv("BLOB_THRESHOLD_CHARS", "2000"))
+BLOB_PREVIEW_CHARS = int(os.getenv("BLOB_PREVIEW_CHARS", "300"))
+
+
+# --- Message helpers ---
+def make_reference(content: str, owner: str) -> Optional[Tuple[str, str]]:
+    """
+    Stores `content` if it is above the size threshold and returns its handle and
+    the short reference text that replaces it in graph state; returns None for
+    small outputs.
+    """
+    if len(content) <= BLOB_THRESHOLD_CHARS:
+        return None
+    digest = blob_store.put(content, owner)
+    return digest, f"[blob:{digest} {len(content)} chars] {content[:BLOB_PREVIEW_CHARS]}..."
+
+
+def blob_handle(message: BaseMessage) -> Optional[str]:
+    if not isinstance(message, ToolMessage):
+        return None
+    if BLOB_KEY in message.additional_kwargs:
+        return message.additional_kwargs[BLOB_KEY]
+    match = _HANDLE_PATTERN.match(str(message.content))
+    return match.group(1) if match else None
+
+
+def resolve_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    Returns the messages with blob references replaced by their full content, for
+    the places that hand tool outputs to an LLM. The originals are not modified; a
+    released blob keeps its preview.
+    """
+    resolved = []
+    for message in messages:
+        digest = blob_handle(message)
+        content = blob_store.get(digest) if digest else None
+        resolved.append(message.model_copy(update={"content": content}) if content is not None else message)
+    return resolved
@@ -1,10 +1,23 @@
 import asyncio
-from typing import List, Dict, Any, Optional
+import os
+import re
+import time
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple, Union, get_args, get_origin
 from uuid import uuid4
 from langchain_core.runnables import Runnable, RunnableConfig
-from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
 from langchain_core.tools import BaseTool
+from langgraph.config import get_stream_writer
+from pydantic import BaseModel
+from src.blobs import BLOB_KEY, make_reference
+from src.fair_queue import fair_scheduler, tenant_of
+from src.joiner import EarlyJoin
+from src.output_parser import ID_PATTERN, SINGLE_ID_PATTERN
+from src.process_pool import run_in_process
+from src.profiler import section
+from src.task_queue import create_task_queue
 import json
+import numpy as np
 
 # This class appears to be unused based on the tracebacks,
 # but is kept as part of the file structure you provided.
@@ -47,30 +60,155 @@ class Task:
             return [self.substitute_inputs(i, state) for i in tool_input]
         return tool_input
 
+def _get_event_writer():
+    """
+    Returns the graph's custom stream writer, or a no-op when the scheduler
+    runs outside of a graph (e.g. when invoked directly).
+    """
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda event: None
+
+# When configured, tool calls of these execution classes go to remote workers (see src/task_queue.py)
+task_queue = create_task_queue()
+_QUEUED_EXECUTION = frozenset(os.getenv("TASK_QUEUE_EXECUTION", "io,cpu").split(","))
+# Seconds a queued call waits for a worker's result before the task fails
+_QUEUE_TIMEOUT = float(os.getenv("TASK_QUEUE_TIMEOUT", "120"))
+
+# Recent duration of each tool: its cost in fair queuing, and what cancelling it saved
+_tool_seconds: Dict[str, float] = {}
+
+def _record_duration(tool: str, seconds: float) -> None:
+    previous = _tool_seconds.get(tool)
+    _tool_seconds[tool] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+def _estimated_saving(outstanding: Sequence[Dict], started: Dict[int, float]) -> float:
+    """Seconds the longest outstanding task would still have taken, by its tool's recent duration."""
+    now = time.perf_counter()
+    return max(
+        (max(_tool_seconds.get(task['tool'].name, 0.0) - (now - started.get(task['idx'], now)), 0.0) for task in outstanding),
+        default=0.0,
+    )
+
+async def _invoke_tool(
+    tool: BaseTool, args: Dict[str, Any], task_id: Optional[str] = None, config: Optional[RunnableConfig] = None
+) -> Any:
+    """
+    Runs I/O-bound tools on a thread, async tools on the event loop, and CPU-bound
+    tools in the process pool so they do not contend for the GIL. With a task
+    queue configured, queued execution classes run on tool workers instead.
+    Every call is first admitted by the process-wide fair scheduler, which
+    shares tool slots between conversations (see src/fair_queue.py).
+    """
+    metadata = tool.metadata or {}
+    execution = metadata.get("execution", "io")
+    if fair_scheduler is None:
+        with section(f"tool:{tool.name}"):
+            return await _dispatch_tool(tool, args, task_id, execution)
+    tenant, priority = tenant_of(config)
+    # Costlier tools use up a tenant's share faster; tools not seen yet count as a second
+    cost = _tool_seconds.get(tool.name, 1.0)
+    with section(f"tool:{tool.name}"):
+        if execution == "io" and not (task_queue is not None and execution in _QUEUED_EXECUTION):
+            return await fair_scheduler.run_in_thread(tenant, priority, cost, tool.invoke, args)
+        async with fair_scheduler.slot(tenant, priority, cost):
+            return await _dispatch_tool(tool, args, task_id, execution)
+
+async def _dispatch_tool(tool: BaseTool, args: Dict[str, Any], task_id: Optional[str], execution: str) -> Any:
+    metadata = tool.metadata or {}
+    if task_queue is not None and execution in _QUEUED_EXECUTION:
+        return await task_queue.run(task_id or str(uuid4()), tool.name, args, timeout=_QUEUE_TIMEOUT)
+    if execution == "async":
+        return await tool.ainvoke(args)
+    if execution == "cpu" and metadata.get("target"):
+        return await run_in_process(metadata["target"], args)
+    return await asyncio.to_thread(tool.invoke, args)
+
+def _format_result(result: Any) -> str:
+    """Renders a tool result as message content for the joiner and later planning rounds."""
+    # If the result is a list of dicts (like from Tavily), extract the content.
+    if isinstance(result, list) and all(isinstance(i, dict) for i in result):
+        # This specifically targets search results to make them readable for the joiner
+        return "\n".join([item.get("content", "") for item in result])
+    if isinstance(result, np.ndarray):
+        return json.dumps(result.tolist())
+    if isinstance(result, list):
+        # Fallback for other kinds of lists
+        return json.dumps(result)
+    # For any other data type
+    return str(result)
+
+def _is_text(annotation: Any) -> bool:
+    """Whether a field annotated `annotation` takes text: str or a list of str, optionally Optional."""
+    if get_origin(annotation) is Union:
+        return any(_is_text(arg) for arg in get_args(annotation) if arg is not type(None))
+    if get_origin(annotation) in (list, List):
+        return get_args(annotation) == (str,)
+    return annotation is str
+
+def _text_fields(tool: BaseTool) -> set:
+    schema = getattr(tool, 'args_schema', None)
+    if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+        return set()
+    return {name for name, field in schema.model_fields.items() if _is_text(field.annotation)}
+
+def _resolve_args(value: Any, results: Dict[int, Any], as_text: bool = False) -> Any:
+    """
+    Substitutes the outputs of earlier tasks into a task's arguments. An argument
+    that is only a reference ('$1' or '${1}') receives the tool's result as is,
+    e.g. a numpy array, so typed values flow between tools, unless `as_text`;
+    references embedded in longer text are replaced by the rendered output.
+    """
+    if isinstance(value, str):
+        single = re.match(SINGLE_ID_PATTERN, value) or re.fullmatch(ID_PATTERN, value)
+        if single and int(single.group(1)) in results:
+            result = results[int(single.group(1))]
+            return _format_result(result) if as_text else result
+        return re.sub(
+            ID_PATTERN,
+            lambda m: _format_result(results[int(m.group(1))]) if int(m.group(1)) in results else m.group(0),
+            value,
+        )
+    if isinstance(value, dict):
+        return {k: _resolve_args(v, results, as_text) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve_args(v, results, as_text) for v in value]
+    return value
+
+def _resolve_task_args(task: Dict, results: Dict[int, Any]) -> Any:
+    """Resolves a task's arguments; results bound to text fields (str or List[str]) are rendered as text."""
+    if not isinstance(task['args'], dict):
+        return _resolve_args(task['args'], results)
+    text = _text_fields(task['tool'])
+    return {k: _resolve_args(v, results, k in text) for k, v in task['args'].items()}
+
 # MODIFIED FUNCTION
-async def _execute_task(task: Dict, state: Dict, config: Dict) -> Optional[ToolMessage]:
+async def _execute_task(task: Dict, state: Dict, config: Dict, run_id: str = "") -> Optional[ToolMessage]:
     """
     Executes a single task and returns a ToolMessage or None for join tasks.
+    `state` maps finished task indices to their raw results; this task's result
+    is added to it for the tasks that depend on it. Queued tasks are correlated
+    by `run_id` and the task index.
     """
     if task['tool'] == 'join':
         return None
 
     try:
-        # Execute the tool with its arguments
-        result = await asyncio.to_thread(task['tool'].invoke, task['args'])
-
-        # --- START OF NEW LOGIC ---
-        # If the result is a list of dicts (like from Tavily), extract the content.
-        if isinstance(result, list) and all(isinstance(i, dict) for i in result):
-            # This specifically targets search results to make them readable for the joiner
-            content = "\n".join([item.get("content", "") for item in result])
-        elif isinstance(result, list):
-            # Fallback for other kinds of lists
-            content = json.dumps(result)
-        else:
-            # For any other data type
-            content = str(result)
-        # --- END OF NEW LOGIC ---
+        # Execute the tool with its arguments, according to its declared execution class
+        args = _resolve_task_args(task, state)
+        start = time.perf_counter()
+        result = await _invoke_tool(task['tool'], args, f"{run_id or uuid4()}:{task['idx']}", config)
+        _record_duration(task['tool'].name, time.perf_counter() - start)
+        state[task['idx']] = result
+        content = _format_result(result)
+
+        # Large outputs are stored once in the blob store; state only carries a reference
+        additional_kwargs = {"args": task['args']}
+        owner = (config or {}).get("configurable", {}).get("thread_id", "default")
+        reference = make_reference(content, owner)
+        if reference is not None:
+            additional_kwargs[BLOB_KEY], content = reference
         
         # Return a ToolMessage for LangGraph
         return ToolMessage(
@@ -78,7 +216,7 @@ async def _execute_task(task: Dict, state: Dict, config: Dict) -> Optional[ToolM
             name=task['tool'].name, 
             # Use a more robust ID format and embed the original arguments
             tool_call_id=f"call_{task['idx']}",
-            additional_kwargs={"args": task['args']}
+            additional_kwargs=additional_kwargs
         )
 
     except Exception as e:
@@ -89,57 +227,218 @@ async def _execute_task(task: Dict, state: Dict, config: Dict) -> Optional[ToolM
             tool_call_id=f"call_{task['idx']}"
         )
 
+# Totals for this process of plans ended before all of their tasks finished
+early_join_stats = {"checks": 0, "exits": 0, "cancelled": 0, "saved_seconds": 0.0}
+
+def _invalid_task_message(task: Dict) -> ToolMessage:
+    name = task['tool'] if isinstance(task['tool'], str) else task['tool'].name
+    return ToolMessage(content=f"Error: invalid task: {task['error']}", name=name, tool_call_id=f"call_{task['idx']}")
+
+# Rewrites a plan's invalid tasks: (question, all tasks, invalid tasks) -> repaired tasks
+PlanRepairer = Callable[[str, Sequence[Dict], Sequence[Dict]], List[Dict]]
+
 # MODIFIED FUNCTION
-async def _schedule_tasks_async(tasks: List[Dict], config: RunnableConfig) -> List[BaseMessage]:
+async def _schedule_tasks_async(
+    tasks: List[Dict],
+    config: RunnableConfig,
+    repair: Optional[PlanRepairer] = None,
+    question: str = "",
+    early_join: Optional[EarlyJoin] = None,
+    history: Sequence[BaseMessage] = (),
+) -> List[BaseMessage]:
     """
-    Main coroutine to schedule and execute tasks concurrently.
+    Main coroutine to schedule and execute tasks concurrently. Each task starts
+    as soon as its dependencies have finished. Task dicts are only read; progress
+    is tracked by task index in this call's own structures.
+    Tasks that failed to compile are sent to `repair` in the background while
+    the valid ones run; tasks depending on them wait for the repaired version.
+    Tasks that cannot be repaired fail with their compile error.
+    With `early_join`, finished results are checked against the question
+    (`history` is the conversation so far) as they arrive; once the answer is
+    available the outstanding tasks are cancelled, and the joiner's final
+    response, if it gave one, is returned after the tool messages.
     """
     print("Inspecting tasks:", tasks)
-    task_map = {task['idx']: task for task in tasks}
-    task_outputs: Dict[str, Any] = {}
-    pending_tasks = list(tasks)
+    emit = _get_event_writer()
+    task_outputs: Dict[int, Any] = {}
+    run_id = str(uuid4())
+    pending_tasks = [task for task in tasks if not task.get('error')]
+    invalid_tasks = [task for task in tasks if task.get('error')]
     messages = []
-    
-    while pending_tasks:
-        ready_tasks = [
-            task for task in pending_tasks
-            if all(dep in task_outputs for dep in task['dependencies'])
-        ]
-        
-        if not ready_tasks:
-            # Handle deadlock or finished execution
+    running: Dict[asyncio.Future, Dict] = {}
+    started: Dict[int, float] = {}
+    # Resolved arguments of started tasks, and (tool, arguments) of those that succeeded, for the early join check
+    arguments: Dict[int, Any] = {}
+    succeeded: List[Tuple[str, Any]] = []
+
+    def fail(task: Dict) -> None:
+        message = _invalid_task_message(task)
+        messages.append(message)
+        task_outputs[task['idx']] = message.content
+        emit({"type": "task_end", "idx": task['idx'], "tool": message.name, "error": True})
+
+    def record(future: asyncio.Future) -> None:
+        task = running.pop(future)
+        tool_message = future.result()
+        # Successful tasks stored their raw result already; failed ones pass on their error text
+        if task['idx'] not in task_outputs:
+            task_outputs[task['idx']] = tool_message.content
+        messages.append(tool_message)
+        error = str(tool_message.content).startswith("Error:")
+        if not error:
+            succeeded.append((task['tool'].name, arguments[task['idx']]))
+        emit({"type": "task_end", "idx": task['idx'], "tool": tool_message.name, "error": error})
+
+    def start_ready_tasks() -> None:
+        nonlocal pending_tasks
+        while True:
+            ready = {
+                task['idx'] for task in pending_tasks
+                if all(dep in task_outputs for dep in task['dependencies'])
+            }
+            if not ready:
+                return
+            for task in pending_tasks:
+                if task['idx'] not in ready:
+                    continue
+                if task['tool'] == 'join':
+                    # Nothing to execute; tasks after it may now be ready
+                    task_outputs[task['idx']] = None
+                    continue
+                emit({"type": "task_start", "idx": task['idx'], "tool": task['tool'].name, "args": task['args']})
+                started[task['idx']] = time.perf_counter()
+                arguments[task['idx']] = _resolve_task_args(task, task_outputs)
+                running[asyncio.ensure_future(_execute_task(task, task_outputs, config, run_id))] = task
+            pending_tasks = [task for task in pending_tasks if task['idx'] not in ready]
+
+    repairing = None
+    if invalid_tasks and repair is not None:
+        print(f"Repairing invalid tasks {[task['idx'] for task in invalid_tasks]}")
+        repairing = asyncio.ensure_future(asyncio.to_thread(repair, question, tasks, invalid_tasks))
+    else:
+        for task in invalid_tasks:
+            fail(task)
+        invalid_tasks = []
+
+    checking, checks, checked_at = None, 0, 0
+    answer: Optional[List[BaseMessage]] = None
+    while True:
+        start_ready_tasks()
+        if not running and repairing is None:
+            # Finished, or the remaining tasks wait on results that will never come
             break
+        waiting = {*running, *(f for f in (repairing, checking) if f is not None)}
+        done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+        if repairing in done:
+            try:
+                repaired = {task['idx']: task for task in repairing.result()}
+            except Exception as e:
+                print(f"Plan repair failed: {e}")
+                repaired = {}
+            for task in invalid_tasks:
+                if task['idx'] in repaired:
+                    pending_tasks.append(repaired[task['idx']])
+                else:
+                    fail(task)
+            invalid_tasks, repairing = [], None
+
+        # Tasks that finished alongside the check keep their results
+        for future in done:
+            if future in running:
+                record(future)
+
+        if checking in done:
+            try:
+                answer = checking.result()
+            except Exception as e:
+                print(f"Early join check failed: {e}")
+            checking = None
+            if answer is not None:
+                break
+
+        outstanding = [*running.values(), *(task for task in pending_tasks if task['tool'] != 'join')]
+        if early_join is None or repairing is not None or not outstanding or len(messages) <= checked_at:
+            continue
+        if early_join.joiner is None:
+            # Local mode: the plan ends once every outstanding task repeats one that succeeded
+            if early_join.ready(succeeded, [
+                (task, arguments[task['idx']] if task['idx'] in arguments else _resolve_task_args(task, task_outputs))
+                for task in outstanding
+            ]):
+                answer = []
+                break
+            checked_at = len(messages)
+        elif checking is None and succeeded and checks < early_join.max_calls:
+            # Ask the joiner whether the answer is already there, one call at a time and only on new results
+            checks, checked_at = checks + 1, len(messages)
+            early_join_stats["checks"] += 1
+            # Run with the node's config, so the call is in the token ledger and its answer is streamed
+            checking = asyncio.ensure_future(asyncio.to_thread(early_join.answer, [*history, *messages], config))
+
+    if checking is not None:
+        checking.cancel()
+    if answer is not None:
+        # Tools that finished since the last wait are recorded, not cancelled
+        for future in [future for future in running if future.done() and not future.cancelled()]:
+            record(future)
+        outstanding = [*running.values(), *(task for task in pending_tasks if task['tool'] != 'join')]
+        saved = _estimated_saving(outstanding, started)
+        for future in running:
+            future.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        for task in outstanding:
+            messages.append(ToolMessage(
+                content="Cancelled: the answer was available before this task finished.",
+                name=task['tool'].name,
+                tool_call_id=f"call_{task['idx']}",
+            ))
+            emit({"type": "task_end", "idx": task['idx'], "tool": task['tool'].name, "error": False, "cancelled": True})
+        early_join_stats["exits"] += 1
+        early_join_stats["cancelled"] += len(outstanding)
+        early_join_stats["saved_seconds"] += saved
+        print(f"Early join: cancelled {len(outstanding)} tasks, saving about {saved * 1000:.0f} ms")
+        emit({"type": "early_join", "cancelled": len(outstanding), "saved_ms": saved * 1000})
+        messages.extend(answer)
 
-        # Execute ready tasks concurrently
-        results = await asyncio.gather(
-            *[_execute_task(task, task_outputs, config) for task in ready_tasks]
-        )
-        
-        # Process results
-        for task, tool_message in zip(ready_tasks, results):
-            # Store output for other tasks to use. Join tasks will have None.
-            if tool_message:
-                task_outputs[task['idx']] = tool_message.content
-            else:
-                task_outputs[task['idx']] = None
-
-            # Only append actual ToolMessages to the final list for LangGraph
-            if tool_message is not None:
-                messages.append(tool_message)
-
-        # Remove completed tasks from the pending list
-        pending_tasks = [task for task in pending_tasks if task not in ready_tasks]
-        
     return messages
 
 
+def _question(scheduler_input: Dict[str, Any]) -> str:
+    messages = scheduler_input.get("messages") or []
+    return str(next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), ""))
+
+def _run(coroutine):
+    """
+    asyncio.run, except that threads still running tools cancelled by an early
+    join are left to finish in the background instead of being waited for.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+def _arguments(scheduler_input: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "repair": scheduler_input.get("repair"),
+        "question": _question(scheduler_input),
+        "early_join": scheduler_input.get("early_join"),
+        "history": scheduler_input.get("messages") or (),
+    }
+
 def schedule_tasks(scheduler_input: Dict[str, Any], config: RunnableConfig) -> List[BaseMessage]:
     """
-    Synchronous wrapper for the async task scheduler.
+    Synchronous wrapper for the async task scheduler. The input may carry a
+    `repair` function for tasks that failed to compile and an `early_join`
+    check (see src/joiner.py) for ending the plan once its answer is available.
     """
     # The input from the planner is a generator, so convert it to a list to allow iteration
     tasks = list(scheduler_input["tasks"]) 
-    return asyncio.run(_schedule_tasks_async(tasks, config))
+    # Tools run on other threads or processes, so CPU time on this thread is the executor's own
+    with section("executor"):
+        return _run(_schedule_tasks_async(tasks, config, **_arguments(scheduler_input)))
 
 # This runnable class wraps the scheduling logic for LangGraph
 class TaskScheduler(Runnable):
@@ -149,7 +448,7 @@ class TaskScheduler(Runnable):
     async def ainvoke(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None) -> List[BaseMessage]:
         # The input from the planner is a generator, so convert it to a list
         tasks = list(input["tasks"])
-        return await _schedule_tasks_async(tasks, config or {})
+        return await _schedule_tasks_async(tasks, config or {}, **_arguments(input))
 
 
 # Instantiate the scheduler for use in your graph
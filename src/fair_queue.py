@@ -0,0 +1,192 @@
+import asyncio
+import contextvars
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+
+# Share of tool slots each priority class gets when both have calls waiting
+PRIORITY_WEIGHTS: Dict[str, float] = {"interactive": 4.0, "batch": 1.0}
+DEFAULT_PRIORITY = "interactive"
+
+
+class _Waiter:
+    __slots__ = ("tenant", "start", "finish", "future", "loop", "queued")
+
+    def __init__(self, tenant: str, start: float, finish: float, future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.tenant = tenant
+        self.start = start
+        self.finish = finish
+        self.future = future
+        self.loop = loop
+        self.queued = time.perf_counter()
+
+
+class FairToolScheduler:
+    """
+    Process-wide admission for tool calls, shared by every task scheduler run
+    whatever thread or event loop it is on. At most `capacity` calls are in
+    flight; further calls queue per tenant (a conversation unless the config
+    names a tenant) and are admitted by weighted fair queuing, so a tenant with
+    a 40-task plan takes turns with single-task plans instead of going first.
+    A call's cost is its tool's recent duration divided by its priority class
+    weight. No tenant holds more than `tenant_share` of the slots. I/O-bound
+    tools run on the scheduler's own thread pool, sized to the capacity.
+    With `fair=False` calls are admitted first come, first served, uncapped.
+    """
+    def __init__(self, capacity: int = 64, tenant_share: float = 0.25, fair: bool = True):
+        self.capacity = capacity
+        self.tenant_cap = max(1, int(capacity * tenant_share)) if fair else capacity
+        self.fair = fair
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=capacity, thread_name_prefix="tool")
+        self._in_flight = 0
+        self._tenant_in_flight: Dict[str, int] = defaultdict(int)
+        self._queues: Dict[str, Deque[_Waiter]] = defaultdict(deque)
+        self._last_finish: Dict[str, float] = defaultdict(float)
+        self._virtual_time = 0.0
+        self._arrivals = 0
+        self._delays: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=1000))
+        self._calls: Dict[str, int] = defaultdict(int)
+
+    # --- Admission ---
+    def _admissible(self, tenant: str) -> bool:
+        return self._in_flight < self.capacity and self._tenant_in_flight[tenant] < self.tenant_cap
+
+    def _grant(self, tenant: str, delay: float) -> None:
+        self._in_flight += 1
+        self._tenant_in_flight[tenant] += 1
+        self._calls[tenant] += 1
+        self._delays[tenant].append(delay)
+
+    def _dispatch(self) -> None:
+        """Admits waiting calls, lowest finish tag first, while slots are free. Holds the lock."""
+        while self._in_flight < self.capacity:
+            heads = [queue[0] for tenant, queue in self._queues.items() if queue and self._admissible(tenant)]
+            if not heads:
+                return
+            waiter = min(heads, key=lambda w: w.finish)
+            self._queues[waiter.tenant].popleft()
+            self._grant(waiter.tenant, time.perf_counter() - waiter.queued)
+            self._virtual_time = max(self._virtual_time, waiter.start)
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    async def acquire(self, tenant: str, priority: str = DEFAULT_PRIORITY, cost: float = 1.0) -> None:
+        """Waits for a slot; pair with `release`."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Slots never sit free while an admissible call waits, so only the tenant's own queue can be ahead
+            if self._admissible(tenant) and not self._queues[tenant]:
+                self._grant(tenant, 0.0)
+                return
+            if self.fair:
+                start = max(self._virtual_time, self._last_finish[tenant])
+                finish = start + cost / PRIORITY_WEIGHTS.get(priority, 1.0)
+                self._last_finish[tenant] = finish
+            else:
+                self._arrivals += 1
+                start = finish = float(self._arrivals)
+            waiter = _Waiter(tenant, start, finish, loop.create_future(), loop)
+            self._queues[tenant].append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._queues[tenant]:
+                    self._queues[tenant].remove(waiter)
+                    raise
+            # Granted as it was cancelled: hand the slot back
+            self.release(tenant)
+            raise
+
+    def release(self, tenant: str) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._tenant_in_flight[tenant] -= 1
+            if not self._tenant_in_flight[tenant]:
+                del self._tenant_in_flight[tenant]
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, priority: str = DEFAULT_PRIORITY, cost: float = 1.0) -> AsyncIterator[None]:
+        await self.acquire(tenant, priority, cost)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+    async def run_in_thread(self, tenant: str, priority: str, cost: float, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs `fn` on the shared pool once admitted. The slot is held until the
+        thread finishes, even if the awaiting task is cancelled meanwhile.
+        """
+        await self.acquire(tenant, priority, cost)
+        try:
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args)
+        except BaseException:
+            self.release(tenant)
+            raise
+        future.add_done_callback(lambda _: self.release(tenant))
+        return await asyncio.wrap_future(future)
+
+    # --- Report ---
+    def report(self) -> List[Dict[str, Any]]:
+        """Calls and queueing delay per tenant, slowest p95 first."""
+        with self._lock:
+            rows = []
+            for tenant, delays in self._delays.items():
+                ordered = sorted(delays)
+                rows.append({
+                    "tenant": tenant,
+                    "calls": self._calls[tenant],
+                    "queued": sum(1 for d in ordered if d > 0),
+                    "p50_ms": statistics.median(ordered) * 1000,
+                    "p95_ms": ordered[round(0.95 * (len(ordered) - 1))] * 1000,
+                    "max_ms": ordered[-1] * 1000,
+                })
+        return sorted(rows, key=lambda row: -row["p95_ms"])
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def format_report(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "No tool calls admitted."
+    lines = [f"{'tenant':<38} {'calls':>6} {'queued':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+    for row in rows:
+        lines.append(
+            f"{row['tenant'][:38]:<38} {row['calls']:>6} {row['queued']:>7} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['max_ms']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def tenant_of(config: Optional[RunnableConfig]) -> Tuple[str, str]:
+    """(tenant, priority class) of a run: `tenant_id` or else `thread_id`, and `priority` from its configurable."""
+    configurable = (config or {}).get("configurable", {})
+    tenant = configurable.get("tenant_id") or configurable.get("thread_id") or "default"
+    return str(tenant), configurable.get("priority", DEFAULT_PRIORITY)
+
+
+def create_fair_scheduler() -> Optional[FairToolScheduler]:
+    """
+    TOOL_SLOTS bounds the tool calls in flight across the process (0 disables
+    admission; tools then run on each run's own threads). TOOL_TENANT_SHARE caps
+    one tenant's share of the slots.
+    """
+    capacity = int(os.getenv("TOOL_SLOTS", "64"))
+    if capacity <= 0:
+        return None
+    return FairToolScheduler(capacity, float(os.getenv("TOOL_TENANT_SHARE", "0.25")))
+
+
+fair_scheduler = create_fair_scheduler()
@@ -1,16 +1,8 @@
 import time
 import json
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 import os
-from selenium_stealth import stealth
 
 # --- PASTE YOUR COOKIE DATA HERE ---
 # For testing, you can paste the content of your cookies.json file here
@@ -281,10 +273,22 @@ HARDCODED_COOKIES = """
 """
 # ------------------------------------
 
+GMEET_DESCRIPTION = "Joins a Google Meet by loading hardcoded cookies."
+
 def join_gmeet(meet_url: str):
     """
     Joins a Google Meet by loading hardcoded cookies.
     """
+    # Selenium is imported on first use, so the tool registry can read the description cheaply
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium_stealth import stealth
+    from webdriver_manager.chrome import ChromeDriverManager
+
     print("\n--- [G-Meet Job Started] ---")
     driver = None
     try:
@@ -365,6 +369,6 @@ class GMeetInput(BaseModel):
 gmeet_tool = StructuredTool.from_function(
     func=join_gmeet,
     name="join_gmeet",
-    description="Joins a Google Meet by loading hardcoded cookies.",
+    description=GMEET_DESCRIPTION,
     args_schema=GMeetInput,
 )
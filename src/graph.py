@@ -0,0 +1,251 @@
+import time
+from enum import Enum
+from typing import Annotated, Any, Dict, Iterator, List, Optional, TypedDict
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+from pydantic import BaseModel, Field
+
+from src.blobs import blob_store
+from src.executor import PlanRepairer, task_scheduler
+from src.joiner import EARLY_JOIN_TAG, EarlyJoin, FinalResponseStream
+from src.ledger import TokenLedger, TokenLedgerHandler, ledger_tag
+from src.memory import HistoryPolicy, create_history_node, new_thread_id, prune_checkpoints, thread_config
+from src.plan_cache import PlanTemplateCache, standalone
+from src.plan_shapes import PlanShapeLibrary
+from src.profiler import profile_query
+from src.registry import ToolRegistry
+
+# --- State Definition ---
+class AgentState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+
+# --- Router Logic ---
+class Routes(Enum):
+    """The possible routes the agent can take."""
+    PLANNER = "planner"
+    RESPONSE = "response"
+
+class Route(BaseModel):
+    """The decision on which route to take."""
+    destination: Routes = Field(
+        ...,
+        description="The destination route for the user's input. Route to 'planner' if tools are needed, otherwise route to 'response'."
+    )
+
+router_prompt_template = (
+    "You are an expert at routing a user question to a specialist. "
+    "Based on the user's query, you must decide whether to route them to a 'planner' that can use tools to answer complex questions, "
+    "or to a 'response' node for simple conversational replies (like greetings or thank-yous).\n"
+    "The user's query is: '{query}'"
+)
+
+# --- Graph Construction ---
+def create_agent_graph(
+    router: Runnable,
+    planner: Runnable,
+    joiner: Runnable,
+    response_llm: BaseChatModel,
+    history_policy: HistoryPolicy,
+    checkpointer: Optional[BaseCheckpointSaver] = None,
+    plan_templates: Optional[PlanTemplateCache] = None,
+    plan_repairer: Optional[PlanRepairer] = None,
+    early_join: Optional[EarlyJoin] = None,
+    plan_shapes: Optional[PlanShapeLibrary] = None,
+):
+    """
+    Assembles the agent graph from its models. Nodes only read their input state
+    and return new messages, so one compiled graph can serve many conversations
+    concurrently. With `plan_templates`, each turn's first plan and the joiner's
+    verdict on it are reported to the template cache the planner draws from.
+    With `plan_repairer`, plan lines that fail to compile are rewritten while the
+    rest of the plan runs, instead of failing and costing a full replan.
+    With `early_join`, a plan can end before all of its tasks have finished;
+    when the joiner already answered, the turn ends without the join node.
+    With `plan_shapes`, each turn's first plan is measured and, if the joiner
+    accepts it, offered to the library of example plans the planner is shown.
+    """
+    response_runnable = response_llm.with_config(tags=[ledger_tag("response")])
+
+    def router_node(state: AgentState) -> Dict[str, str]:
+        """Determines the next step based on the user's query."""
+        query = state["messages"][-1].content
+        prompt = router_prompt_template.format(query=query)
+
+        route_decision = router.invoke(prompt)
+
+        if route_decision.destination == Routes.PLANNER:
+            return {"destination": "plan_and_schedule"}
+        else:
+            return {"destination": "response"}
+
+    def response_node(state: AgentState) -> Dict[str, List[BaseMessage]]:
+        """Generates a simple conversational response."""
+        user_input = state["messages"][-1]
+        response = response_runnable.invoke([user_input])
+        return {"messages": [response]}
+
+    # Told about each turn's first plan and then about the joiner's verdict on it
+    plan_observers = [observer for observer in (plan_templates, plan_shapes) if observer is not None]
+
+    def plan_and_schedule_node(state: AgentState, config) -> Dict[str, List[BaseMessage]]:
+        """Plans and executes tasks."""
+        start = time.perf_counter()
+        # The planner returns a generator, so we stream it
+        tasks_generator = planner.stream(state["messages"], config)
+        first_plan = bool(plan_observers) and not isinstance(state["messages"][-1], SystemMessage)
+        if first_plan:
+            tasks = []
+            tasks_generator = _recorded(tasks_generator, tasks)
+        # The scheduler invokes the tasks from the generator
+        messages = task_scheduler.invoke(
+            {"messages": state["messages"], "tasks": tasks_generator, "repair": plan_repairer, "early_join": early_join},
+            config,
+        )
+        if first_plan:
+            thread_id = config["configurable"]["thread_id"]
+            question = str(next(m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)))
+            if plan_templates is not None and standalone(state["messages"]):
+                plan_templates.observe(thread_id, question, tasks)
+            if plan_shapes is not None:
+                plan_shapes.observe(thread_id, question, tasks, time.perf_counter() - start, plan_shapes.tenant_for(config))
+            if messages and isinstance(messages[-1], AIMessage):
+                for observer in plan_observers:
+                    observer.resolve(thread_id, True)
+        return {"messages": messages}
+
+    def join_node(state: AgentState, config) -> Dict[str, List[BaseMessage]]:
+        """Runs the joiner and tells the plan observers whether the turn's plan was good enough."""
+        update = joiner.invoke(state, config)
+        for observer in plan_observers:
+            observer.resolve(config["configurable"]["thread_id"], isinstance(update["messages"][-1], AIMessage))
+        return update
+
+    graph_builder = StateGraph(AgentState)
+
+    # Add all nodes
+    graph_builder.add_node("load_history", create_history_node(history_policy))
+    graph_builder.add_node("router", router_node)
+    graph_builder.add_node("plan_and_schedule", plan_and_schedule_node)
+    graph_builder.add_node("join", join_node if plan_observers else joiner)
+    graph_builder.add_node("response", response_node)
+
+    # Set the entry point; the stored history is compacted before routing
+    graph_builder.set_entry_point("load_history")
+    graph_builder.add_edge("load_history", "router")
+
+    # Define conditional edges from the router
+    graph_builder.add_conditional_edges(
+        "router",
+        lambda x: x["destination"],
+        {
+            "plan_and_schedule": "plan_and_schedule",
+            "response": "response",
+        },
+    )
+
+    # Define edges for the planner route; an early join may have answered already
+    graph_builder.add_conditional_edges(
+        "plan_and_schedule",
+        lambda state: END if isinstance(state["messages"][-1], AIMessage) else "join",
+        {"join": "join", END: END},
+    )
+
+    def should_continue(state: AgentState) -> str:
+        """Determines whether to loop or end after the joiner."""
+        messages = state["messages"]
+        if isinstance(messages[-1], AIMessage):
+            return END
+        return "plan_and_schedule"
+
+    graph_builder.add_conditional_edges(
+        "join",
+        should_continue,
+        {"plan_and_schedule": "plan_and_schedule", END: END}
+    )
+
+    # The response node is always an end state
+    graph_builder.add_edge("response", END)
+
+    return graph_builder.compile(checkpointer=checkpointer)
+
+def _recorded(tasks: Iterator[Any], into: List[Any]) -> Iterator[Any]:
+    for task in tasks:
+        into.append(task)
+        yield task
+
+# --- Invocation Helpers ---
+def _final_answer(update: Dict[str, Any]) -> Optional[str]:
+    """Extracts the final answer from a 'join', 'response' or early-joined 'plan_and_schedule' update, if it carries one."""
+    for node in ("join", "response", "plan_and_schedule"):
+        if node in update and update[node] and 'messages' in update[node]:
+            final_messages = update[node]['messages']
+            if final_messages and isinstance(final_messages[-1], AIMessage):
+                return final_messages[-1].content
+    return None
+
+def stream_graph(
+    graph,
+    question: str,
+    config: Dict[str, Any] = None,
+    thread_id: Optional[str] = None,
+    history_policy: Optional[HistoryPolicy] = None,
+    token_ledger: Optional[TokenLedger] = None,
+    registry: Optional[ToolRegistry] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Runs one turn of a conversation on a compiled agent graph and yields progress
+    events as they happen: the routing decision, each task starting and finishing,
+    the final answer's tokens as they are generated, and finally the complete answer.
+    Turns sharing a `thread_id` see each other's history; without one, the turn
+    starts a fresh conversation.
+    """
+    thread_id = thread_id or (config or {}).get("configurable", {}).get("thread_id") or new_thread_id()
+    config = thread_config(thread_id, config)
+    initial_state = {"messages": [HumanMessage(content=question)]}
+    answer = None
+    joiner_stream, joiner_run = None, None
+    usage = TokenLedgerHandler(thread_id, registry)
+    config["callbacks"] = [*(config.get("callbacks") or []), usage]
+
+    with profile_query(question) as profiling:
+        if profiling is not None:
+            config["callbacks"].append(profiling)
+        try:
+            for mode, chunk in graph.stream(initial_state, config=config, stream_mode=["updates", "messages", "custom"]):
+                if mode == "custom":
+                    yield chunk
+                elif mode == "messages":
+                    message, metadata = chunk
+                    node = metadata.get("langgraph_node")
+                    # Only token chunks are streamed; complete messages arrive again as node updates
+                    if not isinstance(message, AIMessageChunk):
+                        continue
+                    if node == "response":
+                        text = message.content if isinstance(message.content, str) else ""
+                    elif node == "join" or EARLY_JOIN_TAG in (metadata.get("tags") or ()):
+                        # Every joiner call (one per replan round) gets its own extractor
+                        if message.id != joiner_run:
+                            joiner_stream, joiner_run = FinalResponseStream(), message.id
+                        text = joiner_stream.feed(message)
+                    else:
+                        continue
+                    if text:
+                        yield {"type": "token", "node": node, "text": text}
+                elif mode == "updates":
+                    if "router" in chunk and chunk["router"]:
+                        yield {"type": "route", "destination": chunk["router"]["destination"]}
+                    answer = _final_answer(chunk) or answer
+        finally:
+            # Stored history only keeps previews, so a turn's large tool outputs can go once it ends
+            blob_store.release(thread_id)
+            if token_ledger is not None and usage.records:
+                token_ledger.add(usage.records)
+
+    if graph.checkpointer and history_policy is not None:
+        prune_checkpoints(graph.checkpointer, thread_id, history_policy.keep_checkpoints)
+    yield {"type": "final", "text": answer or "Could not determine a final answer."}
@@ -1,10 +1,14 @@
-from typing import List, Union, Dict, Any
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, BaseMessage, ToolMessage, ToolCall
-from langchain_core.runnables import chain as as_runnable
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain import hub
+import json
+import os
+import re
+from typing import List, Optional, Sequence, Set, Tuple, Union, Dict, Any
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, BaseMessage, ToolMessage, ToolCall
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
 from pydantic import BaseModel, Field
 
+from src.blobs import resolve_messages
+from src.profiler import profiled
+
 # --- Joiner Output Models ---
 class FinalResponse(BaseModel):
     """The final response/answer."""
@@ -23,15 +27,6 @@ class JoinOutputs(BaseModel):
     action: Union[FinalResponse, Replan]
 
 # --- Joiner Logic ---
-# You can optionally add examples to the joiner prompt
-joiner_prompt = hub.pull("wfh/llm-compiler-joiner").partial(examples="") 
-llm_for_joiner = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0) # Use a more deterministic LLM for joiner
-
-# The 'method' argument is not supported by the Gemini implementation and has been removed.
-runnable_joiner_decision = joiner_prompt | llm_for_joiner.with_structured_output(
-    JoinOutputs
-)
-
 def _parse_joiner_output(decision: JoinOutputs) -> Dict[str, List[BaseMessage]]:
     """Parse the Joiner's decision into LangGraph messages."""
     response_messages = [AIMessage(content=f"Thought: {decision.thought}")]
@@ -49,6 +44,62 @@ def _parse_joiner_output(decision: JoinOutputs) -> Dict[str, List[BaseMessage]]:
     return {"messages": response_messages}
 
 
+# --- Streaming the Final Response ---
+_RESPONSE_FIELD = re.compile(r'(?<!\\)"response"\s*:\s*"')
+
+
+class FinalResponseStream:
+    """
+    Incrementally extracts `FinalResponse.response` from the joiner's streamed
+    structured output, so the answer can be shown while the object is still
+    being generated. Feed it the raw message chunks of one joiner call.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.start: Optional[int] = None
+        self.pos = 0
+        self.done = False
+
+    def feed(self, chunk: AIMessageChunk) -> str:
+        text = chunk.content if isinstance(chunk.content, str) else ""
+        text += "".join(tc.get("args") or "" for tc in chunk.tool_call_chunks)
+        self.buffer += text
+        if self.done:
+            return ""
+        if self.start is None:
+            match = _RESPONSE_FIELD.search(self.buffer)
+            if not match:
+                return ""
+            self.start = self.pos = match.end()
+        return self._decode()
+
+    def _decode(self) -> str:
+        """Decodes as much of the JSON string value as has arrived."""
+        out = []
+        buffer, i = self.buffer, self.pos
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char == "\\":
+                # Wait for the rest of an escape sequence before decoding it
+                end = i + 6 if buffer[i + 1:i + 2] == "u" else i + 2
+                if buffer[i + 1:i + 3].lower() == "ud" and buffer[i + 3:i + 4].lower() in "89ab":
+                    end = i + 12  # High surrogate: decode together with its pair
+                if end > len(buffer):
+                    break
+                out.append(json.loads(f'"{buffer[i:end]}"'))
+                i = end
+                continue
+            out.append(char)
+            i += 1
+        self.pos = i
+        return "".join(out)
+
+
+@profiled("joiner.select")
 def select_recent_messages(state: Dict[str, List[BaseMessage]]) -> Dict[str, List[BaseMessage]]:
     """
     Selects the most recent messages for the joiner's decision.
@@ -111,5 +162,91 @@ def select_recent_messages(state: Dict[str, List[BaseMessage]]) -> Dict[str, Lis
     return {"messages": relevant_messages}
 
 
-# Composed Joiner Runnable
-joiner = select_recent_messages | runnable_joiner_decision | _parse_joiner_output
\ No newline at end of file
+@profiled("joiner.resolve_blobs")
+def _resolve_blobs(state: Dict[str, List[BaseMessage]]) -> Dict[str, List[BaseMessage]]:
+    """Swaps blob references for the full tool outputs right before they reach the LLM."""
+    return {"messages": resolve_messages(state["messages"])}
+
+
+def create_joiner(decision: Runnable) -> Runnable:
+    """
+    Composes the joiner around `decision`, a runnable mapping {"messages": [...]}
+    to JoinOutputs (the joiner prompt piped into a structured-output model).
+    """
+    return RunnableLambda(select_recent_messages) | _resolve_blobs | decision | _parse_joiner_output
+
+
+# --- Early Join ---
+# Tag of joiner calls made while a plan is still running, so their answer tokens can be told from the planner's
+EARLY_JOIN_TAG = "early_join"
+_WORD = re.compile(r"\w+")
+
+
+def _words(value: Any) -> Set[str]:
+    """The casefolded words of an argument value, however nested."""
+    if isinstance(value, dict):
+        return set().union(*(_words(v) for v in value.values()))
+    if isinstance(value, (list, tuple)):
+        return set().union(*(_words(v) for v in value))
+    return set(_WORD.findall(str(value).casefold()))
+
+
+class EarlyJoin:
+    """
+    Decides, while a plan is still running, whether its answer is already
+    available. With a joiner, the joiner is asked whenever new results have
+    arrived, one call at a time and at most `max_calls` times per plan; its
+    final response is used as is and a replan from partial results is ignored.
+    Without one, `ready` is a cheap local check instead: every outstanding task
+    is a leaf (only the join waits on it) that repeats a task which has already
+    succeeded, i.e. the same tool with the same or nearly the same resolved
+    arguments (`similarity` is the share of argument words the two have in
+    common). It alone ends the plan and the join node answers from what
+    finished.
+    """
+    def __init__(self, joiner: Optional[Runnable] = None, max_calls: int = 2, similarity: float = 0.8):
+        self.joiner = joiner.with_config(tags=[EARLY_JOIN_TAG]) if joiner is not None else None
+        self.max_calls = max_calls
+        self.similarity = similarity
+
+    def _duplicates(self, args: Any, other: Any) -> bool:
+        words, other_words = _words(args), _words(other)
+        union = words | other_words
+        return not union or len(words & other_words) / len(union) >= self.similarity
+
+    def ready(self, finished: Sequence[Tuple[str, Any]], outstanding: Sequence[Tuple[Dict[str, Any], Any]]) -> bool:
+        """
+        `finished` holds the tool name and resolved arguments of each task that
+        succeeded, `outstanding` each remaining task with its resolved arguments.
+        """
+        awaited = {dep for task, _ in outstanding for dep in task["dependencies"]}
+        return all(
+            task["idx"] not in awaited
+            and any(tool == task["tool"].name and self._duplicates(args, done) for tool, done in finished)
+            for task, args in outstanding
+        )
+
+    def answer(self, messages: List[BaseMessage], config: Optional[RunnableConfig] = None) -> Optional[List[BaseMessage]]:
+        """The joiner's messages if it gives a final response from `messages`, else None."""
+        update = self.joiner.invoke({"messages": messages}, config)
+        return update["messages"] if isinstance(update["messages"][-1], AIMessage) else None
+
+
+def create_early_join(joiner: Runnable) -> Optional[EarlyJoin]:
+    """
+    JOIN_EARLY_EXIT selects the mode: 'off' (default) waits for every task,
+    'local' ends a plan once its outstanding tasks repeat finished ones,
+    'joiner' asks `joiner` as results arrive, at most JOIN_EARLY_MAX_CALLS times
+    per plan. JOIN_EARLY_SIMILARITY is the share of argument words a task must
+    share with a finished one to count as its repeat in local mode.
+    """
+    mode = os.getenv("JOIN_EARLY_EXIT", "off")
+    if mode == "off":
+        return None
+    if mode not in ("local", "joiner"):
+        raise ValueError(f"JOIN_EARLY_EXIT must be off, local or joiner, not '{mode}'.")
+    return EarlyJoin(
+        joiner if mode == "joiner" else None,
+        int(os.getenv("JOIN_EARLY_MAX_CALLS", "2")),
+        float(os.getenv("JOIN_EARLY_SIMILARITY", "0.8")),
+    )
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID, uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel, Field
+
+from src.registry import ToolRegistry
+
+LEDGER_TAG_PREFIX = "ledger:"
+SECTIONS = ("system", "tool_descriptions", "history", "question", "observations", "other")
+# Share of a node's prompt above which a section is reported as bloat
+BLOAT_SHARE = 0.5
+# Nodes whose calls are numbered as one sequence of rounds within a query
+_ROUND_GROUPS = {"planner": "planning", "replanner": "planning"}
+
+
+def ledger_tag(node: str) -> str:
+    """Tag for an LLM runnable so the ledger attributes its calls to `node`."""
+    return f"{LEDGER_TAG_PREFIX}{node}"
+
+
+class LLMCallRecord(BaseModel):
+    """One model call: its tokens, latency and how many prompt characters each section used."""
+    query_id: str
+    thread_id: str = ""
+    node: str
+    round: int = Field(1, description="1 for the first call in the query, 2 for the second, ...; planner and replanner share one count.")
+    input_tokens: int
+    output_tokens: int
+    estimated: bool = Field(False, description="Token counts were estimated from characters; the provider reported no usage.")
+    latency_ms: float
+    sections: Dict[str, int]
+
+
+# --- Prompt analysis ---
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else json.dumps(message.content)
+
+
+def prompt_sections(messages: Sequence[BaseMessage], fragments: Sequence[str] = ()) -> Dict[str, int]:
+    """
+    Characters per prompt section. Earlier turns and compacted history count as
+    history, tool results and tool calls of the current turn as observations,
+    and tool catalog entries found in system messages as tool descriptions.
+    """
+    sections = dict.fromkeys(SECTIONS, 0)
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+    for i, message in enumerate(messages):
+        text = _text(message)
+        if isinstance(message, SystemMessage) and message.additional_kwargs.get("history_context"):
+            sections["history"] += len(text)
+        elif isinstance(message, SystemMessage):
+            catalog = sum(len(fragment) for fragment in fragments if fragment in text)
+            sections["tool_descriptions"] += catalog
+            sections["system"] += len(text) - catalog
+        elif i < last_human:
+            sections["history"] += len(text)
+        elif i == last_human:
+            sections["question"] += len(text)
+        elif isinstance(message, ToolMessage) or (isinstance(message, AIMessage) and message.tool_calls):
+            sections["observations"] += len(text) + sum(len(json.dumps(c["args"])) for c in getattr(message, "tool_calls", []))
+        else:
+            sections["other"] += len(text)
+    return sections
+
+
+# --- Collection ---
+class TokenLedgerHandler(BaseCallbackHandler):
+    """
+    Collects a record for every model call of one agent turn. Calls are attributed
+    to the node named by their `ledger:` tag, or else to the graph node they ran in.
+    """
+    def __init__(self, thread_id: str = "", registry: Optional[ToolRegistry] = None):
+        self.query_id = str(uuid4())
+        self.thread_id = thread_id
+        self.registry = registry
+        self.records: List[LLMCallRecord] = []
+        self._lock = threading.Lock()
+        self._started: Dict[UUID, tuple] = {}
+        self._rounds: Dict[str, int] = defaultdict(int)
+
+    def _node(self, tags: Optional[List[str]], metadata: Optional[Dict[str, Any]]) -> str:
+        for tag in reversed(tags or []):
+            if tag.startswith(LEDGER_TAG_PREFIX):
+                return tag[len(LEDGER_TAG_PREFIX):]
+        return (metadata or {}).get("langgraph_node", "other")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, metadata=None, **kwargs):
+        fragments = self.registry.fragments() if self.registry is not None else ()
+        sections = prompt_sections(messages[0], fragments)
+        self._started[run_id] = (self._node(tags, metadata), sections, time.perf_counter())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, metadata=None, **kwargs):
+        sections = dict.fromkeys(SECTIONS, 0)
+        sections["question"] = sum(len(p) for p in prompts)
+        self._started[run_id] = (self._node(tags, metadata), sections, time.perf_counter())
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        node, sections, start = started
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        if generation is not None and (generation.generation_info or {}).get("cached"):
+            # Answered from the completion cache; no tokens were spent
+            return
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            input_tokens, output_tokens, estimated = usage["input_tokens"], usage["output_tokens"], False
+        else:
+            # Roughly four characters per token when the provider does not report usage
+            output_chars = len(generation.text) if generation is not None else 0
+            input_tokens, output_tokens, estimated = sum(sections.values()) // 4, output_chars // 4, True
+        group = _ROUND_GROUPS.get(node, node)
+        with self._lock:
+            self._rounds[group] += 1
+            self.records.append(LLMCallRecord(
+                query_id=self.query_id,
+                thread_id=self.thread_id,
+                node=node,
+                round=self._rounds[group],
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                estimated=estimated,
+                latency_ms=(time.perf_counter() - start) * 1000,
+                sections=sections,
+            ))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+
+# --- Storage ---
+class TokenLedger:
+    """SQLite store of LLM call records, one row per call, opened on first use."""
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """The store's connection, opened and set up on the first call. Holds the lock."""
+        if self.conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_calls ("
+                    "query_id TEXT NOT NULL, thread_id TEXT, node TEXT NOT NULL, round INTEGER NOT NULL, "
+                    "input_tokens INTEGER NOT NULL, output_tokens INTEGER NOT NULL, estimated INTEGER NOT NULL, "
+                    "latency_ms REAL NOT NULL, sections TEXT NOT NULL, recorded REAL NOT NULL)"
+                )
+            self.conn = conn
+        return self.conn
+
+    def add(self, records: Sequence[LLMCallRecord]) -> None:
+        now = time.time()
+        with self.lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (r.query_id, r.thread_id, r.node, r.round, r.input_tokens, r.output_tokens,
+                         int(r.estimated), r.latency_ms, json.dumps(r.sections), now)
+                        for r in records
+                    ],
+                )
+
+    def load(self, since: Optional[float] = None) -> List[LLMCallRecord]:
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT query_id, thread_id, node, round, input_tokens, output_tokens, estimated, latency_ms, sections "
+                "FROM llm_calls WHERE recorded >= ? ORDER BY recorded",
+                (since or 0,),
+            ).fetchall()
+        return [
+            LLMCallRecord(
+                query_id=row[0], thread_id=row[1] or "", node=row[2], round=row[3], input_tokens=row[4],
+                output_tokens=row[5], estimated=bool(row[6]), latency_ms=row[7], sections=json.loads(row[8]),
+            )
+            for row in rows
+        ]
+
+
+def create_token_ledger() -> Optional[TokenLedger]:
+    """The process-wide ledger at TOKEN_LEDGER_DB; set it to an empty string to disable recording."""
+    path = os.getenv("TOKEN_LEDGER_DB", "token_ledger.sqlite")
+    return TokenLedger(path) if path else None
+
+
+# --- Report ---
+def summarize(records: Sequence[LLMCallRecord]) -> str:
+    """Per-node usage, prompt composition with bloated sections flagged, and prompt growth across rounds."""
+    if not records:
+        return "No LLM calls recorded."
+    by_node: Dict[str, List[LLMCallRecord]] = defaultdict(list)
+    for record in records:
+        by_node[record.node].append(record)
+    total_input = sum(r.input_tokens for r in records) or 1
+    queries = len({r.query_id for r in records})
+
+    lines = [f"{len(records)} LLM calls over {queries} queries", ""]
+    lines.append(f"{'node':<14} {'calls':>6} {'in tok':>9} {'out tok':>8} {'share':>6} {'avg in':>8} {'p50 ms':>8}  largest sections")
+    for node, calls in sorted(by_node.items(), key=lambda item: -sum(r.input_tokens for r in item[1])):
+        node_input = sum(r.input_tokens for r in calls)
+        chars = {s: sum(r.sections.get(s, 0) for r in calls) for s in SECTIONS}
+        total_chars = sum(chars.values()) or 1
+        largest = sorted(((c / total_chars, s) for s, c in chars.items() if c), reverse=True)[:3]
+        composition = ", ".join(f"{s} {share:.0%}{' (bloat)' if share > BLOAT_SHARE else ''}" for share, s in largest)
+        lines.append(
+            f"{node:<14} {len(calls):>6} {node_input:>9} {sum(r.output_tokens for r in calls):>8} "
+            f"{node_input / total_input:>6.0%} {node_input / len(calls):>8.0f} "
+            f"{statistics.median(r.latency_ms for r in calls):>8.0f}  {composition}"
+        )
+
+    growth = []
+    by_group: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        by_group[_ROUND_GROUPS.get(record.node, record.node)][record.round].append(record.input_tokens)
+    for group, rounds in sorted(by_group.items()):
+        if len(rounds) > 1:
+            averages = [statistics.mean(rounds[i]) for i in sorted(rounds)]
+            steps = " -> ".join(f"{a:.0f}" for a in averages)
+            growth.append(f"{group:<14} avg input tokens by round: {steps} ({averages[-1] / averages[0] - 1:+.0%})")
+    if growth:
+        lines += ["", "Prompt growth across rounds within a query:"] + growth
+    if any(r.estimated for r in records):
+        lines += ["", "Some token counts were estimated from prompt characters."]
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize the LLM token ledger.")
+    parser.add_argument("--db", default=os.getenv("TOKEN_LEDGER_DB", "token_ledger.sqlite"))
+    parser.add_argument("--hours", type=float, help="Only include calls from the last N hours.")
+    args = parser.parse_args(argv)
+    since = time.time() - args.hours * 3600 if args.hours else None
+    print(summarize(TokenLedger(args.db).load(since)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core._api import suppress_langchain_beta_warning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessageChunk, BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# Nodes whose models are cached unless LLM_CACHE_NODES says otherwise; the
+# response node samples at a high temperature, so replaying it would pin one reply
+DEFAULT_NODES = ("router", "planner", "replanner", "joiner", "math")
+
+
+class CompletionStore:
+    """
+    SQLite table of model completions keyed on the exact prompt and model
+    configuration, bounded to `max_entries` by evicting the least recently used.
+    Hits and misses are counted per node in the same file.
+    """
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, node TEXT NOT NULL, generations TEXT NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS lookups (node TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)"
+            )
+            self._count = self.conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    def get(self, node: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT generations FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE completions SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.conn.execute(
+                "INSERT INTO lookups VALUES (?, ?, ?) ON CONFLICT (node) DO UPDATE "
+                "SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                (node, int(row is not None), int(row is None)),
+            )
+        return row[0] if row else None
+
+    def put(self, node: str, key: str, generations: str) -> None:
+        now = time.time()
+        with self.lock, self.conn:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO completions VALUES (?, ?, ?, ?, ?, 0)", (key, node, generations, now, now)
+            ).rowcount
+            self._count += inserted
+            if self._count > self.max_entries:
+                # Evict a tenth at a time so inserts near the bound do not each pay for a delete
+                excess = self._count - self.max_entries + self.max_entries // 10
+                self.conn.execute(
+                    "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._count = self.conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def clear(self, node: Optional[str] = None) -> None:
+        with self.lock, self.conn:
+            if node is None:
+                self.conn.execute("DELETE FROM completions")
+            else:
+                self.conn.execute("DELETE FROM completions WHERE node = ?", (node,))
+            self._count = self.conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Lookups, hits and stored entries per node."""
+        with self.lock:
+            lookups = {row[0]: row[1:] for row in self.conn.execute("SELECT node, hits, misses FROM lookups")}
+            entries = dict(self.conn.execute("SELECT node, COUNT(*) FROM completions GROUP BY node").fetchall())
+        rows = []
+        for node in sorted(set(lookups) | set(entries)):
+            hits, misses = lookups.get(node, (0, 0))
+            rows.append({
+                "node": node,
+                "lookups": hits + misses,
+                "hits": hits,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "entries": entries.get(node, 0),
+            })
+        return rows
+
+
+class CompletionCache(BaseCache):
+    """
+    LangChain cache for the models of one node, passed as a chat model's `cache`.
+    The model supplies the key: its serialized prompt messages and a string of its
+    name, temperature and bound arguments, which include any structured-output schema.
+    """
+    def __init__(self, store: CompletionStore, node: str):
+        self.store = store
+        self.node = node
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        generations = self.store.get(self.node, CompletionStore.key(prompt, llm_string))
+        if generations is None:
+            return None
+        with suppress_langchain_beta_warning():
+            cached = loads(generations, allowed_objects="core")
+        for generation in cached:
+            generation.generation_info = {**(generation.generation_info or {}), "cached": True}
+        return cached
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.store.put(self.node, CompletionStore.key(prompt, llm_string), dumps(list(return_val)))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear(self.node)
+
+
+def create_completion_store() -> Optional[CompletionStore]:
+    """The process-wide store at LLM_CACHE_DB; set it to an empty string to disable caching."""
+    path = os.getenv("LLM_CACHE_DB", "llm_cache.sqlite")
+    return CompletionStore(path, int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))) if path else None
+
+
+_enabled_nodes = {node.strip() for node in os.getenv("LLM_CACHE_NODES", ",".join(DEFAULT_NODES)).split(",") if node.strip()}
+# Opened by the first cache_for call, so importing this module creates no files
+_completion_store: Optional[CompletionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_completion_store() -> Optional[CompletionStore]:
+    """The process-wide store, opened on first use; None when caching is off."""
+    global _completion_store
+    with _store_lock:
+        if _completion_store is None:
+            _completion_store = create_completion_store()
+        return _completion_store
+
+
+def cache_for(node: str) -> Optional[CompletionCache]:
+    """
+    The completion cache for a node's model, or None when caching is off or the
+    node is not listed in LLM_CACHE_NODES (default: all but response).
+    """
+    if node not in _enabled_nodes:
+        return None
+    store = get_completion_store()
+    return CompletionCache(store, node) if store is not None else None
+
+
+# --- Streaming ---
+class CachedStreamingModel(Runnable[LanguageModelInput, BaseMessage]):
+    """
+    Chat models only consult their cache when invoked. This wrapper gives streamed
+    calls the same cache: a hit is replayed line by line as message chunks, so
+    consumers that act on each line (the plan parser) still work incrementally,
+    and a miss is streamed from the model and stored once complete.
+    """
+    def __init__(self, llm: BaseChatModel):
+        self.llm = llm
+        self.cache: CompletionCache = llm.cache
+
+    def invoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        return self.llm.invoke(input, config, **kwargs)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        # Structured calls are invoked, where the model applies its cache itself
+        return self.llm.with_structured_output(schema, **kwargs)
+
+    def _key(self, input: LanguageModelInput, kwargs: Dict[str, Any]) -> Tuple[str, str]:
+        # Same key the model uses for invoke, so both paths share entries
+        messages = self.llm._convert_input(input).to_messages()
+        messages = [m.model_copy(update={"id": None}) if m.id is not None else m for m in messages]
+        return dumps(messages), self.llm._get_llm_string(stop=kwargs.get("stop"), **{k: v for k, v in kwargs.items() if k != "stop"})
+
+    def stream(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[BaseMessage]:
+        prompt, llm_string = self._key(input, kwargs)
+        cached = self.cache.lookup(prompt, llm_string)
+        if cached:
+            for line in cached[0].text.splitlines(keepends=True):
+                yield AIMessageChunk(content=line)
+            return
+        full = None
+        for chunk in self.llm.stream(input, config, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if full is not None:
+            self.cache.update(prompt, llm_string, [ChatGeneration(message=message_chunk_to_message(full))])
+
+
+def streaming_with_cache(llm: BaseChatModel) -> Runnable:
+    """`llm` with its completion cache applied to streamed calls too; unchanged if it has none."""
+    return CachedStreamingModel(llm) if isinstance(llm.cache, CompletionCache) else llm
+
+
+# --- Report ---
+def format_report(rows: Sequence[Dict[str, Any]]) -> str:
+    if not rows:
+        return "No cached completions."
+    lines = [f"{'node':<12} {'lookups':>8} {'hits':>8} {'hit rate':>9} {'entries':>8}"]
+    for row in rows:
+        lines.append(f"{row['node']:<12} {row['lookups']:>8} {row['hits']:>8} {row['hit_rate']:>9.0%} {row['entries']:>8}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Report or clear the LLM completion cache.")
+    parser.add_argument("--db", default=os.getenv("LLM_CACHE_DB", "llm_cache.sqlite"))
+    parser.add_argument("--clear", metavar="NODE", nargs="?", const="", help="Drop cached completions (of one node if given).")
+    args = parser.parse_args(argv)
+    store = CompletionStore(args.db)
+    if args.clear is not None:
+        store.clear(args.clear or None)
+    print(format_report(store.report()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# --- On-disk format ---
+# A single little-endian file: a fixed header followed by 8-byte aligned sections.
+#   term table     sorted by term bytes, one TERM_DTYPE row per term
+#   term blob      utf-8 term strings referenced by the term table
+#   postings       per term: uint32 passage ids[df] then uint32 term frequencies[df]
+#   doc lengths    uint32[n_passages], in tokens
+#   text offsets   uint64[n_passages + 1] into the text blob
+#   sources        uint32[n_passages], index into the sources list
+#   text blob      utf-8 passage text
+#   sources json   list of document paths
+MAGIC = b"LCIX"
+VERSION = 1
+HEADER = struct.Struct("<4sIIId8Q")
+TERM_DTYPE = np.dtype([("str_off", "<u4"), ("str_len", "<u4"), ("df", "<u4"), ("pad", "<u4"), ("post_off", "<u8")])
+
+DOCUMENT_EXTENSIONS = (".txt", ".md", ".rst")
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.casefold())
+
+
+def _iter_documents(corpus_dir: str) -> Iterator[str]:
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def _iter_passages(path: str, passage_words: int) -> Iterator[str]:
+    """Streams a document as passages of roughly `passage_words` words, preferring paragraph breaks."""
+    lines: List[str] = []
+    words = 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped:
+                if words >= passage_words // 2:
+                    yield " ".join(lines)
+                    lines, words = [], 0
+                continue
+            lines.append(stripped)
+            words += len(stripped.split())
+            if words >= passage_words:
+                yield " ".join(lines)
+                lines, words = [], 0
+    if lines:
+        yield " ".join(lines)
+
+
+def _pad(f) -> int:
+    offset = f.tell()
+    if offset % 8:
+        f.write(b"\0" * (8 - offset % 8))
+    return f.tell()
+
+
+def build_index(corpus_dir: str, index_path: str, passage_words: int = 120) -> Dict[str, int]:
+    """
+    Builds a BM25 index over the documents in `corpus_dir`.
+    Documents are read one passage at a time and passage text is spooled to a
+    temporary file, so only the postings are held in memory.
+    """
+    postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    doc_lengths: List[int] = []
+    text_offsets: List[int] = [0]
+    passage_sources: List[int] = []
+    sources: List[str] = []
+
+    with tempfile.TemporaryFile() as text_spool:
+        for path in _iter_documents(corpus_dir):
+            source_id = len(sources)
+            sources.append(os.path.relpath(path, corpus_dir))
+            for passage in _iter_passages(path, passage_words):
+                tokens = tokenize(passage)
+                if not tokens:
+                    continue
+                passage_id = len(doc_lengths)
+                counts: Dict[str, int] = defaultdict(int)
+                for token in tokens:
+                    counts[token] += 1
+                for token, tf in counts.items():
+                    postings[token].append((passage_id, tf))
+                doc_lengths.append(len(tokens))
+                passage_sources.append(source_id)
+                text_offsets.append(text_offsets[-1] + text_spool.write(passage.encode("utf-8")))
+
+        terms = sorted(postings, key=lambda t: t.encode("utf-8"))
+        n_passages = len(doc_lengths)
+        avgdl = sum(doc_lengths) / n_passages if n_passages else 0.0
+
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+
+            term_table = np.zeros(len(terms), dtype=TERM_DTYPE)
+            term_blob = bytearray()
+            for i, term in enumerate(terms):
+                encoded = term.encode("utf-8")
+                term_table[i]["str_off"] = len(term_blob)
+                term_table[i]["str_len"] = len(encoded)
+                term_table[i]["df"] = len(postings[term])
+                term_blob += encoded
+
+            # Postings are written first so their offsets can be recorded in the term table
+            postings_off = _pad(f)
+            for i, term in enumerate(terms):
+                term_table[i]["post_off"] = f.tell()
+                ids, tfs = zip(*postings[term])
+                f.write(np.asarray(ids, dtype="<u4").tobytes())
+                f.write(np.asarray(tfs, dtype="<u4").tobytes())
+            postings.clear()
+
+            table_off = _pad(f)
+            f.write(term_table.tobytes())
+            blob_off = _pad(f)
+            f.write(bytes(term_blob))
+            lengths_off = _pad(f)
+            f.write(np.asarray(doc_lengths, dtype="<u4").tobytes())
+            offsets_off = _pad(f)
+            f.write(np.asarray(text_offsets, dtype="<u8").tobytes())
+            sources_off = _pad(f)
+            f.write(np.asarray(passage_sources, dtype="<u4").tobytes())
+            text_off = _pad(f)
+            text_spool.seek(0)
+            while chunk := text_spool.read(1 << 20):
+                f.write(chunk)
+            json_off = _pad(f)
+            f.write(json.dumps(sources).encode("utf-8"))
+
+            f.seek(0)
+            f.write(HEADER.pack(
+                MAGIC, VERSION, n_passages, len(terms), avgdl,
+                table_off, blob_off, postings_off, lengths_off, offsets_off, sources_off, text_off, json_off,
+            ))
+        os.replace(tmp_path, index_path)
+
+    return {"documents": len(sources), "passages": n_passages, "terms": len(terms)}
+
+
+class LocalIndex:
+    """
+    Read-only BM25 index over a memory-mapped index file.
+    Opening only maps the file and reads the header; term lookups binary-search
+    the mapped term table and score postings directly from the mapping.
+    """
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.n_passages, self.n_terms, self.avgdl,
+         table_off, self._blob_off, _, lengths_off, offsets_off, sources_off,
+         self._text_off, self._json_off) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a local index (version {VERSION}).")
+        self._terms = np.frombuffer(self._mm, dtype=TERM_DTYPE, count=self.n_terms, offset=table_off)
+        self._doc_lengths = np.frombuffer(self._mm, dtype="<u4", count=self.n_passages, offset=lengths_off)
+        self._text_offsets = np.frombuffer(self._mm, dtype="<u8", count=self.n_passages + 1, offset=offsets_off)
+        self._passage_sources = np.frombuffer(self._mm, dtype="<u4", count=self.n_passages, offset=sources_off)
+        self._sources: Optional[List[str]] = None
+
+    def _term_bytes(self, i: int) -> bytes:
+        start = self._blob_off + int(self._terms[i]["str_off"])
+        return self._mm[start:start + int(self._terms[i]["str_len"])]
+
+    def _lookup(self, term: str) -> Optional[int]:
+        target = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self._term_bytes(lo) == target:
+            return lo
+        return None
+
+    def _postings(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        df, offset = int(self._terms[i]["df"]), int(self._terms[i]["post_off"])
+        ids = np.frombuffer(self._mm, dtype="<u4", count=df, offset=offset)
+        tfs = np.frombuffer(self._mm, dtype="<u4", count=df, offset=offset + 4 * df)
+        return ids, tfs
+
+    def passage(self, passage_id: int) -> str:
+        start = self._text_off + int(self._text_offsets[passage_id])
+        end = self._text_off + int(self._text_offsets[passage_id + 1])
+        return self._mm[start:end].decode("utf-8")
+
+    def source(self, passage_id: int) -> str:
+        if self._sources is None:
+            self._sources = json.loads(self._mm[self._json_off:].decode("utf-8"))
+        return self._sources[int(self._passage_sources[passage_id])]
+
+    def query(self, text: str, k: int = 3) -> List[Tuple[int, float]]:
+        """Returns the ids and BM25 scores of the top `k` passages."""
+        if not self.n_passages:
+            return []
+        candidates, contributions = [], []
+        for term in set(tokenize(text)):
+            i = self._lookup(term)
+            if i is None:
+                continue
+            ids, tfs = self._postings(i)
+            idf = math.log(1 + (self.n_passages - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[ids] / self.avgdl)
+            candidates.append(ids)
+            contributions.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not candidates:
+            return []
+        ids = np.concatenate(candidates)
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(contributions))
+        top = np.argsort(-totals, kind="stable")[:k] if len(totals) <= k else np.argpartition(-totals, k)[:k]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(int(unique_ids[j]), float(totals[j])) for j in top]
+
+    def search(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Top-`k` passages for `query`, shaped like web search results."""
+        return [
+            {"source": self.source(passage_id), "content": self.passage(passage_id), "score": round(score, 4)}
+            for passage_id, score in self.query(query, k)
+        ]
+
+    def close(self) -> None:
+        self._terms = self._doc_lengths = self._text_offsets = self._passage_sources = None
+        self._mm.close()
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local document index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Index a directory of documents.")
+    build.add_argument("corpus_dir", type=str)
+    build.add_argument("--index_path", type=str, default=os.getenv("LOCAL_INDEX_PATH", "local_index.bin"))
+    build.add_argument("--passage_words", type=int, default=120)
+    query = subparsers.add_parser("query", help="Run a query against an existing index.")
+    query.add_argument("text", type=str)
+    query.add_argument("--index_path", type=str, default=os.getenv("LOCAL_INDEX_PATH", "local_index.bin"))
+    query.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        stats = build_index(args.corpus_dir, args.index_path, args.passage_words)
+        print(f"Indexed {stats['documents']} documents into {stats['passages']} passages ({stats['terms']} terms).")
+    else:
+        index = LocalIndex(args.index_path)
+        start = time.perf_counter()
+        results = index.search(args.text, args.k)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for result in results:
+            print(f"[{result['score']}] {result['source']}: {result['content'][:200]}")
+        print(f"{len(results)} results in {elapsed_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
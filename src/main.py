@@ -1,13 +1,44 @@
 import os
 import argparse
 from langchain_core.messages import HumanMessage
-from src.agent import invoke_agent
-from src.scheduler import schedule_gmeet
+from src.agent import stream_agent
+from src.memory import new_thread_id
+from src import profiler
+from src.fair_queue import fair_scheduler, format_report as format_queue_report
+from src.models import format_model_stats, model_stats
+from src.scheduler import create_scheduler, schedule_agent_query, schedule_gmeet
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+def render_turn(events):
+    """Prints the progress events and answer tokens of one turn as they arrive."""
+    streaming = False
+    for event in events:
+        if event["type"] == "route":
+            print(f"  -> routed to {event['destination']}")
+        elif event["type"] == "task_start":
+            print(f"  [{event['idx']}] {event['tool']} started")
+        elif event["type"] == "task_end":
+            status = "cancelled" if event.get("cancelled") else "failed" if event["error"] else "finished"
+            print(f"  [{event['idx']}] {event['tool']} {status}")
+        elif event["type"] == "early_join":
+            print(f"  (answer ready early: {event['cancelled']} tasks cancelled, ~{event['saved_ms']:.0f} ms saved)")
+        elif event["type"] == "cache":
+            print(f"  (answered from cache, {event['age']:.0f}s old)")
+        elif event["type"] == "token":
+            if not streaming:
+                print("Agent: ", end="", flush=True)
+                streaming = True
+            print(event["text"], end="", flush=True)
+        elif event["type"] == "final":
+            if streaming:
+                print()
+            else:
+                # Fall back to the complete answer if the model did not stream it
+                print(f"Agent: {event['text']}")
+
 def main():
     # Configure LangSmith tracing
     os.environ["LANGCHAIN_TRACING_V2"] = os.getenv("LANGCHAIN_TRACING_V2", "false")
@@ -17,25 +48,55 @@ def main():
     parser = argparse.ArgumentParser(description="LLMCompiler Agent")
     parser.add_argument("--meet_url", type=str, help="The URL of the Google Meet to join.")
     parser.add_argument("--join_time", type=str, help="The time to join the meet in HH:MM format.")
+    parser.add_argument("--thread_id", type=str, help="Resume the conversation with this ID.")
+    parser.add_argument("--schedule_query", type=str, help="A question for the agent to answer on the --cron schedule.")
+    parser.add_argument("--cron", type=str, help="Cron expression for --schedule_query, e.g. '0 9 * * 1-5'.")
+    parser.add_argument("--daemon", action="store_true", help="Only run scheduled jobs, without the interactive prompt.")
+    parser.add_argument("--profile", nargs="?", const="profiles", help="Profile each turn; results go to this directory (default: profiles).")
+    parser.add_argument("--model_stats", action="store_true", help="Print per-tier model latency and success rates on exit.")
+    parser.add_argument("--queue_stats", action="store_true", help="Print tool queueing delay per conversation on exit.")
     args = parser.parse_args()
+    if bool(args.schedule_query) != bool(args.cron):
+        parser.error("--schedule_query and --cron must be given together.")
+    if bool(args.meet_url) != bool(args.join_time):
+        parser.error("--meet_url and --join_time must be given together.")
+
+    if args.profile:
+        profiler.enable(args.profile)
+
+    # Scheduled jobs run in the background, alongside the interactive agent
+    scheduler = create_scheduler()
+    scheduler.start()
 
     # Logic for scheduling a meeting with hardcoded cookies
-    if args.meet_url and args.join_time:
-        schedule_gmeet(meet_url=args.meet_url, join_time=args.join_time)
+    if args.meet_url:
+        schedule_gmeet(scheduler, meet_url=args.meet_url, join_time=args.join_time)
+    if args.schedule_query:
+        schedule_agent_query(scheduler, args.schedule_query, cron=args.cron)
+
+    # Scheduling a meeting keeps the process waiting to join it, as it always has
+    if args.daemon or args.meet_url:
+        print(f"Scheduler is running {len(scheduler.jobs())} job(s). Press Ctrl+C to stop.")
+        scheduler.run_forever()
     else:
         # Fallback to the interactive agent mode
+        thread_id = args.thread_id or new_thread_id()
         print("LLMCompiler Agent Ready!")
+        print(f"Conversation ID: {thread_id} (pass --thread_id to resume)")
         print("Type 'exit' to quit.")
 
         while True:
             user_input = input("You: ")
             if user_input.lower() == 'exit':
+                scheduler.shutdown(wait=False)
+                if args.model_stats:
+                    print(format_model_stats(model_stats.report()))
+                if args.queue_stats and fair_scheduler is not None:
+                    print(format_queue_report(fair_scheduler.report()))
                 break
 
             print(f"Agent is thinking about: '{user_input}'...")
-            
-            response = invoke_agent(user_input)
-            print(f"Agent: {response}")
+            render_turn(stream_agent(user_input, thread_id=thread_id))
 
 if __name__ == "__main__":
     main()
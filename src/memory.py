@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from pydantic import BaseModel, Field
+
+from src.profiler import profiled
+
+# Marks the synthetic message that carries tool outputs from earlier turns.
+HISTORY_CONTEXT_KEY = "history_context"
+
+_CONTEXT_HEADER = (
+    "Results already retrieved earlier in this conversation. "
+    "Reuse them instead of calling the same tool again:"
+)
+
+
+class HistoryPolicy(BaseModel):
+    """Bounds on what a conversation stores and replays between turns."""
+    max_turns: int = Field(4, description="Previous question/answer pairs replayed verbatim.")
+    max_observations: int = Field(8, description="Previous tool outputs kept as reusable context.")
+    max_observation_chars: int = Field(600, description="Characters kept from each previous tool output.")
+    keep_checkpoints: int = Field(4, description="Checkpoints retained per conversation in the store.")
+
+
+def _split_turns(messages: Sequence[BaseMessage]) -> Tuple[Optional[SystemMessage], List[List[BaseMessage]]]:
+    """Split a message history into the carried-over context message and per-turn groups."""
+    context = None
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, SystemMessage) and message.additional_kwargs.get(HISTORY_CONTEXT_KEY):
+            context = message
+        elif isinstance(message, HumanMessage):
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+    return context, turns
+
+
+def _observation_key(observation: Dict[str, Any]) -> str:
+    return f"{observation['tool']}:{json.dumps(observation['args'], sort_keys=True, default=str)}"
+
+
+def _render_context(observations: List[Dict[str, Any]]) -> SystemMessage:
+    lines = [_CONTEXT_HEADER]
+    for observation in observations:
+        args = ", ".join(f"{k}={v!r}" for k, v in observation["args"].items())
+        lines.append(f"- {observation['tool']}({args}) -> {observation['content']}")
+    return SystemMessage(
+        content="\n".join(lines),
+        additional_kwargs={HISTORY_CONTEXT_KEY: True, "observations": observations},
+    )
+
+
+def compact_history(messages: Sequence[BaseMessage], policy: HistoryPolicy) -> List[BaseMessage]:
+    """
+    Rebuilds the history that is carried into a new turn.
+    Earlier turns are reduced to their question and final answer, and their tool outputs
+    are folded into a single context message, so the stored state never grows past the policy.
+    """
+    if not messages:
+        return []
+    *previous, question = messages
+    context, turns = _split_turns(previous)
+
+    observations: Dict[str, Dict[str, Any]] = {}
+    if context is not None:
+        for observation in context.additional_kwargs.get("observations", []):
+            observations[_observation_key(observation)] = observation
+
+    replayed: List[List[BaseMessage]] = []
+    for turn in turns:
+        for message in turn:
+            if isinstance(message, ToolMessage) and not str(message.content).startswith("Error:"):
+                observation = {
+                    "tool": message.name,
+                    "args": message.additional_kwargs.get("args", {}),
+                    "content": str(message.content)[: policy.max_observation_chars],
+                }
+                key = _observation_key(observation)
+                # Re-insert so the newest observations end up last
+                observations.pop(key, None)
+                observations[key] = observation
+        answers = [m for m in turn if isinstance(m, AIMessage) and not m.tool_calls]
+        if answers:
+            replayed.append([turn[0], answers[-1]])
+
+    compacted: List[BaseMessage] = []
+    kept_observations = list(observations.values())[-policy.max_observations:] if policy.max_observations else []
+    if kept_observations:
+        compacted.append(_render_context(kept_observations))
+    for pair in replayed[-policy.max_turns:] if policy.max_turns else []:
+        compacted.extend(pair)
+    compacted.append(question)
+    return compacted
+
+
+def create_history_node(policy: HistoryPolicy):
+    @profiled("history")
+    def history_node(state: Dict[str, List[BaseMessage]]) -> Dict[str, List[BaseMessage]]:
+        """Replaces the stored history with its compacted form before the turn starts."""
+        messages = state["messages"]
+        if len(messages) <= 1:
+            return {"messages": []}
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *compact_history(messages, policy)]}
+
+    return history_node
+
+
+# --- Checkpointer ---
+class _LazySqliteSaver(SqliteSaver):
+    """A SqliteSaver that connects to its database on first use instead of when it is built."""
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._connect_lock = threading.Lock()
+        super().__init__(None)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        with self._connect_lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            return self._conn
+
+    @conn.setter
+    def conn(self, conn: Optional[sqlite3.Connection]) -> None:
+        self._conn = conn
+
+
+def create_checkpointer(path: Optional[str] = None) -> SqliteSaver:
+    """
+    The SQLite checkpoint store shared by every conversation in this process.
+    The database is opened, and its tables created, by the first checkpoint read or write.
+    """
+    return _LazySqliteSaver(path or os.getenv("AGENT_MEMORY_DB", "agent_memory.sqlite"))
+
+
+def prune_checkpoints(checkpointer: SqliteSaver, thread_id: str, keep: int) -> None:
+    """Drops all but the newest `keep` checkpoints of a conversation."""
+    with checkpointer.cursor() as cur:
+        cur.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '' "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, max(keep, 1) - 1),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return
+        cur.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, row[0]))
+        cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, row[0]))
+
+
+def new_thread_id() -> str:
+    return uuid4().hex
+
+
+def thread_config(thread_id: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Returns a copy of `config` keyed to the given conversation."""
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), "thread_id": thread_id}
+    return config
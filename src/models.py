@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel, Field
+
+from src.llm_cache import CompletionCache, cache_for, streaming_with_cache
+
+NODES = ("router", "planner", "replanner", "joiner", "response", "math")
+
+
+class ModelSpec(BaseModel):
+    """One model tier of a node."""
+    model: str = "gemini-2.0-flash"
+    provider: str = "google"
+    temperature: Optional[float] = Field(None, description="Overrides the node's temperature for this tier.")
+    timeout: Optional[float] = Field(None, description="Seconds before a call fails over to the next tier.")
+    max_retries: int = Field(2, description="Provider retries before failing over; keep low when a fallback exists.")
+    requests_per_second: Optional[float] = Field(None, description="Client-side rate limit for this tier.")
+
+
+class NodeModels(BaseModel):
+    """The models a node tries, in order: the first tier, then its fallbacks."""
+    temperature: float = 0.0
+    tiers: List[ModelSpec] = Field(default_factory=lambda: [ModelSpec()])
+    skip_saturated: bool = Field(
+        False, description="Start from a later tier while an earlier tier's rate limiter has no capacity left."
+    )
+
+
+# Every node on the same model, as before tiering; a config file overrides nodes individually
+DEFAULT_MODELS: Dict[str, NodeModels] = {
+    "router": NodeModels(temperature=0),
+    "planner": NodeModels(temperature=0.2),
+    "replanner": NodeModels(temperature=0.2),
+    "joiner": NodeModels(temperature=0),  # Use a more deterministic LLM for joiner
+    "response": NodeModels(temperature=0.7),
+    "math": NodeModels(temperature=0),
+}
+
+
+def load_model_config(path: Optional[str] = None) -> Dict[str, NodeModels]:
+    """
+    Reads per-node models from a JSON file (AGENT_MODELS_CONFIG, default
+    models.json; missing means defaults), e.g.
+    {"router": {"tiers": [{"model": "gemini-2.0-flash-lite", "timeout": 5}, {"model": "gemini-2.0-flash"}]}}
+    Nodes not in the file keep their defaults.
+    """
+    path = path or os.getenv("AGENT_MODELS_CONFIG", "models.json")
+    config = dict(DEFAULT_MODELS)
+    if not os.path.exists(path):
+        return config
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    unknown = set(overrides) - set(NODES)
+    if unknown:
+        raise ValueError(f"Unknown nodes in {path}: {', '.join(sorted(unknown))}. Expected some of {', '.join(NODES)}.")
+    for node, settings in overrides.items():
+        config[node] = NodeModels(**{"temperature": DEFAULT_MODELS[node].temperature, **settings})
+    return config
+
+
+# --- Providers ---
+ProviderFactory = Callable[[ModelSpec, float, Optional[CompletionCache], Optional[InMemoryRateLimiter]], BaseChatModel]
+_providers: Dict[str, ProviderFactory] = {}
+
+
+def register_provider(name: str, factory: ProviderFactory) -> None:
+    """Makes `provider: name` usable in the model config; the factory builds one chat model."""
+    _providers[name] = factory
+
+
+def _google(spec: ModelSpec, temperature: float, cache, rate_limiter) -> BaseChatModel:
+    return ChatGoogleGenerativeAI(
+        model=spec.model,
+        temperature=temperature,
+        timeout=spec.timeout,
+        max_retries=spec.max_retries,
+        cache=cache,
+        rate_limiter=rate_limiter,
+    )
+
+
+register_provider("google", _google)
+
+
+# --- Stats ---
+class ModelStats:
+    """Latency and outcome of every call, per node and model tier, for this process."""
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._calls: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0, 0])
+        self._latencies: Dict[tuple, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, node: str, model: str, latency: float, ok: bool, skipped: bool = False) -> None:
+        with self._lock:
+            counts = self._calls[(node, model)]
+            if skipped:
+                counts[2] += 1
+                return
+            counts[0] += 1
+            counts[1] += not ok
+            self._latencies[(node, model)].append(latency)
+
+    def report(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = []
+            for (node, model), (calls, failures, skipped) in sorted(self._calls.items()):
+                latencies = sorted(self._latencies[(node, model)])
+                rows.append({
+                    "node": node,
+                    "model": model,
+                    "calls": calls,
+                    "success_rate": (calls - failures) / calls if calls else 0.0,
+                    "skipped": skipped,
+                    "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+                    "p95_ms": latencies[round(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0.0,
+                })
+            return rows
+
+
+def format_model_stats(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "No model calls recorded."
+    lines = [f"{'node':<10} {'model':<28} {'calls':>6} {'ok':>6} {'skipped':>8} {'p50 ms':>8} {'p95 ms':>8}"]
+    for row in rows:
+        lines.append(
+            f"{row['node']:<10} {row['model']:<28} {row['calls']:>6} {row['success_rate']:>6.0%} "
+            f"{row['skipped']:>8} {row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f}"
+        )
+    return "\n".join(lines)
+
+
+model_stats = ModelStats()
+
+
+# --- Tiered models ---
+class Tier(NamedTuple):
+    name: str
+    model: Runnable
+    rate_limiter: Optional[InMemoryRateLimiter]
+
+
+def _saturated(limiter: Optional[InMemoryRateLimiter]) -> bool:
+    """Whether a call now would wait on the limiter; reads its bucket without taking a token."""
+    if limiter is None or limiter.last is None:
+        return False
+    refill = (time.monotonic() - limiter.last) * limiter.requests_per_second
+    return min(limiter.available_tokens + refill, limiter.max_bucket_size) < 1
+
+
+class TieredModel(Runnable[LanguageModelInput, Any]):
+    """
+    Calls a node's model tiers in order until one succeeds. Timeouts surface as
+    errors from the provider, so a slow tier fails over like a failing one. A
+    stream only fails over before its first chunk; after that the error is raised.
+    With `skip_saturated`, tiers whose rate limiter is out of capacity are passed
+    over while a later tier remains.
+    """
+    def __init__(self, node: str, tiers: List[Tier], skip_saturated: bool = False, stats: Optional[ModelStats] = None):
+        self.node = node
+        self.tiers = tiers
+        self.skip_saturated = skip_saturated
+        self.stats = stats if stats is not None else model_stats
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> "TieredModel":
+        return self.map_tiers(lambda model: model.with_structured_output(schema, **kwargs))
+
+    def map_tiers(self, fn: Callable[[Runnable], Runnable]) -> "TieredModel":
+        """The same tiers with `fn` applied to each tier's model."""
+        tiers = [tier._replace(model=fn(tier.model)) for tier in self.tiers]
+        return TieredModel(self.node, tiers, self.skip_saturated, self.stats)
+
+    def _candidates(self) -> List[Tier]:
+        if not self.skip_saturated:
+            return self.tiers
+        for i, tier in enumerate(self.tiers[:-1]):
+            if not _saturated(tier.rate_limiter):
+                return self.tiers[i:]
+            self.stats.record(self.node, tier.name, 0.0, True, skipped=True)
+        return self.tiers[-1:]
+
+    def _fall_back(self, tier: Tier, error: Exception) -> None:
+        print(f"{self.node} model {tier.name} failed ({type(error).__name__}: {error}); falling back.")
+
+    def invoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        candidates = self._candidates()
+        for i, tier in enumerate(candidates):
+            start = time.perf_counter()
+            try:
+                result = tier.model.invoke(input, config, **kwargs)
+            except Exception as e:
+                self.stats.record(self.node, tier.name, time.perf_counter() - start, False)
+                if i == len(candidates) - 1:
+                    raise
+                self._fall_back(tier, e)
+                continue
+            self.stats.record(self.node, tier.name, time.perf_counter() - start, True)
+            return result
+
+    def stream(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        candidates = self._candidates()
+        for i, tier in enumerate(candidates):
+            start, started = time.perf_counter(), False
+            try:
+                for chunk in tier.model.stream(input, config, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self.stats.record(self.node, tier.name, time.perf_counter() - start, False)
+                if started or i == len(candidates) - 1:
+                    raise
+                self._fall_back(tier, e)
+                continue
+            self.stats.record(self.node, tier.name, time.perf_counter() - start, True)
+            return
+
+
+def create_node_model(node: str, config: Optional[Dict[str, NodeModels]] = None) -> TieredModel:
+    """
+    The model for one agent node built from the model config, with the node's
+    completion cache on every tier (see src/llm_cache.py).
+    """
+    settings = (config or load_model_config())[node]
+    tiers = []
+    for spec in settings.tiers:
+        if spec.provider not in _providers:
+            raise ValueError(f"Unknown model provider '{spec.provider}' for node '{node}'.")
+        limiter = InMemoryRateLimiter(requests_per_second=spec.requests_per_second) if spec.requests_per_second else None
+        temperature = spec.temperature if spec.temperature is not None else settings.temperature
+        model = _providers[spec.provider](spec, temperature, cache_for(node), limiter)
+        tiers.append(Tier(f"{spec.provider}:{spec.model}", streaming_with_cache(model), limiter))
+    return TieredModel(node, tiers, settings.skip_saturated)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Show the model tiers each agent node uses.")
+    parser.add_argument("--config", help="Model config file (default: AGENT_MODELS_CONFIG or models.json).")
+    args = parser.parse_args(argv)
+    for node, settings in load_model_config(args.config).items():
+        tiers = " -> ".join(
+            f"{spec.provider}:{spec.model}" + (f" ({spec.timeout:g}s)" if spec.timeout else "") for spec in settings.tiers
+        )
+        print(f"{node:<10} t={settings.temperature:<4g} {tiers}{'  [skips saturated tiers]' if settings.skip_saturated else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,12 +13,15 @@ from typing import (
     Union,
 )
 
-from langchain_core.exceptions import OutputParserException
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers.transform import BaseTransformOutputParser
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool
-from typing_extensions import TypedDict
+from pydantic import BaseModel, ValidationError
+from typing_extensions import NotRequired, TypedDict
+
+from src.profiler import profiled
+from src.registry import ToolRegistry
 
 
 THOUGHT_PATTERN = r"Thought: ([^\n]*)"
@@ -27,11 +30,20 @@ ID_PATTERN = r"\$\{(\d+)\}"
 SINGLE_ID_PATTERN = r"^\$(\d+)$"
 END_OF_PLAN = "<END_OF_PLAN>"
 
+_BARE_REFERENCE = re.compile(r"(?<![\"'\w])(\$(?:\{\d+\}|\d+))(?![\"'\w])")
+
 def _ast_parse(arg: str) -> Any:
     try:
         return ast.literal_eval(arg)
     except (ValueError, SyntaxError):
-        return arg
+        pass
+    # Dicts such as {"prices": $1} are only valid literals once their references are quoted
+    if "$" in arg:
+        try:
+            return ast.literal_eval(_BARE_REFERENCE.sub(r'"\1"', arg))
+        except (ValueError, SyntaxError):
+            pass
+    return arg
 
 def _parse_llm_compiler_action_args(args: str, tool: Union[str, BaseTool]) -> Dict[str, Any]:
     if args == "":
@@ -57,26 +69,88 @@ def _get_dependencies_from_graph(idx: int, tool_name: str, args: Dict[str, Any])
         return list(range(1, idx))
     
     dependencies = []
-    for arg_value in args.values():
-        if isinstance(arg_value, str):
-            matches = re.findall(ID_PATTERN, arg_value)
-            dependencies.extend([int(match) for match in matches])
-        elif isinstance(arg_value, list):
-            for item in arg_value:
-                if isinstance(item, str):
-                    matches = re.findall(ID_PATTERN, item)
-                    dependencies.extend([int(match) for match in matches])
+    def collect(value: Any) -> None:
+        if isinstance(value, str):
+            single = re.match(SINGLE_ID_PATTERN, value)
+            if single:
+                dependencies.append(int(single.group(1)))
+            dependencies.extend(int(match) for match in re.findall(ID_PATTERN, value))
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+    collect(args)
     return sorted(list(set([dep for dep in dependencies if dep < idx])))
 
+def _references(value: Any) -> List[int]:
+    if isinstance(value, str):
+        single = re.match(SINGLE_ID_PATTERN, value)
+        return ([int(single.group(1))] if single else []) + [int(match) for match in re.findall(ID_PATTERN, value)]
+    if isinstance(value, dict):
+        return [ref for item in value.values() for ref in _references(item)]
+    if isinstance(value, list):
+        return [ref for item in value for ref in _references(item)]
+    return []
+
+def compile_task_args(idx: int, tool: BaseTool, args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Checks a task's arguments against its tool's schema before anything runs:
+    argument names must exist, required ones must be present, references must
+    point to earlier tasks, and literal values are validated and coerced to the
+    declared types (values holding references are checked when they resolve).
+    Raises ValueError describing every problem found.
+    """
+    problems = []
+    for ref in sorted(set(_references(args))):
+        if not 1 <= ref < idx:
+            problems.append(f"${ref} does not refer to an earlier task")
+    schema = tool.args_schema
+    if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+        if problems:
+            raise ValueError("; ".join(problems))
+        return args
+
+    fields = schema.model_fields
+    unknown = [name for name in args if name not in fields]
+    if unknown:
+        problems.append(f"unknown argument(s) {', '.join(unknown)}; {tool.name} takes {', '.join(fields)}")
+    missing = [name for name, field in fields.items() if field.is_required() and name not in args]
+    if missing:
+        problems.append(f"missing required argument(s) {', '.join(missing)}")
+
+    compiled = dict(args)
+    for name, value in args.items():
+        if name not in fields or _references(value):
+            continue
+        try:
+            compiled[name] = getattr(schema.__pydantic_validator__.validate_assignment(schema.model_construct(), name, value), name)
+        except ValidationError as e:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                # Numbers written without quotes where text is expected
+                try:
+                    compiled[name] = getattr(schema.__pydantic_validator__.validate_assignment(schema.model_construct(), name, str(value)), name)
+                    continue
+                except ValidationError:
+                    pass
+            problems.append(f"{name}: {e.errors()[0]['msg']}")
+    if problems:
+        raise ValueError("; ".join(problems))
+    return compiled
+
 class Task(TypedDict):
     idx: int
     tool: Union[BaseTool, str]
     args: Dict[str, Any]
     dependencies: List[int]
     thought: Optional[str]
+    # Set when the line failed to compile; the executor has it repaired before running it
+    error: NotRequired[Optional[str]]
+    line: NotRequired[str]
 
-class LLMCompilerPlanParser(BaseTransformOutputParser[Dict[str, Any]], extra="allow"):
-    tools: List[BaseTool]
+class LLMCompilerPlanParser(BaseTransformOutputParser[Dict[str, Any]], extra="allow", arbitrary_types_allowed=True):
+    registry: ToolRegistry
 
     def _transform(self, input: Iterator[Union[str, BaseMessage]]) -> Iterator[Task]:
         texts = []
@@ -125,6 +199,7 @@ class LLMCompilerPlanParser(BaseTransformOutputParser[Dict[str, Any]], extra="al
         
         yield None, thought
 
+    @profiled("parser")
     def _parse_task(self, line: str, thought: Optional[str] = None, next_expected_idx: int = 1) -> Tuple[Optional[Task], Optional[str]]:
         task = None
         if match := re.match(THOUGHT_PATTERN, line):
@@ -136,22 +211,32 @@ class LLMCompilerPlanParser(BaseTransformOutputParser[Dict[str, Any]], extra="al
             if idx < next_expected_idx:
                 print(f"Warning: Parsed task index {idx} is less than expected {next_expected_idx}. Line: {line}")
             
-            task = self.instantiate_task_safe(tools=self.tools, idx=idx, tool_name=tool_name, args=args_str, thought=thought)
+            task = self.instantiate_task_safe(registry=self.registry, idx=idx, tool_name=tool_name, args=args_str, thought=thought)
+            task["line"] = line.strip()
             thought = None
         return task, thought
 
-    def instantiate_task_safe(self, tools: Sequence[BaseTool], idx: int, tool_name: str, args: Union[str, Any], thought: Optional[str] = None) -> Task:
+    def instantiate_task_safe(self, registry: ToolRegistry, idx: int, tool_name: str, args: Union[str, Any], thought: Optional[str] = None) -> Task:
         # MODIFIED: Add a safeguard for the 'join' tool
+        error = None
         if tool_name == "join":
             tool_obj = "join"
             # Crucially, ignore any arguments the LLM might have hallucinated
             tool_args = {}
         else:
             try:
-                tool_obj = tools[[tool.name for tool in tools].index(tool_name)]
-            except ValueError as e:
-                raise OutputParserException(f"Tool {tool_name} not found.") from e
-            tool_args = _parse_llm_compiler_action_args(args, tool_obj)
+                tool_obj = registry.get(tool_name)
+            except KeyError:
+                # Kept as an invalid task so the rest of the plan can still run
+                tool_obj = tool_name
+                tool_args = args if isinstance(args, dict) else {}
+                error = f"unknown tool {tool_name}; available tools are {', '.join(sorted(registry.names()))}, join"
+            else:
+                tool_args = _parse_llm_compiler_action_args(args, tool_obj) if isinstance(args, str) else args
+                try:
+                    tool_args = compile_task_args(idx, tool_obj, tool_args)
+                except ValueError as e:
+                    error = str(e)
 
         dependencies = _get_dependencies_from_graph(idx, tool_name, tool_args)
 
@@ -161,4 +246,5 @@ class LLMCompilerPlanParser(BaseTransformOutputParser[Dict[str, Any]], extra="al
             args=tool_args,
             dependencies=dependencies,
             thought=thought,
+            error=error,
         )
\ No newline at end of file
@@ -0,0 +1,315 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from pydantic import BaseModel, Field
+
+from src.output_parser import END_OF_PLAN, Task
+
+# First-task thought of plans instantiated from a template, so the graph can tell them apart
+TEMPLATE_THOUGHT = "Reusing plan template"
+# Names, numbers and quoted strings; only those that also appear in the plan's arguments become slots
+_ENTITY = re.compile(r"\"[^\"]+\"|'[^']+'|\d+(?:[.,]\d+)*|[A-Z][\w'.-]*(?: [A-Z][\w'.-]*)*")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_NAME = re.compile(r"[A-Z][\w'.-]*(?: [A-Z][\w'.-]*)*")
+_SLOT = "<<slot{}>>"
+_SLOT_PATTERN = re.compile(r"<<slot(\d+)>>")
+
+
+def _clean(question: str) -> str:
+    return " ".join(question.split()).rstrip("?.! ")
+
+
+def _kind(entity: str) -> str:
+    if entity[0] in "\"'":
+        return "quoted"
+    return "number" if _NUMBER.fullmatch(entity) else "name"
+
+
+def _fits(value: str, kind: str) -> bool:
+    if kind == "quoted":
+        return len(value) > 2 and value[0] == value[-1] and value[0] in "\"'"
+    return bool((_NUMBER if kind == "number" else _NAME).fullmatch(value))
+
+
+def _occurrence(entity: str) -> re.Pattern:
+    # Whole words only, and never inside task references such as $1 or ${1}
+    text = re.escape(entity.strip("\"'"))
+    return re.compile(rf"(?<![\w${{]){text}(?!\w)", re.IGNORECASE)
+
+
+def _capitalized_in(word: str, texts: Sequence[str]) -> bool:
+    pattern = re.compile(rf"(?<!\w){re.escape(word)}(?!\w)")
+    return any(pattern.search(text) for text in texts)
+
+
+def standalone(messages: Sequence[BaseMessage]) -> bool:
+    """
+    Whether the last human message is the whole conversation so far. Follow-ups
+    ("What about Germany?") only make sense with their history, so templates are
+    neither learned from nor used for them.
+    """
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+    return last_human == 0
+
+
+def _map_strings(value: Any, fn) -> Any:
+    if isinstance(value, str):
+        return fn(value)
+    if isinstance(value, dict):
+        return {k: _map_strings(v, fn) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_map_strings(v, fn) for v in value]
+    return value
+
+
+def _strings(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+
+
+class PlanTemplate(BaseModel):
+    """A plan with the question's entities replaced by numbered slots."""
+    key: str
+    question: str = Field(..., description="The question with <<slotN>> where entities were.")
+    kinds: List[str] = Field(..., description="Kind of each slot: name, number or quoted.")
+    steps: List[Dict[str, Any]] = Field(..., description="Tasks as {idx, tool, args}, args holding <<slotN>>.")
+    examples: List[List[str]] = Field(default_factory=list, description="Distinct slot values it succeeded with.")
+    hits: int = 0
+    replans: int = Field(0, description="Instantiations the joiner sent back for replanning.")
+
+    def matches(self, question: str) -> Optional[List[str]]:
+        """The slot values if `question` has this template's shape, else None."""
+        parts = _SLOT_PATTERN.split(self.question)
+        pattern = "".join(re.escape(part) if i % 2 == 0 else "(.+?)" for i, part in enumerate(parts))
+        match = re.fullmatch(pattern, _clean(question), re.IGNORECASE)
+        if match is None:
+            return None
+        values = list(match.groups())
+        order = [int(slot) for slot in parts[1::2]]
+        slots = [""] * len(self.kinds)
+        for slot, value in zip(order, values):
+            if not _fits(value, self.kinds[slot]) or (slots[slot] and slots[slot] != value):
+                return None
+            slots[slot] = value
+        return slots
+
+    def render(self, slots: Sequence[str]) -> str:
+        """The plan as planner output, ready for the plan parser."""
+        def fill(text: str) -> str:
+            return _SLOT_PATTERN.sub(lambda m: slots[int(m.group(1))].strip("\"'"), text)
+        lines = [f"Thought: {TEMPLATE_THOUGHT} {self.key}."]
+        for step in self.steps:
+            args = _map_strings(step["args"], fill)
+            rendered = ", ".join(f"{name}={value!r}" for name, value in args.items())
+            lines.append(f"{step['idx']}. {step['tool']}({rendered})")
+        return "\n".join(lines) + END_OF_PLAN
+
+
+def extract_template(question: str, tasks: Sequence[Task]) -> Optional[Tuple[PlanTemplate, List[str]]]:
+    """
+    Turns a question and the plan made for it into a template and its slot
+    values. Entities of the question that the plan's arguments repeat become
+    slots; everything else stays literal. Plans without slots, or with lines
+    that needed repair, are not templates.
+    """
+    if any(task.get("error") for task in tasks):
+        return None
+    steps = []
+    for task in tasks:
+        tool = task["tool"] if isinstance(task["tool"], str) else task["tool"].name
+        steps.append({"idx": task["idx"], "tool": tool, "args": task["args"]})
+    texts = [text for step in steps for text in _strings(step["args"])]
+
+    question = _clean(question)
+    entities = []
+    for match in _ENTITY.finditer(question):
+        entity = match.group(0)
+        first, _, rest = entity.partition(" ")
+        # Every question starts with a capital; the first word is a name only if the plan capitalizes it too
+        if match.start() == 0 and _kind(entity) == "name" and not _capitalized_in(first, texts):
+            entity = rest
+            if not entity:
+                continue
+        if entity not in entities and any(_occurrence(entity).search(text) for text in texts):
+            entities.append(entity)
+    if not entities:
+        return None
+
+    # Longer entities first, so "New York" is not split by "York"
+    templated_question, templated_steps = question, steps
+    for slot, entity in sorted(enumerate(entities), key=lambda item: -len(item[1])):
+        marker = _SLOT.format(slot)
+        pattern = _occurrence(entity)
+        templated_question = re.sub(rf"(?<!\w){re.escape(entity)}(?!\w)", marker, templated_question)
+        templated_steps = _map_strings(templated_steps, lambda text, p=pattern, m=marker: p.sub(m, text))
+
+    kinds = [_kind(entity) for entity in entities]
+    key = hashlib.sha256(json.dumps([templated_question, templated_steps], sort_keys=True).encode()).hexdigest()[:12]
+    template = PlanTemplate(key=key, question=templated_question, kinds=kinds, steps=templated_steps)
+    return template, entities
+
+
+class PlanTemplateCache:
+    """
+    Templates learned from plans that reached a final answer without replanning.
+    A template is used once it has succeeded with `min_examples` different slot
+    values; it is retired when more than `max_replan_rate` of its uses needed a
+    replan. Templates are kept in SQLite when a path is given, opened on first use.
+    """
+    def __init__(self, path: Optional[str] = None, min_examples: int = 2, max_replan_rate: float = 0.2):
+        self.min_examples = min_examples
+        self.max_replan_rate = max_replan_rate
+        self._lock = threading.Lock()
+        self._templates: Dict[str, PlanTemplate] = {}
+        # Plans of turns still in progress, by thread: (question, tasks, template key if instantiated)
+        self._pending: "OrderedDict[str, Tuple[str, List[Task], Optional[str]]]" = OrderedDict()
+        self.stats = {"lookups": 0, "hits": 0, "learned": 0}
+        self.path = path
+        self.conn = None
+        self._loaded = not path
+
+    def _load(self) -> None:
+        """Opens the store and reads its templates, once. Holds the lock."""
+        if self._loaded:
+            return
+        self._loaded = True
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS plan_templates (key TEXT PRIMARY KEY, template TEXT NOT NULL)")
+        for (row,) in self.conn.execute("SELECT template FROM plan_templates"):
+            template = PlanTemplate.model_validate_json(row)
+            self._templates.setdefault(template.key, template)
+
+    def _save(self, template: PlanTemplate) -> None:
+        if self.conn is not None:
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO plan_templates VALUES (?, ?)", (template.key, template.model_dump_json()))
+
+    def _usable(self, template: PlanTemplate) -> bool:
+        if len(template.examples) < self.min_examples:
+            return False
+        # One early replan is tolerated; after that the rate decides
+        return template.replans <= max(1.0, self.max_replan_rate * template.hits)
+
+    # --- Planning ---
+    def instantiate(self, question: str, tools: Collection[str]) -> Optional[str]:
+        """Planner output for `question` from the best matching template, or None to call the planner."""
+        with self._lock:
+            self._load()
+            self.stats["lookups"] += 1
+            best = None
+            for template in self._templates.values():
+                if not self._usable(template) or any(s["tool"] not in tools and s["tool"] != "join" for s in template.steps):
+                    continue
+                slots = template.matches(question)
+                if slots is not None and (best is None or len(template.examples) > len(best[0].examples)):
+                    best = (template, slots)
+            if best is None:
+                return None
+            template, slots = best
+            template.hits += 1
+            self.stats["hits"] += 1
+            self._save(template)
+        return template.render(slots)
+
+    # --- Outcomes ---
+    def observe(self, thread_id: str, question: str, tasks: List[Task]) -> None:
+        """Remembers the first plan of a turn until the joiner decides on it."""
+        thought = (tasks[0].get("thought") or "") if tasks else ""
+        key = thought[len(TEMPLATE_THOUGHT):].strip(" .") if thought.startswith(TEMPLATE_THOUGHT) else None
+        with self._lock:
+            self._pending[thread_id] = (question, tasks, key)
+            self._pending.move_to_end(thread_id)
+            while len(self._pending) > 1024:
+                self._pending.popitem(last=False)
+
+    def resolve(self, thread_id: str, answered: bool) -> None:
+        """
+        Records the joiner's decision on a turn's first plan: a final answer teaches
+        the plan's template, a replan counts against the template it came from.
+        """
+        with self._lock:
+            pending = self._pending.pop(thread_id, None)
+            if pending is None:
+                return
+            self._load()
+            question, tasks, used = pending
+            if used is not None:
+                template = self._templates.get(used)
+                if template is not None and not answered:
+                    template.replans += 1
+                    self._save(template)
+                return
+            if not answered:
+                return
+            extracted = extract_template(question, tasks)
+            if extracted is None:
+                return
+            template, slots = extracted
+            template = self._templates.setdefault(template.key, template)
+            if slots not in template.examples:
+                template.examples = [*template.examples, slots][-8:]
+                self.stats["learned"] += len(template.examples) == self.min_examples
+                self._save(template)
+
+    def report(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._load()
+            return [
+                {
+                    "key": t.key,
+                    "question": t.question,
+                    "examples": len(t.examples),
+                    "hits": t.hits,
+                    "replans": t.replans,
+                    "status": "active" if self._usable(t) else "learning" if len(t.examples) < self.min_examples else "retired",
+                }
+                for t in sorted(self._templates.values(), key=lambda t: -t.hits)
+            ]
+
+
+def create_plan_template_cache() -> Optional[PlanTemplateCache]:
+    """
+    Templates are stored at PLAN_TEMPLATE_DB; PLAN_TEMPLATES=off disables reuse.
+    PLAN_TEMPLATE_MIN_EXAMPLES sets how many differently-filled successes a
+    template needs before it replaces planner calls.
+    """
+    if os.getenv("PLAN_TEMPLATES", "on") == "off":
+        return None
+    return PlanTemplateCache(
+        os.getenv("PLAN_TEMPLATE_DB", "plan_templates.sqlite"),
+        min_examples=int(os.getenv("PLAN_TEMPLATE_MIN_EXAMPLES", "2")),
+        max_replan_rate=float(os.getenv("PLAN_TEMPLATE_MAX_REPLAN_RATE", "0.2")),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="List learned plan templates and how they are used.")
+    parser.add_argument("--db", default=os.getenv("PLAN_TEMPLATE_DB", "plan_templates.sqlite"))
+    args = parser.parse_args(argv)
+    rows = PlanTemplateCache(args.db).report()
+    if not rows:
+        print("No plan templates learned.")
+        return
+    hits, replans = sum(r["hits"] for r in rows), sum(r["replans"] for r in rows)
+    print(f"{len(rows)} templates, {hits} plans instantiated, {replans} of them replanned")
+    for row in rows:
+        print(f"  {row['key']} {row['status']:<8} {row['examples']:>2} examples {row['hits']:>5} hits {row['replans']:>4} replans  {row['question']}")
+
+
+if __name__ == "__main__":
+    main()
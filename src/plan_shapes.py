@@ -0,0 +1,318 @@
+import argparse
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel, Field
+
+from src.local_index import tokenize
+from src.output_parser import Task
+
+# Question categories, first match wins; everything else is a plain lookup
+_CATEGORIES: List[Tuple[str, re.Pattern]] = [
+    ("comparison", re.compile(
+        r"\b(compare|comparison|versus|vs\.?|difference between|"
+        r"(?:more|less|bigger|larger|smaller|older|younger|better|worse|higher|lower) than|which is)\b",
+        re.IGNORECASE,
+    )),
+    ("calculation", re.compile(
+        r"\d\s*[-+*/^%]\s*\d|\b(calculate|compute|sum|total|average|percent(?:age)?|how many|how much|multiply|divide)\b",
+        re.IGNORECASE,
+    )),
+    ("multi_part", re.compile(r"\?.+\?|,.+\band\b|\b(and also|as well as|both|each of|respectively)\b", re.IGNORECASE)),
+]
+
+
+def categorize(question: str) -> str:
+    """The category whose example plans are offered for `question`."""
+    return next((name for name, pattern in _CATEGORIES if pattern.search(question)), "lookup")
+
+
+class PlanShape(NamedTuple):
+    depth: int  # Tasks on the longest dependency chain: the plan's critical path
+    width: int  # Most tasks that can run at the same time
+    tasks: int
+
+
+def plan_shape(tasks: Sequence[Task]) -> PlanShape:
+    """The shape of a plan's DAG from the dependencies the plan parser computed; joins are not counted."""
+    levels: Dict[int, int] = {}
+    for task in sorted(tasks, key=lambda t: t["idx"]):
+        if task["tool"] == "join":
+            continue
+        levels[task["idx"]] = 1 + max((levels.get(dep, 0) for dep in task["dependencies"]), default=0)
+    if not levels:
+        return PlanShape(0, 0, 0)
+    per_level = defaultdict(int)
+    for level in levels.values():
+        per_level[level] += 1
+    return PlanShape(max(levels.values()), max(per_level.values()), len(levels))
+
+
+def _line(task: Task) -> str:
+    if task["tool"] == "join":
+        return f"{task['idx']}. join()"
+    return task.get("line") or f"{task['idx']}. {task['tool'].name}({task['args']})"
+
+
+class ExamplePlan(BaseModel):
+    """An executed plan kept as an example of a good shape for its category."""
+    tenant: str = "default"
+    question: str
+    category: str
+    plan: List[str] = Field(..., description="The plan's lines as the planner wrote them.")
+    depth: int
+    width: int
+    tasks: int
+    seconds: float = Field(..., description="Wall-clock time from planning to the last task's result.")
+    created: float = Field(default_factory=time.time)
+
+    def rank(self) -> Tuple[float, float]:
+        # Shorter critical path per task first, then faster
+        return self.depth / self.tasks, self.seconds
+
+
+def render_examples(examples: Sequence[ExamplePlan]) -> str:
+    """Example plans for the planner prompt, joined like the tool descriptions they follow."""
+    lines = ["", "", "Examples of plans that finished quickly. Tasks that do not use each other's results do not refer to each other, so they run in parallel:"]
+    for example in examples:
+        lines += ["", f"Question: {example.question}", *example.plan]
+    return "\\n".join(lines)
+
+
+class PlanShapeLibrary:
+    """
+    Measures every executed first plan (DAG depth, width and wall-clock time) and
+    keeps, per question category, the `per_category` best plans that reached a
+    final answer without replanning: those with the shortest critical path for
+    their number of tasks, then the fastest. The planner is shown the `examples`
+    of them closest to the new question. Examples carry questions and arguments
+    verbatim, so they are kept and shown per tenant: the config's `tenant_id`,
+    else the deployment's `tenant`. Examples are kept in SQLite when a path is
+    given (opened on first use), at most `max_examples` of them across tenants (the oldest go first),
+    and dropped after `max_age` seconds; `examples=0` only measures.
+    """
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        per_category: int = 4,
+        examples: int = 2,
+        tenant: str = "default",
+        max_examples: int = 1000,
+        max_age: float = 30 * 86400,
+    ):
+        self.per_category = per_category
+        self.examples = examples
+        self.tenant = tenant
+        self.max_examples = max_examples
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._library: Dict[Tuple[str, str], List[ExamplePlan]] = defaultdict(list)
+        # Plans of turns still in progress, by thread: (tenant, question, tasks, seconds)
+        self._pending: "OrderedDict[str, Tuple[str, str, List[Task], float]]" = OrderedDict()
+        self.runs: deque = deque(maxlen=5000)
+        self.path = path
+        self.conn = None
+        self._loaded = not path
+
+    def _load(self) -> None:
+        """Opens the store and reads its examples, once. Holds the lock."""
+        if self._loaded:
+            return
+        self._loaded = True
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.conn:
+            # Examples of the older, untenanted example_plans table are not carried over: their owners are unknown
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS plan_examples (tenant TEXT NOT NULL, question TEXT NOT NULL, example TEXT NOT NULL, "
+                "PRIMARY KEY (tenant, question))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS plan_runs (created REAL NOT NULL, category TEXT NOT NULL, depth INTEGER NOT NULL, "
+                "width INTEGER NOT NULL, tasks INTEGER NOT NULL, seconds REAL NOT NULL, answered INTEGER NOT NULL)"
+            )
+        for (row,) in self.conn.execute("SELECT example FROM plan_examples"):
+            example = ExamplePlan.model_validate_json(row)
+            self._library[example.tenant, example.category].append(example)
+        self._evict()
+
+    def tenant_for(self, config: Optional[RunnableConfig]) -> str:
+        """The tenant whose examples a run sees and adds to: `tenant_id` from its configurable, else the deployment's."""
+        return str((config or {}).get("configurable", {}).get("tenant_id") or self.tenant)
+
+    # --- Planning ---
+    def examples_for(self, question: str, tenant: Optional[str] = None) -> List[ExamplePlan]:
+        """The tenant's stored plans of `question`'s category sharing the most words with it, best shapes first on ties."""
+        if not self.examples:
+            return []
+        words = set(tokenize(question))
+        with self._lock:
+            self._load()
+            candidates = list(self._library.get((tenant or self.tenant, categorize(question)), ()))
+        candidates.sort(key=lambda e: (-len(words & set(tokenize(e.question))), e.rank()))
+        return candidates[:self.examples]
+
+    # --- Outcomes ---
+    def observe(self, thread_id: str, question: str, tasks: List[Task], seconds: float, tenant: Optional[str] = None) -> None:
+        """Remembers a turn's first plan and how long it took until the joiner decides on it."""
+        with self._lock:
+            self._pending[thread_id] = (tenant or self.tenant, question, tasks, seconds)
+            self._pending.move_to_end(thread_id)
+            while len(self._pending) > 1024:
+                self._pending.popitem(last=False)
+
+    def resolve(self, thread_id: str, answered: bool) -> None:
+        """Records the plan's measurements and, if it answered the question, offers it to the library."""
+        with self._lock:
+            pending = self._pending.pop(thread_id, None)
+            if pending is None:
+                return
+            self._load()
+            tenant, question, tasks, seconds = pending
+            shape, category = plan_shape(tasks), categorize(question)
+            self.runs.append({"category": category, **shape._asdict(), "seconds": seconds, "answered": answered})
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT INTO plan_runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (time.time(), category, shape.depth, shape.width, shape.tasks, seconds, int(answered)),
+                    )
+            # Single-task plans show nothing about shape; plans with repaired lines are not worth copying
+            if not answered or shape.tasks < 2 or any(task.get("error") for task in tasks):
+                return
+            example = ExamplePlan(
+                tenant=tenant, question=question, category=category, plan=[_line(task) for task in tasks],
+                seconds=seconds, **shape._asdict(),
+            )
+            key = (tenant, category)
+            library = [e for e in self._library[key] if e.question != question] + [example]
+            library.sort(key=ExamplePlan.rank)
+            self._library[key] = library[:self.per_category]
+            if self.conn is not None:
+                kept = {e.question for e in self._library[key]}
+                with self.conn:
+                    for dropped in {e.question for e in library} - kept:
+                        self.conn.execute("DELETE FROM plan_examples WHERE tenant = ? AND question = ?", (tenant, dropped))
+                    if question in kept:
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO plan_examples VALUES (?, ?, ?)", (tenant, question, example.model_dump_json())
+                        )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drops expired examples and, beyond `max_examples`, the oldest ones. Holds the lock or runs in __init__."""
+        examples = sorted((e for kept in self._library.values() for e in kept), key=lambda e: e.created)
+        cutoff = time.time() - self.max_age
+        expired = [e for e in examples if e.created < cutoff]
+        expired += examples[len(expired):max(len(expired), len(examples) - self.max_examples)]
+        if not expired:
+            return
+        for example in expired:
+            key = (example.tenant, example.category)
+            self._library[key] = [e for e in self._library[key] if e is not example]
+            if not self._library[key]:
+                del self._library[key]
+        if self.conn is not None:
+            with self.conn:
+                self.conn.executemany(
+                    "DELETE FROM plan_examples WHERE tenant = ? AND question = ?", [(e.tenant, e.question) for e in expired]
+                )
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Per category: plans measured this process, their mean shape and time, and examples kept across tenants."""
+        with self._lock:
+            self._load()
+            runs = list(self.runs)
+            kept = self.kept()
+        return summarize(runs, kept)
+
+    def kept(self) -> Dict[str, int]:
+        """Example plans kept per category, summed over tenants."""
+        counts: Dict[str, int] = defaultdict(int)
+        for (_, category), examples in list(self._library.items()):
+            counts[category] += len(examples)
+        return dict(counts)
+
+
+def summarize(runs: Sequence[Dict[str, Any]], kept: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    by_category: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for run in runs:
+        by_category[run["category"]].append(run)
+    rows = []
+    for category in sorted(set(by_category) | set(kept or {})):
+        measured = by_category.get(category, [])
+        rows.append({
+            "category": category,
+            "plans": len(measured),
+            "answered": sum(run["answered"] for run in measured) / len(measured) if measured else 0.0,
+            "depth": statistics.fmean(run["depth"] for run in measured) if measured else 0.0,
+            "width": statistics.fmean(run["width"] for run in measured) if measured else 0.0,
+            "seconds": statistics.fmean(run["seconds"] for run in measured) if measured else 0.0,
+            "examples": (kept or {}).get(category, 0),
+        })
+    return rows
+
+
+def format_report(rows: Sequence[Dict[str, Any]]) -> str:
+    if not rows:
+        return "No plans measured."
+    lines = [f"{'category':<12} {'plans':>6} {'answered':>9} {'depth':>6} {'width':>6} {'seconds':>8} {'examples':>9}"]
+    for row in rows:
+        lines.append(
+            f"{row['category']:<12} {row['plans']:>6} {row['answered']:>9.0%} {row['depth']:>6.2f} "
+            f"{row['width']:>6.2f} {row['seconds']:>8.2f} {row['examples']:>9}"
+        )
+    return "\n".join(lines)
+
+
+def create_plan_shape_library() -> Optional[PlanShapeLibrary]:
+    """
+    Example plans are stored at PLAN_SHAPES_DB; PLAN_SHAPES=off disables
+    measuring and examples. PLAN_SHAPE_EXAMPLES sets how many examples the
+    planner is shown (0 only measures). Runs whose config names no `tenant_id`
+    share the examples of PLAN_SHAPES_TENANT. At most PLAN_SHAPES_MAX examples
+    are kept, each for PLAN_SHAPES_MAX_AGE_DAYS.
+    """
+    if os.getenv("PLAN_SHAPES", "on") == "off":
+        return None
+    return _library_from_env(os.getenv("PLAN_SHAPES_DB", "plan_shapes.sqlite"))
+
+
+def _library_from_env(path: str) -> PlanShapeLibrary:
+    return PlanShapeLibrary(
+        path,
+        per_category=int(os.getenv("PLAN_SHAPES_PER_CATEGORY", "4")),
+        examples=int(os.getenv("PLAN_SHAPE_EXAMPLES", "2")),
+        tenant=os.getenv("PLAN_SHAPES_TENANT", "default"),
+        max_examples=int(os.getenv("PLAN_SHAPES_MAX", "1000")),
+        max_age=float(os.getenv("PLAN_SHAPES_MAX_AGE_DAYS", "30")) * 86400,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Report measured plan shapes and the example plans kept per category.")
+    parser.add_argument("--db", default=os.getenv("PLAN_SHAPES_DB", "plan_shapes.sqlite"))
+    parser.add_argument("--examples", action="store_true", help="Also print the example plans.")
+    args = parser.parse_args(argv)
+    library = _library_from_env(args.db)
+    library._load()
+    runs = [
+        {"category": c, "depth": d, "width": w, "tasks": t, "seconds": s, "answered": bool(a)}
+        for c, d, w, t, s, a in library.conn.execute("SELECT category, depth, width, tasks, seconds, answered FROM plan_runs")
+    ]
+    print(format_report(summarize(runs, library.kept())))
+    if args.examples:
+        for (tenant, category), examples in sorted(library._library.items()):
+            for example in examples:
+                print(f"\n[{tenant} / {category}] depth {example.depth}, width {example.width}, {example.seconds:.2f}s: {example.question}")
+                print("\n".join(f"  {line}" for line in example.plan))
+
+
+if __name__ == "__main__":
+    main()
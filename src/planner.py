@@ -1,29 +1,44 @@
-from typing import Sequence, List, Dict
+from typing import Any, Optional, Sequence, List, Dict
 
-from langchain import hub
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import (
+    AIMessage,
     BaseMessage,
     ToolMessage,
     HumanMessage,
     SystemMessage,
 )
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnableBranch
+from langchain_core.runnables import Runnable, RunnableBranch, RunnableConfig, RunnableLambda
 from langchain_core.tools import BaseTool
-from langchain_google_genai import ChatGoogleGenerativeAI
 from src.output_parser import LLMCompilerPlanParser, Task
+from src.plan_cache import PlanTemplateCache, standalone
+from src.plan_shapes import PlanShapeLibrary, render_examples
+from src.registry import ToolRegistry
+from src.tool_selection import ToolSelector
+from src.blobs import resolve_messages
+from src.ledger import ledger_tag
+from src.profiler import profiled
 
 def create_planner(
-    llm: BaseChatModel, tools: Sequence[BaseTool], base_prompt: ChatPromptTemplate
+    llm: BaseChatModel,
+    registry: ToolRegistry,
+    base_prompt: ChatPromptTemplate,
+    selector: Optional[ToolSelector] = None,
+    replanner_llm: Optional[Runnable] = None,
+    templates: Optional[PlanTemplateCache] = None,
+    examples: Optional[PlanShapeLibrary] = None,
 ):
-    tool_descriptions = "\\n".join(
-        f"{i+1}. {tool.name}: {tool.description}\\n" # Use tool.name for consistency
-        for i, tool in enumerate(tools)
-    )
+    # Rendered from the registry on every call, so tools added later are picked up
+    def num_tools() -> int:
+        return len(registry) + 1
+
+    def tool_descriptions() -> str:
+        return registry.render_descriptions()
+
     planner_prompt = base_prompt.partial(
         replan="",
-        num_tools=len(tools) + 1,
+        num_tools=num_tools,
         tool_descriptions=tool_descriptions,
     )
     # MODIFIED: Added more explicit instructions to the replanner prompt
@@ -35,16 +50,40 @@ def create_planner(
         " - In the Current Plan, you should NEVER repeat the actions that are already executed in the Previous Plan.\\n"
         " - Analyze the Observation from the last failed attempt to understand the error. Do not repeat the same failed action. Pay close attention to the required arguments for each tool.\\n"
         " - You must continue the task index from the end of the previous one. Do not repeat task indices.",
-        num_tools=len(tools) + 1,
+        num_tools=num_tools,
         tool_descriptions=tool_descriptions,
     )
 
     def should_replan(state: List[BaseMessage]):
         return isinstance(state[-1], SystemMessage)
 
-    def wrap_messages(state: List[BaseMessage]) -> Dict[str, List[BaseMessage]]:
-        return {"messages": state}
+    def select_tools(state: List[BaseMessage]) -> Dict[str, Any]:
+        """
+        With a selector, overrides the catalog partials with only the tools relevant
+        to the latest question, plus any tool already used in this conversation.
+        """
+        if selector is None:
+            return {}
+        query = next((m.content for m in reversed(state) if isinstance(m, HumanMessage)), "")
+        used = {m.name for m in state if isinstance(m, ToolMessage)}
+        names = selector.select(str(query), required=used)
+        return {"num_tools": len(names) + 1, "tool_descriptions": registry.render_descriptions(names)}
 
+    def with_examples(state: List[BaseMessage], prompt: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        """Follows the tool descriptions with the tenant's fast-running plans for questions like this one."""
+        if examples is None:
+            return prompt
+        query = next((m.content for m in reversed(state) if isinstance(m, HumanMessage)), "")
+        shown = examples.examples_for(str(query), examples.tenant_for(config))
+        if shown:
+            prompt["tool_descriptions"] = (prompt.get("tool_descriptions") or tool_descriptions()) + render_examples(shown)
+        return prompt
+
+    @profiled("planner.prompt")
+    def wrap_messages(state: List[BaseMessage], config: RunnableConfig) -> Dict[str, List[BaseMessage]]:
+        return with_examples(state, {"messages": state, **select_tools(state)}, config)
+
+    @profiled("planner.prompt")
     def wrap_and_get_last_index(state: List[BaseMessage]) -> Dict[str, List[BaseMessage]]:
         next_task = 0
         for message in state[::-1]:
@@ -57,19 +96,67 @@ def create_planner(
                     except (ValueError, IndexError):
                         continue
         
+        # The state belongs to the graph (and its checkpoints), so build a new list instead of editing it
         replan_context = f"Begin the Current Plan. Continue task numbering from {next_task}."
         if state and isinstance(state[-1], SystemMessage):
-             state[-1].content = f"{state[-1].content}\n{replan_context}"
+            state = [*state[:-1], state[-1].model_copy(update={"content": f"{state[-1].content}\n{replan_context}"})]
         else:
-            state.append(SystemMessage(content=replan_context))
+            state = [*state, SystemMessage(content=replan_context)]
+
+        # The replanner needs the full observations of the previous plan
+        return {"messages": resolve_messages(state), **select_tools(state)}
 
-        return {"messages": state}
+    # The model is called inside each branch so the token ledger can tell planning from replanning
+    replanner_llm = replanner_llm or llm
+    plan = wrap_messages | planner_prompt | llm.with_config(tags=[ledger_tag("planner")])
+
+    def plan_from_template(state: List[BaseMessage]) -> Any:
+        """A plan instantiated from a learned template for a standalone question's shape, or else the planner."""
+        if not standalone(state):
+            return plan
+        query = next((m.content for m in reversed(state) if isinstance(m, HumanMessage)), "")
+        text = templates.instantiate(str(query), registry.names())
+        return AIMessage(content=text) if text is not None else plan
 
     return (
         RunnableBranch(
-            (should_replan, wrap_and_get_last_index | replanner_prompt),
-            wrap_messages | planner_prompt,
+            (should_replan, wrap_and_get_last_index | replanner_prompt | replanner_llm.with_config(tags=[ledger_tag("replanner")])),
+            RunnableLambda(plan_from_template) if templates is not None else plan,
         )
-        | llm
-        | LLMCompilerPlanParser(tools=tools)
-    )
\ No newline at end of file
+        | LLMCompilerPlanParser(registry=registry)
+    )
+
+_REPAIR_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "Some lines of a plan failed validation against the tools' argument schemas. Rewrite only those lines.\n"
+        "Available tools:\n{tool_descriptions}\n"
+        "Keep each line's task number and use the format `N. tool(arg=value, ...)`. Refer to earlier task outputs as $N. "
+        "Output only the rewritten lines, one per line, with no other text.",
+    ),
+    ("user", "Question: {question}\n\nPlan:\n{plan}\n\nInvalid lines:\n{invalid}"),
+])
+
+def create_plan_repairer(llm: Runnable, registry: ToolRegistry):
+    """
+    Returns a function that asks the model to rewrite only the invalid lines of a
+    plan, given the whole plan for context, and returns the rewritten tasks that
+    now compile (others are left out).
+    """
+    chain = _REPAIR_PROMPT | llm.with_config(tags=[ledger_tag("repair")])
+    parser = LLMCompilerPlanParser(registry=registry)
+
+    def repair(question: str, tasks: Sequence[Task], invalid: Sequence[Task]) -> List[Task]:
+        # The plan's own tools, or the whole catalog when a line names a tool that does not exist
+        unknown = any(isinstance(task["tool"], str) and task["tool"] != "join" for task in invalid)
+        names = None if unknown else list(dict.fromkeys(task["tool"].name for task in tasks if not isinstance(task["tool"], str)))
+        message = chain.invoke({
+            "tool_descriptions": registry.render_descriptions(names).replace("\\n", "\n"),
+            "question": question,
+            "plan": "\n".join(task.get("line", f"{task['idx']}. {task['tool']}") for task in tasks),
+            "invalid": "\n".join(f"{task.get('line', task['idx'])}  <- {task['error']}" for task in invalid),
+        })
+        wanted = {task["idx"] for task in invalid}
+        return [task for task in parser.parse(str(message.content)) if task["idx"] in wanted and not task.get("error")]
+
+    return repair
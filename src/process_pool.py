@@ -0,0 +1,138 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from langchain_core.tools import BaseTool
+
+# Arrays at least this large travel through shared memory instead of the pipe
+SHARED_ARRAY_BYTES = int(os.getenv("PROCESS_POOL_SHARED_BYTES", str(1 << 20)))
+
+
+class SharedArray(NamedTuple):
+    """Picklable descriptor of a numpy array placed in a shared memory segment."""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class TaskEnvelope(NamedTuple):
+    """Everything a worker needs to run a tool: where to import it from and its arguments."""
+    target: str
+    args: Dict[str, Any]
+
+
+# --- Shared memory transfer ---
+def _pack(value: Any, segments: List[SharedMemory]) -> Any:
+    if isinstance(value, np.ndarray) and value.nbytes >= SHARED_ARRAY_BYTES:
+        segment = SharedMemory(create=True, size=value.nbytes)
+        np.ndarray(value.shape, dtype=value.dtype, buffer=segment.buf)[...] = value
+        segments.append(segment)
+        return SharedArray(segment.name, value.shape, value.dtype.str)
+    if isinstance(value, dict):
+        return {k: _pack(v, segments) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) and not isinstance(value, SharedArray):
+        return type(value)(_pack(v, segments) for v in value)
+    return value
+
+
+def _unpack(value: Any, unlink: bool) -> Any:
+    if isinstance(value, SharedArray):
+        segment = SharedMemory(name=value.name)
+        try:
+            array = np.ndarray(value.shape, dtype=np.dtype(value.dtype), buffer=segment.buf).copy()
+        finally:
+            segment.close()
+            # Workers share the parent's resource tracker, so only the side that consumes last unlinks
+            if unlink:
+                segment.unlink()
+        return array
+    if isinstance(value, dict):
+        return {k: _unpack(v, unlink) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unpack(v, unlink) for v in value)
+    return value
+
+
+# --- Worker side ---
+_worker_tools: Dict[str, BaseTool] = {}
+
+
+def _worker_init(modules: Tuple[str, ...]) -> None:
+    """Imports heavy modules once per worker so the first real task does not pay for them."""
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _resolve_tool(target: str) -> BaseTool:
+    if target not in _worker_tools:
+        module_name, _, attribute = target.partition(":")
+        tool = getattr(importlib.import_module(module_name), attribute)
+        _worker_tools[target] = tool if isinstance(tool, BaseTool) else tool()
+    return _worker_tools[target]
+
+
+def _run_envelope(envelope: TaskEnvelope) -> Any:
+    args = _unpack(envelope.args, unlink=False)
+    result = _resolve_tool(envelope.target).invoke(args)
+    # Result segments are created here and unlinked by the parent once copied out
+    return _pack(result, [])
+
+
+# --- Parent side ---
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    The persistent pool for CPU-class tools. Workers are started and warmed up
+    on first use, and each is replaced after PROCESS_POOL_MAX_TASKS tasks.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv("PROCESS_POOL_WORKERS", str(os.cpu_count() or 1)))
+            prewarm = tuple(m for m in os.getenv("PROCESS_POOL_PREWARM", "numpy,numexpr").split(",") if m)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                # Worker recycling requires a non-fork start method
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(prewarm,),
+                max_tasks_per_child=int(os.getenv("PROCESS_POOL_MAX_TASKS", "200")),
+            )
+            for future in [_pool.submit(_worker_ready) for _ in range(workers)]:
+                future.result()
+        return _pool
+
+
+def shutdown_process_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+async def run_in_process(target: str, args: Dict[str, Any]) -> Any:
+    """Runs the tool at `target` ('module:attribute') with `args` in the process pool."""
+    segments: List[SharedMemory] = []
+    envelope = TaskEnvelope(target, _pack(args, segments))
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(get_process_pool(), _run_envelope, envelope)
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+    return _unpack(result, unlink=True)
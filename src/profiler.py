@@ -0,0 +1,257 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Without per-thread CPU clocks, innermost frames in these functions count as waiting
+_BLOCKING_FUNCTIONS = frozenset(
+    "wait acquire sleep select poll epoll recv recv_into read readinto readline accept connect "
+    "_wait_for_tstate_lock result get join".split()
+)
+# Components whose time is spent locally, as opposed to waiting on a model or a tool
+LOCAL_COMPONENTS = ("history", "planner.prompt", "parser", "executor", "joiner.select", "joiner.resolve_blobs")
+
+_enabled = os.getenv("AGENT_PROFILE", "") not in ("", "0")
+_output_dir = os.getenv("AGENT_PROFILE_DIR", "profiles")
+_current: ContextVar[Optional["QueryProfile"]] = ContextVar("agent_profile", default=None)
+_sampler: Optional["StackSampler"] = None
+
+
+class QueryProfile:
+    """Wall and on-CPU time per component for one agent turn."""
+    def __init__(self, question: str):
+        self.question = question
+        self.components: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0, 0])
+        self._lock = threading.Lock()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self.wall = self.cpu = 0.0
+
+    def record(self, component: str, wall: float, cpu: float) -> None:
+        with self._lock:
+            entry = self.components[component]
+            entry[0] += wall
+            entry[1] += cpu
+            entry[2] += 1
+
+    def finish(self) -> None:
+        self.wall = time.perf_counter() - self._wall
+        self.cpu = time.process_time() - self._cpu
+
+    def breakdown(self) -> Dict[str, Any]:
+        """
+        Splits the turn into model wait, tool time, local work and graph overhead
+        (turn wall time not covered by any node). Tool times are summed over tasks
+        that may have run concurrently.
+        """
+        components = {name: {"wall_ms": w * 1000, "cpu_ms": c * 1000, "calls": n} for name, (w, c, n) in self.components.items()}
+        def total(prefix: str) -> float:
+            return sum(v[0] for k, v in self.components.items() if k.startswith(prefix))
+        return {
+            "question": self.question,
+            "wall_ms": self.wall * 1000,
+            "cpu_ms": self.cpu * 1000,
+            "llm_wait_ms": total("llm") * 1000,
+            "tool_ms": total("tool:") * 1000,
+            "local_cpu_ms": sum(self.components[name][1] for name in LOCAL_COMPONENTS if name in self.components) * 1000,
+            "graph_overhead_ms": max(self.wall - total("node:"), 0.0) * 1000,
+            "components": components,
+        }
+
+
+# --- Instrumentation ---
+@contextmanager
+def section(component: str) -> Iterator[None]:
+    """Attributes the enclosed code's wall and thread CPU time to `component` of the current query."""
+    profile = _current.get() if _enabled else None
+    if profile is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        profile.record(component, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+def profiled(component: str) -> Callable:
+    """Decorator form of `section` for hot functions; costs one flag check when profiling is off."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with section(component):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProfilingCallbackHandler(BaseCallbackHandler):
+    """Times model calls and graph nodes from LangChain callbacks, which see every run without wrapping it."""
+    def __init__(self, profile: QueryProfile):
+        self.profile = profile
+        self._started: Dict[UUID, tuple] = {}
+
+    def _start(self, run_id: UUID, component: str) -> None:
+        self._started[run_id] = (component, time.perf_counter())
+
+    def _end(self, run_id: UUID) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            # Model calls and nodes span threads, so only their wall time is meaningful
+            self.profile.record(started[0], time.perf_counter() - started[1], 0.0)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, f"llm:{(metadata or {}).get('langgraph_node', 'other')}")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, f"llm:{(metadata or {}).get('langgraph_node', 'other')}")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self._start(run_id, f"node:{node}")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+@contextmanager
+def profile_query(question: str) -> Iterator[Optional[ProfilingCallbackHandler]]:
+    """
+    Profiles one agent turn when profiling is on and yields the callback handler to
+    add to the run's config (None when off). The breakdown is printed and appended
+    to queries.jsonl in the profile directory.
+    """
+    if not _enabled:
+        yield None
+        return
+    profile = QueryProfile(question)
+    token = _current.set(profile)
+    try:
+        yield ProfilingCallbackHandler(profile)
+    finally:
+        _current.reset(token)
+        profile.finish()
+        report = profile.breakdown()
+        os.makedirs(_output_dir, exist_ok=True)
+        with open(os.path.join(_output_dir, "queries.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+        print(format_breakdown(report), file=sys.stderr)
+
+
+def format_breakdown(report: Dict[str, Any]) -> str:
+    lines = [
+        f"[profile] wall {report['wall_ms']:.0f} ms, cpu {report['cpu_ms']:.0f} ms | "
+        f"llm wait {report['llm_wait_ms']:.0f} ms, tools {report['tool_ms']:.0f} ms, "
+        f"local cpu {report['local_cpu_ms']:.1f} ms, graph overhead {report['graph_overhead_ms']:.1f} ms"
+    ]
+    for name, entry in sorted(report["components"].items(), key=lambda item: -item[1]["wall_ms"]):
+        lines.append(f"  {name:<24} {entry['calls']:>5} calls {entry['wall_ms']:>10.1f} ms wall {entry['cpu_ms']:>10.1f} ms cpu")
+    return "\n".join(lines)
+
+
+# --- Stack sampling ---
+class StackSampler:
+    """
+    Samples every thread's Python stack at a fixed interval. Samples are kept as
+    collapsed stacks ('outer;inner count', the input format of flamegraph.pl and
+    speedscope), once for all samples and once for samples that were on-CPU.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _on_cpu(self, ident: int, innermost: str, last_cpu: Dict[int, float]) -> bool:
+        """
+        Whether a thread ran since the previous sample, from its CPU clock where the
+        platform exposes one, otherwise judged by the function it is in.
+        """
+        try:
+            now = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError):
+            return innermost not in _BLOCKING_FUNCTIONS
+        previous = last_cpu.get(ident)
+        last_cpu[ident] = now
+        return previous is not None and now - previous >= self.interval / 2
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        last_cpu: Dict[int, float] = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                innermost = frame.f_code.co_name
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                collapsed = ";".join(reversed(stack))
+                self.wall[collapsed] += 1
+                if self._on_cpu(ident, innermost, last_cpu):
+                    self.cpu[collapsed] += 1
+
+    def write(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name, counts in (("wall.collapsed", self.wall), ("cpu.collapsed", self.cpu)):
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+
+
+def enable(output_dir: Optional[str] = None, sample_interval: Optional[float] = None) -> None:
+    """
+    Turns profiling on for the rest of the process and starts the stack sampler;
+    its collapsed stacks are written to the profile directory at exit.
+    """
+    global _enabled, _output_dir, _sampler
+    _enabled = True
+    _output_dir = output_dir or _output_dir
+    if _sampler is None:
+        interval = sample_interval or float(os.getenv("AGENT_PROFILE_INTERVAL_MS", "5")) / 1000
+        _sampler = StackSampler(interval)
+        _sampler.start()
+        atexit.register(_write_samples)
+
+
+def _write_samples() -> None:
+    if _sampler is not None:
+        _sampler.stop()
+        _sampler.write(_output_dir)
+        print(f"[profile] collapsed stacks written to {_output_dir}/", file=sys.stderr)
+
+
+if _enabled:
+    enable()
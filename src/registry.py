@@ -0,0 +1,131 @@
+import importlib
+import json
+import os
+import threading
+from importlib.metadata import entry_points
+from typing import Any, Dict, Iterable, List, Literal, Optional, Union
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+ENTRY_POINT_GROUP = "llm_compiler.tools"
+
+
+class ToolSpec(BaseModel):
+    """
+    Declares a tool without building it. `target` is a 'module:attribute' path to
+    either a BaseTool or a zero-argument factory returning one; it is only
+    imported the first time a plan references the tool.
+    """
+    name: str
+    description: str
+    target: str = Field(..., description="'module:attribute' path to a BaseTool or a factory returning one.")
+    execution: Literal["io", "cpu", "async"] = Field(
+        "io", description="How the executor runs the tool: a thread, the process pool, or the event loop."
+    )
+
+
+class ToolRegistry:
+    """
+    Name-indexed tool catalog. Lookups are O(1), tools are instantiated on first
+    use, and each tool's prompt fragment is rendered once when it is registered,
+    so adding a tool never requires re-rendering the others.
+    """
+    def __init__(self):
+        self._specs: Dict[str, ToolSpec] = {}
+        self._tools: Dict[str, BaseTool] = {}
+        self._fragments: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def register(self, tool: Union[ToolSpec, BaseTool]) -> None:
+        """Adds or replaces a tool. Accepts either a declaration or an already built tool."""
+        with self._lock:
+            if isinstance(tool, BaseTool):
+                execution = (tool.metadata or {}).get("execution", "io")
+                spec = ToolSpec(name=tool.name, description=tool.description, target="", execution=execution)
+                self._tools[tool.name] = tool
+            else:
+                spec = tool
+                self._tools.pop(spec.name, None)
+            self._specs[spec.name] = spec
+            self._fragments[spec.name] = f"{spec.name}: {spec.description}\\n"
+            self.version += 1
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._specs.pop(name, None)
+            self._tools.pop(name, None)
+            self._fragments.pop(name, None)
+            self.version += 1
+
+    def get(self, name: str) -> BaseTool:
+        """Returns the tool called `name`, building it on first use. Raises KeyError if unknown."""
+        tool = self._tools.get(name)
+        if tool is not None:
+            return tool
+        with self._lock:
+            if name not in self._tools:
+                self._tools[name] = self._instantiate(self._specs[name])
+            return self._tools[name]
+
+    @staticmethod
+    def _instantiate(spec: ToolSpec) -> BaseTool:
+        module_name, _, attribute = spec.target.partition(":")
+        target = getattr(importlib.import_module(module_name), attribute)
+        tool = target if isinstance(target, BaseTool) else target()
+        if not isinstance(tool, BaseTool) or tool.name != spec.name:
+            raise TypeError(f"Target '{spec.target}' did not produce a tool named '{spec.name}'.")
+        # The executor reads the execution class, and the process pool rebuilds the tool from its target
+        tool.metadata = {**(tool.metadata or {}), "execution": spec.execution, "target": spec.target}
+        return tool
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def description(self, name: str) -> str:
+        return self._specs[name].description
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._tools
+
+    def fragments(self) -> List[str]:
+        """The cached prompt fragment of every tool, as it appears in rendered descriptions."""
+        return list(self._fragments.values())
+
+    def render_descriptions(self, names: Optional[Iterable[str]] = None) -> str:
+        """Numbered tool descriptions for the planner prompt, from the cached fragments."""
+        fragments = self._fragments
+        selected = list(fragments) if names is None else [n for n in names if n in fragments]
+        return "\\n".join(f"{i+1}. {fragments[name]}" for i, name in enumerate(selected))
+
+    # --- Plugin discovery ---
+    def load_config(self, path: str) -> None:
+        """Registers the tools declared in a JSON file: a list of ToolSpec objects."""
+        with open(path, encoding="utf-8") as f:
+            for entry in json.load(f):
+                self.register(ToolSpec(**entry))
+
+    def load_entry_points(self, group: str = ENTRY_POINT_GROUP) -> None:
+        """Registers tools declared by installed packages. Each entry point must resolve to a ToolSpec or dict."""
+        for entry_point in entry_points(group=group):
+            declaration: Any = entry_point.load()
+            self.register(declaration if isinstance(declaration, ToolSpec) else ToolSpec(**declaration))
+
+
+def create_registry(builtin: Iterable[Union[ToolSpec, BaseTool]]) -> ToolRegistry:
+    """Builds a registry from the built-in tools plus any configured or installed plugins."""
+    registry = ToolRegistry()
+    for tool in builtin:
+        registry.register(tool)
+    registry.load_entry_points()
+    config_path = os.getenv("TOOLS_CONFIG", "tools.json")
+    if os.path.exists(config_path):
+        registry.load_config(config_path)
+    return registry
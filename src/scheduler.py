@@ -1,34 +1,348 @@
-import schedule
-import time
+import hashlib
+import heapq
+import importlib
+import itertools
+import json
+import os
+import sqlite3
 import threading
-from src.gmeet_tool import join_gmeet
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from uuid import uuid4
+
+from pydantic import BaseModel, Field
+
+
+# --- Cron Expressions ---
+class CronSchedule:
+    """
+    A standard five-field cron expression (minute hour day-of-month month day-of-week),
+    evaluated in local time. Supports '*', lists, ranges and steps.
+    """
+    _BOUNDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have 5 fields.")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse_field(field, lo, hi) for field, (lo, hi) in zip(fields, self._BOUNDS)
+        )
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int) -> FrozenSet[int]:
+        values = set()
+        for part in field.split(","):
+            spec, _, step = part.partition("/")
+            if spec == "*":
+                start, end = lo, hi
+            elif "-" in spec:
+                start, end = (int(v) for v in spec.split("-", 1))
+            else:
+                start = end = int(spec)
+                if step:
+                    end = hi
+            # Day-of-week 7 is an alias for Sunday
+            if hi == 6 and end == 7:
+                values.add(0)
+                if start == 7:
+                    continue
+                end = 6
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"Cron field '{field}' is out of range {lo}-{hi}.")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return frozenset(values)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        # As in cron, a restricted day-of-month and day-of-week match either way
+        if not self.any_day and not self.any_weekday:
+            return in_month or in_week
+        return in_month and in_week
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Returns the first firing time strictly after `moment`."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never fires.")
+
+
+# --- Job Store ---
+class Job(BaseModel):
+    """A scheduled call of `handler` ('module:function') with JSON-serializable kwargs."""
+    id: str = Field(default_factory=lambda: uuid4().hex)
+    handler: str
+    kwargs: Dict[str, Any] = Field(default_factory=dict)
+    next_run: float
+    cron: Optional[str] = None
+    misfire_grace: float = 60.0
+
+
+class JobStore:
+    """SQLite persistence for jobs, so schedules survive restarts."""
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        # WAL keeps per-job commits cheap when thousands of jobs are added or completed
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, handler TEXT NOT NULL, kwargs TEXT NOT NULL, "
+                "next_run REAL NOT NULL, cron TEXT, misfire_grace REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_next_run ON jobs (next_run)")
+
+    def save(self, job: Job) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, job.handler, json.dumps(job.kwargs), job.next_run, job.cron, job.misfire_grace),
+            )
+
+    def delete(self, job_id: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def load_all(self) -> List[Job]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, handler, kwargs, next_run, cron, misfire_grace FROM jobs ORDER BY next_run"
+            ).fetchall()
+        return [
+            Job(id=row[0], handler=row[1], kwargs=json.loads(row[2]), next_run=row[3], cron=row[4], misfire_grace=row[5])
+            for row in rows
+        ]
+
+
+# --- Scheduler ---
+class Scheduler:
+    """
+    Runs jobs from a timer heap on a single background thread that sleeps until
+    the next job is due, and executes them on a bounded worker pool.
+
+    A job that fires more than its `misfire_grace` seconds late (for example
+    because the process was not running) is skipped; cron jobs then move on
+    to their next firing time.
+    """
+    def __init__(self, store: JobStore, max_workers: int = 4):
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._cond = threading.Condition()
+        self._heap: List[tuple] = []
+        self._jobs: Dict[str, Job] = {}
+        self._versions: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def start(self) -> None:
+        with self._cond:
+            for job in self.store.load_all():
+                self._push(job)
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._pool.shutdown(wait=wait)
+
+    def run_forever(self) -> None:
+        """Blocks the calling thread until interrupted."""
+        try:
+            while self._thread and self._thread.is_alive():
+                self._thread.join(timeout=3600)
+        except KeyboardInterrupt:
+            self.shutdown(wait=False)
+
+    def add_job(
+        self,
+        handler: str,
+        kwargs: Optional[Dict[str, Any]] = None,
+        run_at: Optional[datetime] = None,
+        cron: Optional[str] = None,
+        job_id: Optional[str] = None,
+        misfire_grace: float = 60.0,
+    ) -> Job:
+        """
+        Schedules `handler` ('module:function') once at `run_at`, or repeatedly on a
+        cron expression. Re-adding an existing `job_id` replaces that job.
+        """
+        if (run_at is None) == (cron is None):
+            raise ValueError("Exactly one of 'run_at' or 'cron' must be given.")
+        next_run = run_at.timestamp() if run_at else CronSchedule(cron).next_after(datetime.now()).timestamp()
+        job = Job(handler=handler, kwargs=kwargs or {}, next_run=next_run, cron=cron, misfire_grace=misfire_grace)
+        if job_id:
+            job.id = job_id
+        self.store.save(job)
+        with self._cond:
+            self._push(job)
+            self._cond.notify()
+        return job
+
+    def remove_job(self, job_id: str) -> None:
+        with self._cond:
+            self._jobs.pop(job_id, None)
+            self._versions.pop(job_id, None)
+        self.store.delete(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._cond:
+            return sorted(self._jobs.values(), key=lambda job: job.next_run)
+
+    # --- Internals ---
+    def _push(self, job: Job) -> None:
+        # Callers hold self._cond
+        seq = next(self._seq)
+        self._jobs[job.id] = job
+        self._versions[job.id] = seq
+        heapq.heappush(self._heap, (job.next_run, seq, job.id))
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                due = self._next_due()
+            if due is None:
+                return
+            self._fire(*due)
+
+    def _next_due(self) -> Optional[Tuple[Job, float, Optional[Job]]]:
+        """
+        Waits for the next due job and moves it on in the heap: a cron job to its
+        next run, a one-off job out. Returns (job, run_at, next_job), or None once
+        stopped. Callers hold self._cond.
+        """
+        while not self._stopped:
+            if not self._heap:
+                self._cond.wait()
+                continue
+            run_at, seq, job_id = self._heap[0]
+            delay = run_at - time.time()
+            if delay > 0:
+                self._cond.wait(delay)
+                continue
+            heapq.heappop(self._heap)
+            # Entries for removed or rescheduled jobs are discarded lazily
+            if self._versions.get(job_id) != seq:
+                continue
+            job = self._jobs[job_id]
+            next_job = None
+            if job.cron:
+                next_job = job.model_copy(update={"next_run": CronSchedule(job.cron).next_after(datetime.now()).timestamp()})
+                self._push(next_job)
+            else:
+                del self._jobs[job.id]
+                del self._versions[job.id]
+            return job, run_at, next_job
+        return None
+
+    # --- Firing (without self._cond, so SQLite writes do not hold up add_job and remove_job) ---
+    def _fire(self, job: Job, run_at: float, next_job: Optional[Job]) -> None:
+        if next_job is not None:
+            self.store.save(next_job)
+            with self._cond:
+                current = self._jobs.get(next_job.id)
+            # The job was removed or replaced while its next run was being saved
+            if current is None:
+                self.store.delete(next_job.id)
+            elif current is not next_job:
+                self.store.save(current)
+        now = time.time()
+        if now - run_at > job.misfire_grace:
+            print(f"[Scheduler] Skipping job {job.id}: missed its run time by {now - run_at:.0f}s.")
+            if not job.cron:
+                self.store.delete(job.id)
+            return
+        self._pool.submit(self._run, job)
 
-def run_threaded(func_to_run, **kwargs):
+    def _resolve(self, handler: str) -> Callable[..., Any]:
+        if handler not in self._handlers:
+            module_name, _, function_name = handler.partition(":")
+            self._handlers[handler] = getattr(importlib.import_module(module_name), function_name)
+        return self._handlers[handler]
+
+    def _run(self, job: Job) -> None:
+        try:
+            self._resolve(job.handler)(**job.kwargs)
+        except Exception as e:
+            print(f"[Scheduler] Job {job.id} ({job.handler}) failed: {e}")
+        finally:
+            if not job.cron:
+                self.store.delete(job.id)
+
+
+def create_scheduler() -> Scheduler:
+    """Builds the process-wide scheduler from environment settings."""
+    store = JobStore(os.getenv("SCHEDULER_DB", "scheduler_jobs.sqlite"))
+    return Scheduler(store, max_workers=int(os.getenv("SCHEDULER_WORKERS", "4")))
+
+
+# --- Job Handlers ---
+def run_agent_query(question: str, thread_id: Optional[str] = None) -> None:
+    """Answers a scheduled question with the agent and prints the result."""
+    from src.agent import invoke_agent  # Imported on first use; building the agent is expensive
+
+    # Scheduled queries yield tool slots to interactive conversations
+    answer = invoke_agent(question, config={"configurable": {"priority": "batch"}}, thread_id=thread_id)
+    print(f"\n[Scheduled query] {question}\nAgent: {answer}")
+
+
+def schedule_agent_query(
+    scheduler: Scheduler,
+    question: str,
+    run_at: Optional[datetime] = None,
+    cron: Optional[str] = None,
+    thread_id: Optional[str] = None,
+) -> Job:
     """
-    Helper function to run a job in a new thread.
+    Schedules an agent query once at `run_at` or repeatedly on a cron expression.
+    The job's id is derived from its schedule, question and thread, so scheduling
+    the same query again (e.g. on every restart) replaces it instead of adding a copy.
     """
-    job_thread = threading.Thread(target=func_to_run, kwargs=kwargs)
-    job_thread.start()
+    kwargs = {"question": question}
+    if thread_id:
+        kwargs["thread_id"] = thread_id
+    digest = hashlib.sha1(f"{thread_id or ''}\n{question}".encode()).hexdigest()[:16]
+    job_id = f"query:{cron or (run_at and run_at.isoformat())}:{digest}"
+    return scheduler.add_job("src.scheduler:run_agent_query", kwargs, run_at=run_at, cron=cron, job_id=job_id)
+
 
-def schedule_gmeet(meet_url: str, join_time: str):
+def schedule_gmeet(scheduler: Scheduler, meet_url: str, join_time: str) -> Job:
     """
-    Schedules a Google Meet to be joined at a specific time.
+    Schedules a Google Meet to be joined every day at a specific time.
 
     Args:
+        scheduler (Scheduler): The scheduler to add the job to.
         meet_url (str): The URL of the Google Meet.
         join_time (str): The time to join the meet in HH:MM format.
     """
+    hour, minute = (int(part) for part in join_time.split(":"))
     print(f"Scheduling to join {meet_url} at {join_time} using hardcoded cookies.")
-    
-    # Schedule the threaded job runner
-    schedule.every().day.at(join_time).do(
-        run_threaded, 
-        func_to_run=join_gmeet, 
-        meet_url=meet_url
+    return scheduler.add_job(
+        "src.gmeet_tool:join_gmeet",
+        {"meet_url": meet_url},
+        cron=f"{minute} {hour} * * *",
+        job_id=f"gmeet:{meet_url}@{join_time}",
     )
-
-    print("Scheduler is running. Waiting for the scheduled time...")
-
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
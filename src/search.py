@@ -0,0 +1,207 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or the to was what when where which who why with".split()
+)
+
+SearchResult = Dict[str, Any]
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.casefold())
+
+
+def normalize_query(query: str) -> str:
+    """
+    Reduces a query to a canonical key so spelling variants ("Population of
+    Paris?", "population of paris") share one request. Every word is kept in
+    order: "Paris to London" and "London to Paris", or "When ..." and "Where
+    ...", are different questions.
+    """
+    return " ".join(_tokens(query)) or query.strip().casefold()
+
+
+def trim_passages(content: str, query: str, max_chars: int) -> str:
+    """
+    Keeps the passages of `content` that best match the query, in their original
+    order, within a budget of `max_chars`.
+    """
+    if len(content) <= max_chars:
+        return content
+    query_terms = set(_tokens(query)) - _STOPWORDS
+    passages = [p.strip() for p in _SENTENCE_PATTERN.split(content) if p.strip()]
+    ranked = sorted(
+        range(len(passages)),
+        key=lambda i: (-len(query_terms.intersection(_tokens(passages[i]))), i),
+    )
+    selected, used = [], 0
+    for i in ranked:
+        if used + len(passages[i]) > max_chars:
+            continue
+        selected.append(i)
+        used += len(passages[i]) + 1
+    if not selected:
+        return passages[ranked[0]][:max_chars]
+    return " ".join(passages[i] for i in sorted(selected))
+
+
+class SearchBackend:
+    """
+    Web search client shared by all search tasks in the process.
+
+    Queries issued within `batch_window` seconds of each other are normalized
+    and deduplicated as one batch. The search API has no batch endpoint, so a
+    batch is still one POST per distinct query, sent concurrently over a pooled
+    HTTP session.
+    Results are cached briefly, so a query repeated later in the same plan
+    (or a replan) is not sent again.
+    """
+    def __init__(
+        self,
+        base_url: str = "https://api.tavily.com",
+        api_key: Optional[str] = None,
+        max_results: int = 2,
+        max_chars: int = 1200,
+        batch_window: float = 0.01,
+        max_connections: int = 8,
+        cache_ttl: float = 300.0,
+        cache_size: int = 512,
+        timeout: float = 20.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_results = max_results
+        self.max_chars = max_chars
+        self.batch_window = batch_window
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="search")
+
+        self._lock = threading.Lock()
+        self._batch: List[Tuple[str, str]] = []
+        self._inflight: Dict[str, Future] = {}
+        self._cache: "OrderedDict[str, Tuple[float, List[SearchResult]]]" = OrderedDict()
+        self.stats = {"requested": 0, "sent": 0, "deduplicated": 0, "cached": 0, "batches": 0}
+
+    def search(self, query: str) -> List[SearchResult]:
+        return self.search_many([query])[0]
+
+    def search_many(self, queries: Sequence[str]) -> List[List[SearchResult]]:
+        """Runs several queries as one batch (one request per distinct query) and returns their results in order."""
+        futures, leader = [], False
+        for query in queries:
+            future, opened = self._submit(query)
+            futures.append(future)
+            leader = leader or opened
+        if leader:
+            # The caller that opened the batch waits for concurrent callers to join it
+            time.sleep(self.batch_window)
+            self._flush()
+        return [future.result() for future in futures]
+
+    def _submit(self, query: str) -> Tuple[Future, bool]:
+        key = normalize_query(query)
+        with self._lock:
+            self.stats["requested"] += 1
+            cached = self._cache_get(key)
+            if cached is not None:
+                self.stats["cached"] += 1
+                future = Future()
+                future.set_result(cached)
+                return future, False
+            if key in self._inflight:
+                self.stats["deduplicated"] += 1
+                return self._inflight[key], False
+            future = Future()
+            self._inflight[key] = future
+            self._batch.append((key, query))
+            return future, len(self._batch) == 1
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch, self._batch = self._batch, []
+            if batch:
+                self.stats["batches"] += 1
+        for key, query in batch:
+            self._pool.submit(self._fetch, key, query)
+
+    def _fetch(self, key: str, query: str) -> None:
+        with self._lock:
+            future = self._inflight[key]
+            self.stats["sent"] += 1
+        try:
+            results = self._request(query)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._cache_put(key, results)
+        future.set_result(results)
+
+    def _request(self, query: str) -> List[SearchResult]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        response = self.session.post(
+            f"{self.base_url}/search",
+            json={"query": query, "max_results": self.max_results},
+            headers=headers,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return [
+            {
+                "url": item.get("url", ""),
+                "content": trim_passages(item.get("content", ""), query, self.max_chars),
+            }
+            for item in response.json().get("results", [])[: self.max_results]
+        ]
+
+    # --- Result cache (callers hold self._lock) ---
+    def _cache_get(self, key: str) -> Optional[List[SearchResult]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, results = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return results
+
+    def _cache_put(self, key: str, results: List[SearchResult]) -> None:
+        self._cache[key] = (time.monotonic() + self.cache_ttl, results)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+def create_search_backend() -> SearchBackend:
+    """Builds the process-wide search backend from environment settings."""
+    return SearchBackend(
+        base_url=os.getenv("TAVILY_BASE_URL", "https://api.tavily.com"),
+        api_key=os.getenv("TAVILY_API_KEY"),
+        max_results=int(os.getenv("SEARCH_MAX_RESULTS", "2")),
+        max_chars=int(os.getenv("SEARCH_MAX_CHARS", "1200")),
+        batch_window=float(os.getenv("SEARCH_BATCH_WINDOW_MS", "10")) / 1000,
+    )
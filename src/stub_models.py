@@ -0,0 +1,66 @@
+import random
+import time
+from typing import Dict, List, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.models import ModelSpec, register_provider
+
+# Stub models by name: (seconds per call, failure rate); add entries to configure more
+STUB_MODELS: Dict[str, Tuple[float, float]] = {
+    "large": (0.12, 0.0),
+    "large-flaky": (0.12, 0.3),
+    "large-slow": (0.6, 0.0),
+    "small": (0.03, 0.0),
+    "broken": (0.0, 1.0),
+}
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline chat model with a fixed latency, a failure rate and an optional
+    timeout. It answers with its name followed by the last message, so callers
+    can tell which tier answered.
+    """
+    model: str
+    latency: float
+    failure_rate: float = 0.0
+    timeout: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _wait(self) -> None:
+        if self.timeout and self.latency > self.timeout:
+            time.sleep(self.timeout)
+            raise TimeoutError(f"{self.model} did not answer within {self.timeout}s")
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError(f"{self.model} returned an error")
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._wait()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"{self.model}: {messages[-1].content}"))])
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs):
+        self._wait()
+        for part in (f"{self.model}: ", str(messages[-1].content)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=part))
+
+
+def stub_model(spec: ModelSpec, rate_limiter=None) -> StubChatModel:
+    """The stub model named by `spec.model` in STUB_MODELS, honouring the spec's timeout."""
+    latency, failure_rate = STUB_MODELS[spec.model]
+    return StubChatModel(model=spec.model, latency=latency, failure_rate=failure_rate, timeout=spec.timeout or 0.0, rate_limiter=rate_limiter)
+
+
+def _stub(spec: ModelSpec, temperature: float, cache, rate_limiter) -> BaseChatModel:
+    # The completion cache is left out so every call reaches a model
+    return stub_model(spec, rate_limiter)
+
+
+# Importing this module makes `"provider": "stub"` usable in a model config, for offline tests and benchmarks
+register_provider("stub", _stub)
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from src.registry import ToolRegistry
+
+
+class QueuedTask(NamedTuple):
+    id: str
+    tool: str
+    args: Dict[str, Any]
+    attempts: int
+
+
+class TaskResult(NamedTuple):
+    ok: bool
+    value: Any
+
+
+# --- Serialization ---
+def _encode(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return {"__ndarray__": value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} cannot be sent through the task queue.")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if "__ndarray__" in obj:
+        return np.asarray(obj["__ndarray__"], dtype=np.dtype(obj["dtype"]))
+    return obj
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_encode)
+
+
+def loads(text: str) -> Any:
+    return json.loads(text, object_hook=_decode)
+
+
+# --- Queue interface ---
+class TaskQueue(ABC):
+    """
+    Work queue between the agent's executor and tool workers. Producers enqueue
+    a tool name with resolved arguments under a caller-chosen id and later take
+    the result; workers claim tasks under a lease that they renew with
+    heartbeats. A task whose lease runs out is handed to another worker, so
+    delivery is at-least-once.
+    """
+    @abstractmethod
+    def enqueue(self, task_id: str, tool: str, args: Dict[str, Any]) -> None:
+        """Queues a task. Raises TypeError if the arguments cannot be serialized."""
+
+    @abstractmethod
+    def take(self, task_id: str) -> Optional[TaskResult]:
+        """Returns and removes the result of a finished task, or None while it is pending."""
+
+    @abstractmethod
+    def cancel(self, task_id: str) -> None:
+        """Drops a task whose result is no longer wanted; a worker still running it finishes into nothing."""
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease: float) -> Optional[QueuedTask]:
+        """Leases the oldest queued task, or one whose lease ran out, to `worker_id`."""
+
+    @abstractmethod
+    def heartbeat(self, task_id: str, worker_id: str, lease: float) -> bool:
+        """Extends the lease; False means the task was given to another worker or has finished."""
+
+    @abstractmethod
+    def complete(self, task_id: str, result: TaskResult) -> None:
+        """Stores a task's result. Raises TypeError if the value cannot be serialized."""
+
+    async def run(self, task_id: str, tool: str, args: Dict[str, Any], poll_interval: float = 0.05,
+                  timeout: Optional[float] = 120.0) -> Any:
+        """
+        Enqueues a task and waits for a worker's result, raising the worker's error
+        if it failed. Without a result after `timeout` seconds (for example when no
+        worker is running) the task is dropped and TimeoutError raised.
+        """
+        self.enqueue(task_id, tool, args)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                result = self.take(task_id)
+                if result is not None:
+                    if not result.ok:
+                        raise RuntimeError(result.value)
+                    return result.value
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"No worker finished task {task_id} within {timeout}s.")
+                await asyncio.sleep(poll_interval)
+        except (TimeoutError, asyncio.CancelledError):
+            # Nobody will take the result: keep a late worker from starting the task
+            self.cancel(task_id)
+            raise
+
+
+class SqliteTaskQueue(TaskQueue):
+    """
+    TaskQueue on a shared SQLite file, for workers on the same host or a shared
+    volume. Claims are single atomic UPDATE statements, so any number of worker
+    processes can poll the same file.
+    """
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id TEXT PRIMARY KEY, tool TEXT NOT NULL, args TEXT NOT NULL, status TEXT NOT NULL, "
+                "worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, "
+                "enqueued REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, enqueued)")
+
+    def enqueue(self, task_id: str, tool: str, args: Dict[str, Any]) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tasks (id, tool, args, status, enqueued) VALUES (?, ?, ?, 'queued', ?)",
+                (task_id, tool, dumps(args), time.time()),
+            )
+
+    def take(self, task_id: str) -> Optional[TaskResult]:
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "DELETE FROM tasks WHERE id = ? AND status IN ('done', 'failed') RETURNING status, result",
+                (task_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return TaskResult(row[0] == "done", loads(row[1]))
+
+    def cancel(self, task_id: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def claim(self, worker_id: str, lease: float) -> Optional[QueuedTask]:
+        now = time.time()
+        with self.lock, self.conn:
+            # Tasks whose workers died too often are failed instead of retried forever
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', result = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (dumps(f"Task abandoned by {self.max_attempts} workers."), now, self.max_attempts),
+            )
+            row = self.conn.execute(
+                "UPDATE tasks SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM tasks WHERE status = 'queued' "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY enqueued LIMIT 1) "
+                "RETURNING id, tool, args, attempts",
+                (worker_id, now + lease, now),
+            ).fetchone()
+        if row is None:
+            return None
+        return QueuedTask(row[0], row[1], loads(row[2]), row[3])
+
+    def heartbeat(self, task_id: str, worker_id: str, lease: float) -> bool:
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease, task_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def complete(self, task_id: str, result: TaskResult) -> None:
+        # The first result wins; a redelivered copy finishing later is ignored
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE tasks SET status = ?, result = ? WHERE id = ? AND status = 'running'",
+                ("done" if result.ok else "failed", dumps(result.value), task_id),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+
+def create_task_queue() -> Optional[TaskQueue]:
+    """
+    The queue the executor sends tool calls to: TASK_QUEUE_FACTORY ('module:attribute'
+    of a zero-argument factory) for another backend, TASK_QUEUE_DB for the SQLite
+    queue, or None to run tools in the agent process.
+    """
+    factory = os.getenv("TASK_QUEUE_FACTORY")
+    if factory:
+        module_name, _, attribute = factory.partition(":")
+        return getattr(importlib.import_module(module_name), attribute)()
+    path = os.getenv("TASK_QUEUE_DB")
+    return SqliteTaskQueue(path) if path else None
+
+
+# --- Worker ---
+def _process(queue: TaskQueue, registry: ToolRegistry, task: QueuedTask, worker_id: str, lease: float) -> None:
+    finished = threading.Event()
+
+    def beat():
+        while not finished.wait(lease / 3):
+            if not queue.heartbeat(task.id, worker_id, lease):
+                return
+
+    heartbeat = threading.Thread(target=beat, daemon=True)
+    heartbeat.start()
+    try:
+        result = TaskResult(True, registry.get(task.tool).invoke(task.args))
+    except Exception as e:
+        result = TaskResult(False, f"{type(e).__name__}: {e}")
+    finally:
+        finished.set()
+    try:
+        queue.complete(task.id, result)
+    except TypeError as e:
+        queue.complete(task.id, TaskResult(False, f"TypeError: {e}"))
+
+
+def run_worker(
+    queue: TaskQueue,
+    registry: ToolRegistry,
+    worker_id: Optional[str] = None,
+    concurrency: int = 1,
+    lease: float = 30.0,
+    poll_interval: float = 0.2,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """Pulls tasks from `queue` and runs them with tools from `registry` until `stop` is set."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or threading.Event()
+
+    def loop(slot: int):
+        name = f"{worker_id}/{slot}"
+        while not stop.is_set():
+            task = queue.claim(name, lease)
+            if task is None:
+                stop.wait(poll_interval)
+                continue
+            _process(queue, registry, task, name, lease)
+
+    threads = [threading.Thread(target=loop, args=(slot,), daemon=True) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Tool workers for the distributed task queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="Run tools from the queue.")
+    worker.add_argument("--db", default=os.getenv("TASK_QUEUE_DB", "task_queue.sqlite"))
+    worker.add_argument("--registry", default="src.tools:tool_registry", help="'module:attribute' of a ToolRegistry.")
+    worker.add_argument("--concurrency", type=int, default=4)
+    worker.add_argument("--lease", type=float, default=30.0, help="Seconds before an unresponsive worker's task is redelivered.")
+    stats = sub.add_parser("stats", help="Show task counts by status.")
+    stats.add_argument("--db", default=os.getenv("TASK_QUEUE_DB", "task_queue.sqlite"))
+    args = parser.parse_args(argv)
+
+    queue = SqliteTaskQueue(args.db)
+    if args.command == "stats":
+        print(queue.counts())
+        return
+    module_name, _, attribute = args.registry.partition(":")
+    registry = getattr(importlib.import_module(module_name), attribute)
+    print(f"Worker serving {len(registry)} tools from {args.db} with {args.concurrency} slots.")
+    try:
+        run_worker(queue, registry, concurrency=args.concurrency, lease=args.lease)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
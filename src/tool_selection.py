@@ -0,0 +1,107 @@
+import math
+import os
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.local_index import tokenize
+from src.registry import ToolRegistry
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i in is it me of on or please the to use what when "
+    "where which who why with you".split()
+)
+_DIMENSIONS = 1 << 18
+_NGRAM = 4
+
+
+def _features(text: str) -> Dict[int, float]:
+    """Hashed bag of words plus character n-grams, so 'calculate' still matches 'calculator'."""
+    counts: Dict[int, float] = defaultdict(float)
+    for token in tokenize(text.replace("_", " ")):
+        if token in _STOPWORDS:
+            continue
+        counts[zlib.crc32(token.encode()) % _DIMENSIONS] += 1.0
+        padded = f"#{token}#"
+        for i in range(len(padded) - _NGRAM + 1):
+            counts[zlib.crc32(padded[i:i + _NGRAM].encode()) % _DIMENSIONS] += 0.5
+    return counts
+
+
+class ToolSelector:
+    """
+    Picks the tools most relevant to a query from a hashed-vector TF-IDF index over
+    tool names and descriptions. The index is rebuilt lazily whenever the
+    registry changes. `pinned` tools (typically the core built-ins) are always
+    offered in addition to the `top_k` retrieved ones.
+    """
+    def __init__(self, registry: ToolRegistry, top_k: int = 5, pinned: Iterable[str] = ()):
+        self.registry = registry
+        self.top_k = top_k
+        self.pinned = tuple(pinned)
+        self._lock = threading.Lock()
+        self._version = -1
+        self._postings: Dict[int, List[Tuple[str, float]]] = {}
+        self._idf: Dict[int, float] = {}
+
+    def _ensure_index(self) -> None:
+        if self._version == self.registry.version:
+            return
+        with self._lock:
+            if self._version == self.registry.version:
+                return
+            version = self.registry.version
+            documents = {
+                name: _features(f"{name} {self.registry.description(name)}")
+                for name in self.registry.names()
+            }
+            df: Dict[int, int] = defaultdict(int)
+            for features in documents.values():
+                for feature in features:
+                    df[feature] += 1
+            idf = {feature: math.log(1 + len(documents) / count) for feature, count in df.items()}
+            postings: Dict[int, List[Tuple[str, float]]] = defaultdict(list)
+            for name, features in documents.items():
+                weights = {f: tf * idf[f] for f, tf in features.items()}
+                norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+                for feature, weight in weights.items():
+                    postings[feature].append((name, weight / norm))
+            self._postings, self._idf, self._version = dict(postings), idf, version
+
+    def score(self, query: str) -> List[Tuple[str, float]]:
+        """All tools with a non-zero similarity to `query`, best first."""
+        self._ensure_index()
+        postings, idf = self._postings, self._idf
+        scores: Dict[str, float] = defaultdict(float)
+        for feature, tf in _features(query).items():
+            weight = tf * idf.get(feature, 0.0)
+            for name, tool_weight in postings.get(feature, ()):
+                scores[name] += weight * tool_weight
+        return sorted(scores.items(), key=lambda item: -item[1])
+
+    def select(self, query: str, required: Iterable[str] = ()) -> List[str]:
+        """
+        The pinned tools and the `top_k` most relevant tool names in registry order,
+        plus any `required` tools (e.g. tools used earlier in the conversation).
+        'join' is not part of the registry; the planner prompt always describes it.
+        """
+        names = self.registry.names()
+        always = {name for name in (*self.pinned, *required) if name in self.registry}
+        if len(names) <= self.top_k + len(always):
+            return names
+        retrieved = set()
+        for name, _ in self.score(query):
+            if len(retrieved) >= self.top_k:
+                break
+            if name not in always:
+                retrieved.add(name)
+        selected = always | retrieved
+        return [name for name in names if name in selected]
+
+
+def create_tool_selector(registry: ToolRegistry) -> Optional[ToolSelector]:
+    """Returns a selector when TOOL_SELECTION_TOP_K is set, otherwise None (every tool is offered)."""
+    top_k = int(os.getenv("TOOL_SELECTION_TOP_K", "0"))
+    pinned = [name.strip() for name in os.getenv("TOOL_SELECTION_PINNED", "search,math").split(",") if name.strip()]
+    return ToolSelector(registry, top_k, pinned) if top_k > 0 else None
@@ -1,19 +1,25 @@
+import ast
 import math
 import re
 import os
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
 import numexpr
+import numpy as np
 
 from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import StructuredTool, BaseTool
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.tools.tavily_search import TavilySearchResults
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-from src.gmeet_tool import gmeet_tool # Import the new gmeet_tool
+from src.gmeet_tool import GMEET_DESCRIPTION
+from src.search import create_search_backend
+from src.local_index import LocalIndex
+from src.ledger import ledger_tag
+from src.models import create_node_model
+from src.registry import ToolSpec, create_registry
 
 load_dotenv()
 
@@ -21,15 +27,47 @@ load_dotenv()
 class SearchInput(BaseModel):
     query: str = Field(description="The search query for information on the web.")
 
+# Shared by every search task so concurrent queries are deduplicated and batched
+search_backend = create_search_backend()
+
 search = StructuredTool.from_function(
-    func=TavilySearchResults(max_results=2).invoke,
+    func=search_backend.search,
     name="search",
-    description="A search engine. Use this to search for information on the web.",
+    description="A search engine. Use this to search for information on the public web.",
     args_schema=SearchInput,
 )
 
+# --- Local Corpus Search Tool ---
+class LocalSearchInput(BaseModel):
+    query: str = Field(description="The search query for information in the internal documents.")
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "local_index.bin")
+
+_LOCAL_SEARCH_DESCRIPTION = (
+    "Searches the internal document collection offline. Use this instead of 'search' for questions "
+    "about internal documents, policies or projects; use 'search' for public or recent information."
+)
+
+def get_local_search_tool(index_path: str) -> StructuredTool:
+    index = LocalIndex(index_path)
+
+    def local_search(query: str) -> List[dict]:
+        return index.search(query, k=int(os.getenv("LOCAL_SEARCH_TOP_K", "3")))
+
+    return StructuredTool.from_function(
+        func=local_search,
+        name="local_search",
+        description=_LOCAL_SEARCH_DESCRIPTION,
+        args_schema=LocalSearchInput,
+    )
+
 # --- Math Tool ---
-_MATH_DESCRIPTION = "A calculator that solves a single mathematical expression. Do not pass in word problems."
+_MATH_DESCRIPTION = (
+    "A calculator that solves a single mathematical expression. Do not pass in word problems. "
+    "To compute over several numbers from earlier tasks, pass them as named inputs, e.g. "
+    "math(problem=\"average price\", inputs={\"prices\": $1}, expression=\"mean(prices)\"), and write one "
+    "expression over the whole arrays instead of one task per value. Reductions: sum, mean, min, max, prod, std, len."
+)
 
 _SYSTEM_PROMPT = """Translate a math problem into a expression that can be executed using Python's numexpr library. Use the output of running this code to answer the question.
 
@@ -72,23 +110,94 @@ class ExecuteCode(BaseModel):
     reasoning: str = Field(..., description="The reasoning behind the code expression, including how context is included, if applicable.")
     code: str = Field(..., description="The simple code expression to execute by numexpr.evaluate().")
 
-def _evaluate_expression(expression: str) -> str:
+_INPUTS_PROMPT = """The following named inputs are defined as variables:
+
+{inputs}
+
+Refer to them by name in the expression instead of copying their values. Arithmetic on an array applies to every element; sum(), mean(), min(), max(), prod(), std() and len() reduce an array to one number."""
+
+# numexpr only allows a reduction as the outermost operation, so reductions are evaluated by numpy
+_REDUCTIONS = {"sum": np.sum, "mean": np.mean, "min": np.min, "max": np.max, "prod": np.prod, "std": np.std, "len": np.size}
+_REDUCTION_CALL = re.compile(r"\b(" + "|".join(_REDUCTIONS) + r")\s*\(")
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+def _to_operand(value: Any) -> Union[float, np.ndarray]:
+    """
+    Coerces an input bound from another task (a number, a list, an array, search
+    results or their text) to a float operand.
+    """
+    if isinstance(value, dict) or (isinstance(value, (list, tuple)) and any(isinstance(v, dict) for v in value)):
+        # Search results: the numbers in each result's text
+        items = value if isinstance(value, (list, tuple)) else [value]
+        return _to_operand("\n".join(str(v.get("content", "")) if isinstance(v, dict) else str(v) for v in items))
+    if isinstance(value, (int, float, np.ndarray, list, tuple)):
+        try:
+            array = np.asarray(value, dtype=float)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Cannot use {value!r} as a numeric input.") from e
+        return float(array) if array.ndim == 0 else array
+    if isinstance(value, str):
+        try:
+            parsed = ast.literal_eval(value.strip())
+            if not isinstance(parsed, str):
+                return _to_operand(parsed)
+        except (ValueError, SyntaxError, TypeError):
+            pass
+        # Free text: take every number in it, ignoring thousands separators
+        numbers = _NUMBER.findall(re.sub(r"(?<=\d),(?=\d{3}\b)", "", value))
+        if numbers:
+            return _to_operand([float(n) for n in numbers])
+    raise ValueError(f"Cannot use {value!r} as a numeric input.")
+
+def _describe_operand(name: str, value: Union[float, np.ndarray]) -> str:
+    if isinstance(value, np.ndarray):
+        preview = ", ".join(f"{v:g}" for v in value.ravel()[:5])
+        return f"{name}: array of {value.size} numbers ({preview}{', ...' if value.size > 5 else ''})"
+    return f"{name}: {value:g}"
+
+def _lift_reductions(expression: str, local_dict: Dict[str, Any]) -> str:
+    """Evaluates each reduction call, innermost first, and replaces it with a variable holding its value."""
+    match = _REDUCTION_CALL.search(expression)
+    while match:
+        depth, end = 1, match.end()
+        while depth and end < len(expression):
+            depth += {"(": 1, ")": -1}.get(expression[end], 0)
+            end += 1
+        if depth:
+            raise ValueError(f"Unbalanced parentheses in {expression!r}.")
+        inner = _lift_reductions(expression[match.end():end - 1], local_dict)
+        name = f"_reduced{len(local_dict)}"
+        local_dict[name] = _REDUCTIONS[match.group(1)](numexpr.evaluate(inner, global_dict={}, local_dict=local_dict))
+        expression = f"{expression[:match.start()]}{name}{expression[end:]}"
+        match = _REDUCTION_CALL.search(expression)
+    return expression
+
+def _evaluate_expression(expression: str, inputs: Optional[Dict[str, Any]] = None) -> Union[float, np.ndarray]:
+    """
+    Evaluates a numexpr expression over `pi`, `e` and the named `inputs`. Array
+    inputs are processed element-wise in one pass; the result is a number, or a
+    float array when the expression is not reduced.
+    """
     try:
-        local_dict = {"pi": math.pi, "e": math.e}
-        output = str(
-            numexpr.evaluate(
-                expression.strip(),
-                global_dict={},
-                local_dict=local_dict,
-            )
+        local_dict = {"pi": math.pi, "e": math.e, **(inputs or {})}
+        output = numexpr.evaluate(
+            _lift_reductions(expression.strip(), local_dict),
+            global_dict={},
+            local_dict=local_dict,
         )
     except Exception as e:
         raise ValueError(f'Failed to evaluate "{expression}". Raised error: {repr(e)}. Please try again with a valid numerical expression.')
-    return re.sub(r"^\[|\]$", "", output)
+    return output.item() if output.ndim == 0 else output
 
 class MathToolArgs(BaseModel):
     problem: str = Field(..., description="The math problem to solve.")
     context: Optional[List[str]] = Field(None, description="Optional a list of strings as context to help solve the problem.")
+    inputs: Optional[Dict[str, Any]] = Field(
+        None, description="Optional named numbers or arrays, usually outputs of earlier tasks such as {\"prices\": $1}, usable by name in the expression."
+    )
+    expression: Optional[str] = Field(
+        None, description="Optional numexpr expression over the inputs, e.g. \"sum(prices * 1.2)\". When given, it is evaluated directly."
+    )
 
 def get_math_tool(llm: ChatGoogleGenerativeAI) -> StructuredTool:
     prompt = ChatPromptTemplate.from_messages(
@@ -98,24 +207,38 @@ def get_math_tool(llm: ChatGoogleGenerativeAI) -> StructuredTool:
             MessagesPlaceholder(variable_name="context", optional=True),
         ]
     )
-    extractor = prompt | llm.with_structured_output(ExecuteCode)
+    extractor = prompt | llm.with_structured_output(ExecuteCode).with_config(tags=[ledger_tag("math")])
 
     def calculate_expression(
         problem: str,
         context: Optional[List[str]] = None,
+        inputs: Optional[Dict[str, Any]] = None,
+        expression: Optional[str] = None,
         config: Optional[RunnableConfig] = None,
-    ) -> str:
-        chain_input = {"problem": problem}
-        if context:
-            context_str = "\n".join(context)
-            if context_str.strip():
-                context_str = _ADDITIONAL_CONTEXT_PROMPT.format(context=context_str.strip())
-                chain_input["context"] = [SystemMessage(content=context_str)]
-        
-        code_model = extractor.invoke(chain_input, config)
+    ) -> Union[str, float, np.ndarray]:
+        try:
+            operands = {name: _to_operand(value) for name, value in (inputs or {}).items()}
+        except ValueError as e:
+            return repr(e)
+
+        if expression is None:
+            chain_input = {"problem": problem}
+            context_messages = []
+            if context:
+                context_str = "\n".join(context)
+                if context_str.strip():
+                    context_str = _ADDITIONAL_CONTEXT_PROMPT.format(context=context_str.strip())
+                    context_messages.append(SystemMessage(content=context_str))
+            if operands:
+                described = "\n".join(_describe_operand(name, value) for name, value in operands.items())
+                context_messages.append(SystemMessage(content=_INPUTS_PROMPT.format(inputs=described)))
+            if context_messages:
+                chain_input["context"] = context_messages
+
+            expression = extractor.invoke(chain_input, config).code
         
         try:
-            return _evaluate_expression(code_model.code)
+            return _evaluate_expression(expression, operands)
         except Exception as e:
             return repr(e)
 
@@ -126,6 +249,29 @@ def get_math_tool(llm: ChatGoogleGenerativeAI) -> StructuredTool:
         args_schema=MathToolArgs
     )
 
-llm_for_tools = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
-math_tool = get_math_tool(llm_for_tools)
-tools: List[BaseTool] = [search, math_tool, gmeet_tool]
+# --- Tool Registry ---
+# Tools other than search are declared here and only built when a plan first uses them.
+def create_math_tool() -> StructuredTool:
+    return get_math_tool(create_node_model("math"))
+
+def create_local_search_tool() -> StructuredTool:
+    return get_local_search_tool(LOCAL_INDEX_PATH)
+
+builtin_tools: List[Union[ToolSpec, BaseTool]] = [search]
+# The local corpus tool is only offered when an index has been built (see src/local_index.py)
+if os.path.exists(LOCAL_INDEX_PATH):
+    builtin_tools.append(ToolSpec(
+        name="local_search",
+        description=_LOCAL_SEARCH_DESCRIPTION,
+        target="src.tools:create_local_search_tool",
+        # A BM25 query takes well under a millisecond; a thread beats a round trip to the process pool
+        execution="io",
+    ))
+builtin_tools.append(ToolSpec(name="math", description=_MATH_DESCRIPTION, target="src.tools:create_math_tool"))
+builtin_tools.append(ToolSpec(
+    name="join_gmeet",
+    description=GMEET_DESCRIPTION,
+    target="src.gmeet_tool:gmeet_tool",
+))
+
+tool_registry = create_registry(builtin_tools)
@@ -0,0 +1,11 @@
+"""Concurrent turns through one compiled graph, checked with the stress suite's fake models."""
+from benchmarks.stress_concurrency import expected_answer, run
+
+
+def test_concurrent_conversations_are_isolated_per_thread():
+    transcripts, errors, _ = run(conversations=40, turns=2, workers=16)
+    # Wrong answers and foreign questions, tool calls or observations in a thread's history
+    assert errors == []
+    for conversation, answers in transcripts.items():
+        assert answers[0] == f"Hello! (hello from {conversation})"
+        assert answers[1:] == [expected_answer(conversation, turn) for turn in (1, 2)]
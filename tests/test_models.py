@@ -0,0 +1,56 @@
+"""Model tier fallback, checked with offline stub models."""
+import time
+
+import pytest
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+from src.models import ModelSpec, ModelStats, Tier, TieredModel
+from src.stub_models import stub_model
+
+
+def _tier(model: str, timeout: float = 0.0, limiter: InMemoryRateLimiter = None) -> Tier:
+    spec = ModelSpec(provider="stub", model=model, timeout=timeout or None)
+    return Tier(f"stub:{model}", stub_model(spec, limiter), limiter)
+
+
+def _counts(stats: ModelStats):
+    return {row["model"]: (row["calls"], row["success_rate"], row["skipped"]) for row in stats.report()}
+
+
+def test_error_falls_back_to_the_next_tier():
+    model = TieredModel("router", [_tier("broken"), _tier("small")], stats=ModelStats())
+    assert model.invoke("question").content == "small: question"
+    assert "".join(chunk.content for chunk in model.stream("question")) == "small: question"
+    assert _counts(model.stats) == {"stub:broken": (2, 0.0, 0), "stub:small": (2, 1.0, 0)}
+
+
+def test_timeout_falls_back_to_the_next_tier():
+    model = TieredModel("router", [_tier("large-slow", timeout=0.05), _tier("small")], stats=ModelStats())
+    start = time.perf_counter()
+    assert model.invoke("question").content == "small: question"
+    assert time.perf_counter() - start < 0.5
+    assert _counts(model.stats) == {"stub:large-slow": (1, 0.0, 0), "stub:small": (1, 1.0, 0)}
+
+
+def test_last_tier_error_is_raised():
+    model = TieredModel("router", [_tier("broken"), _tier("broken")], stats=ModelStats())
+    with pytest.raises(RuntimeError, match="broken returned an error"):
+        model.invoke("question")
+    assert _counts(model.stats) == {"stub:broken": (2, 0.0, 0)}
+
+
+def test_saturated_tier_is_skipped():
+    limiter = InMemoryRateLimiter(requests_per_second=0.1)
+    # As right after a call: the bucket is empty and refills one token in 10 s
+    limiter.last, limiter.available_tokens = time.monotonic(), 0.0
+    model = TieredModel("router", [_tier("large", limiter=limiter), _tier("small")], skip_saturated=True, stats=ModelStats())
+    assert model.invoke("question").content == "small: question"
+    assert _counts(model.stats) == {"stub:large": (0, 0.0, 1), "stub:small": (1, 1.0, 0)}
+
+
+def test_saturated_tier_is_tried_without_skip_saturated():
+    limiter = InMemoryRateLimiter(requests_per_second=100)
+    limiter.last, limiter.available_tokens = time.monotonic(), 0.0
+    model = TieredModel("router", [_tier("large", limiter=limiter), _tier("small")], stats=ModelStats())
+    assert model.invoke("question").content == "large: question"
+    assert _counts(model.stats) == {"stub:large": (1, 1.0, 0)}
@@ -0,0 +1,99 @@
+"""The search backend against a local stub of the search API."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.search import SearchBackend
+
+FILLER = "Unrelated filler sentence about nothing in particular."
+
+
+class _StubSearchAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so pooled connections can be told apart by client port
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append({**body, "port": self.client_address[1], "auth": self.headers.get("Authorization")})
+        query = body["query"]
+        results = [
+            {"url": f"https://example.com/{i}", "content": f"{FILLER} {query} is the answer {i}. {FILLER * 20}"}
+            for i in range(body["max_results"] + 1)
+        ]
+        payload = json.dumps({"results": results}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubSearchAPI)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _backend(server, **kwargs) -> SearchBackend:
+    return SearchBackend(base_url=f"http://127.0.0.1:{server.server_port}", api_key="key", **kwargs)
+
+
+def test_spelling_variants_share_one_request(server):
+    backend = _backend(server)
+    first, second, third = backend.search_many(["Population of Paris?", "population of  paris", "Paris population"])
+    assert first == second
+    assert sorted(request["query"] for request in server.requests) == ["Paris population", "Population of Paris?"]
+    assert backend.stats["deduplicated"] == 1
+    assert all(request["auth"] == "Bearer key" and request["max_results"] == 2 for request in server.requests)
+    assert len(third) == 2
+
+
+def test_concurrent_callers_join_one_batch(server):
+    backend = _backend(server, batch_window=0.2)
+    queries = ["weather in Oslo", "weather in oslo", "weather in Rome", "Weather in Rome?"]
+    results = [None] * len(queries)
+
+    def search(i):
+        results[i] = backend.search(queries[i])
+
+    threads = [threading.Thread(target=search, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.stats["batches"] == 1
+    assert backend.stats["sent"] == len(server.requests) == 2
+    assert results[0] == results[1] and results[2] == results[3]
+
+
+def test_repeated_query_is_served_from_cache(server):
+    backend = _backend(server)
+    assert backend.search("capital of Peru") == backend.search("Capital of Peru?")
+    assert len(server.requests) == 1
+    assert backend.stats["cached"] == 1
+
+
+def test_session_reuses_connections(server):
+    backend = _backend(server, max_connections=2)
+    for i in range(8):
+        backend.search(f"question number {i}")
+    assert len(server.requests) == 8
+    assert len({request["port"] for request in server.requests}) <= 2
+
+
+def test_results_are_trimmed_to_matching_passages(server):
+    backend = _backend(server, max_chars=120)
+    results = backend.search("tallest mountain")
+    assert [result["url"] for result in results] == ["https://example.com/0", "https://example.com/1"]
+    for i, result in enumerate(results):
+        assert len(result["content"]) <= 120
+        assert f"tallest mountain is the answer {i}." in result["content"]